@@ -0,0 +1,180 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import varfile
+import dataset
+import scratch
+
+# Variables whose last time tells how far each phase went.
+PROGRESS = {'train'  : ('train-out', 'Thrust/BMU'),
+            'check'  : ('check-out', 'index'),
+            'predict': ('predict-out', 'index')}
+
+
+def last_time(path):
+    try:
+        return varfile.read_header(path).last_time
+    except (OSError, ValueError):
+        return -1
+
+
+def follow(sandbox, phase, target, period, stall, timeout):
+    """
+    Samples the progress of a phase until target is reached, or until
+    nothing happened for stall seconds. Returns the samples as
+    (elapsed, last time, root-dir bytes) tuples.
+    """
+    path = sandbox.path(*PROGRESS[phase])
+    start = time.time()
+    samples = []
+    last_change = start
+    previous = None
+    while True:
+        now = time.time()
+        t = last_time(path)
+        samples.append((now - start, t, sandbox.disk_usage()))
+        if t != previous:
+            previous, last_change = t, now
+        if t >= target:
+            break
+        if now - last_change > stall:
+            print(f'  {phase}: stalled at time {t}.')
+            break
+        if now - start > timeout:
+            print(f'  {phase}: timeout at time {t}.')
+            break
+        time.sleep(period)
+    return samples
+
+
+def summarize(config, phase, samples, disk_before):
+    elapsed = np.array([s[0] for s in samples])
+    times = np.array([s[1] for s in samples])
+    started = np.flatnonzero(times >= 0)
+    row = dict(config)
+    row.update({'phase': phase, 'timesteps': int(times[-1] + 1), 'duration': float(elapsed[-1]),
+                'timesteps_per_sec': None, 'sec_per_1000': None,
+                'disk_bytes': int(samples[-1][2] - disk_before)})
+    if len(started) > 1 and times[-1] > times[started[0]]:
+        # Measured from the first sample where the phase has started.
+        dt = elapsed[-1] - elapsed[started[0]]
+        rate = (times[-1] - times[started[0]]) / dt if dt > 0 else None
+        if rate:
+            row['timesteps_per_sec'] = float(rate)
+            row['sec_per_1000'] = float(1000 / rate)
+    return row
+
+
+def relaxation_steps(root_dir, weights_at, xsom_params):
+    """
+    The processor does not record the number of relaxation steps, they
+    are estimated by the offline replay of the check relaxation, with the
+    same xsom parameters.
+    """
+    import offline_xsom
+    weights = offline_xsom.load_weights(root_dir, weights_at)
+    error, velocity, thrust = offline_xsom.load_dataset(root_dir)
+    params = dict(p.split('=', 1) for p in xsom_params.split())
+    _, steps = offline_xsom.relax(weights, {'Error': error, 'Velocity': velocity, 'Thrust': thrust},
+                                  **offline_xsom.relax_kwargs(params))
+    return float(steps.mean())
+
+
+def run(config, args, index):
+    directory = os.path.join(args.workdir, f'run-{index:03d}')
+    sandbox = scratch.Scratch(directory, args.port + index, args.skednet_port + index,
+                              config['nb_threads'], config['xsom']).create()
+    variables = {'MAP_SIZE': config['map_size'], 'DATA_SIZE': config['data_size'],
+                 'XSOM_PARAMS': config['xsom_params']}
+    rows = []
+    try:
+        sandbox.launch()
+        sandbox.make('inputs-setup')
+
+        disk = sandbox.disk_usage()
+        sandbox.make('train-setup', SAVE_PERIOD=args.save_period, **variables)
+        sandbox.make('feed-train-inputs', WALLTIME=args.walltime)
+        samples = follow(sandbox, 'train', args.walltime - 1, args.period, args.stall, args.timeout)
+        rows.append(summarize(config, 'train', samples, disk))
+
+        saved = varfile.time_range(sandbox.path('saved', 'Thrust/We-0'))
+        if saved is None:
+            print('  no saved weights, check and predict skipped.')
+            return rows
+        weights_at = saved[1]
+        try:
+            rows[-1]['relaxation_steps'] = relaxation_steps(sandbox.root_dir, weights_at, config['xsom_params'])
+        except Exception as e:
+            print(f'  relaxation steps not estimated ({e}).')
+
+        for phase in ['check', 'predict']:
+            sandbox.make('cxsom-clear-processor')
+            sandbox.launch()
+            disk = sandbox.disk_usage()
+            sandbox.make(phase, WEIGHTS_AT=weights_at, **variables)
+            samples = follow(sandbox, phase, config['data_size'] - 1, args.period, args.stall, args.timeout)
+            rows.append(summarize(config, phase, samples, disk))
+    finally:
+        sandbox.kill()
+        if not args.keep:
+            sandbox.remove()
+    return rows
+
+
+parser = argparse.ArgumentParser(description='Measures train/check/predict throughput of the processor on scratch root-dirs.')
+parser.add_argument('--map-size', type=int, nargs='+', default=[500])
+parser.add_argument('--nb-threads', type=int, nargs='+', default=[int(scratch.read_config('nbthreads'))])
+parser.add_argument('--xsom', nargs='+', default=[os.path.join(scratch.HERE, 'xsom')],
+                    help='xsom binaries to compare')
+parser.add_argument('--xsom-params', nargs='+', default=[''],
+                    help='xsom parameters to compare, one quoted "name=value ..." list each (e.g. "deadline=50" "deadline=200")')
+parser.add_argument('--walltime', type=int, default=3000)
+parser.add_argument('--save-period', type=int, default=1000)
+parser.add_argument('--period', type=float, default=1., help='sampling period (s)')
+parser.add_argument('--stall', type=float, default=60., help='a phase ends after this many seconds without progress')
+parser.add_argument('--timeout', type=float, default=3600., help='maximal duration of a phase (s)')
+parser.add_argument('--workdir', default='bench-runs')
+parser.add_argument('--port', type=int, default=int(scratch.read_config('port')) + 100)
+parser.add_argument('--skednet-port', type=int, default=scratch.read_skednet_port() + 100)
+parser.add_argument('--keep', action='store_true', help='keeps the scratch root-dirs')
+parser.add_argument('--output', default='bench-results', help='writes <output>.json and <output>.csv')
+args = parser.parse_args()
+for xsom_params in args.xsom_params:
+    if any('=' not in p for p in xsom_params.split()):
+        print(f'Error: name=value parameters expected in "{xsom_params}"')
+        sys.exit(1)
+# The sandboxes read the whole data/ dataset, its size is not an axis.
+data_size = dataset.nb_rows()
+
+configs = [{'map_size': m, 'nb_threads': n, 'data_size': data_size, 'xsom': x, 'xsom_params': p}
+           for m, n, x, p in itertools.product(args.map_size, args.nb_threads, args.xsom, args.xsom_params)]
+
+rows = []
+for index, config in enumerate(configs):
+    print(f'[{index + 1}/{len(configs)}] {config}')
+    try:
+        new_rows = run(config, args, index)
+    except Exception as e:
+        print(f'  failed: {e}')
+        continue
+    for row in new_rows:
+        print(f"  {row['phase']:<8} {row['timesteps']:>7} steps  {row['timesteps_per_sec'] or 0:9.2f} steps/s  {row['disk_bytes'] / 2**20:8.1f} MiB")
+    rows += new_rows
+
+report = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'walltime': args.walltime, 'save_period': args.save_period, 'results': rows}
+with open(args.output + '.json', 'w') as f:
+    json.dump(report, f, indent=2)
+fields = ['xsom', 'xsom_params', 'map_size', 'nb_threads', 'data_size', 'phase', 'timesteps', 'duration',
+          'timesteps_per_sec', 'sec_per_1000', 'relaxation_steps', 'disk_bytes']
+with open(args.output + '.csv', 'w', newline='') as f:
+    writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+print(f'Results written in {args.output}.json and {args.output}.csv')
+if not rows:
+    sys.exit(1)
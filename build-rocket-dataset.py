@@ -1,63 +1,71 @@
 import sys
-import os
+import argparse
 import numpy as np
 import pycxsom as cx
+import dataset
+import online
+import waiting
 
-def normalize_minmax(v):
-    """
-    Strict MinMax normalization to [0, 1] range.
-    This ensures compatibility with sigma=0.075 in xsom.cpp.
-    """
-    v_min, v_max = v.min(), v.max()
-    if v_max - v_min == 0:
-        print(f"Warning: constant column detected (min=max={v_min})")
-        return np.zeros_like(v)
-    return (v - v_min) / (v_max - v_min)
-
-if len(sys.argv) < 2:
-    print(f"Usage : {sys.argv[0]} <root-dir>")
-    sys.exit(1)
-
-root_dir = sys.argv[1]
-data_file = "data/rocket-discrete-controller.dat"
+parser = argparse.ArgumentParser(description='Writes the normalized (error, velocity, thrust) samples in the img timeline.')
+parser.add_argument('root_dir')
+parser.add_argument('--data-file', default=dataset.DATA_FILE)
+parser.add_argument('--columns', default='0,1,2',
+                    help='columns of the data file used as error, velocity and thrust (default 0,1,2)')
+parser.add_argument('--seed', type=int, default=None, help='seed of the shuffle')
+parser.add_argument('--rows', action='store_true', help='only prints the number of rows of the data file (the input size)')
+args = parser.parse_args()
 
-if not os.path.exists(data_file):
-    print(f"Error: {data_file} not found.")
+try:
+    indices = [int(c) for c in args.columns.split(',')]
+    if len(indices) != 3 or min(indices) < 0:
+        raise ValueError()
+    columns = dict(zip(['error', 'velocity', 'thrust'], indices))
+except ValueError:
+    print(f'Error: --columns expects 3 comma separated non negative column indices, got "{args.columns}".')
     sys.exit(1)
 
-# Chargement et préparation
-raw_data = np.loadtxt(data_file)
-np.random.shuffle(raw_data)  # Important pour éviter les patterns séquentiels
+# Chargement (mis en cache après le premier parsing) et statistiques
+try:
+    raw_data, info = dataset.load(args.data_file, verbose=not args.rows)
+except (OSError, ValueError) as e:
+    print(f"Error: {e}", file=sys.stderr)
+    sys.exit(1)
+if args.rows:
+    print(info['rows'])
+    sys.exit(0)
+if max(columns.values()) >= info['cols']:
+    print(f"Error: {args.data_file} only has {info['cols']} columns.")
+    sys.exit(1)
+print(f"Data Loaded. Shape: {raw_data.shape}")
 
-# Normalisation stricte MinMax [0, 1]
-errors = normalize_minmax(raw_data[:, 0])
-velocities = normalize_minmax(raw_data[:, 1])
-thrusts = normalize_minmax(raw_data[:, 2])
+# Mélange, important pour éviter les patterns séquentiels
+order = np.random.default_rng(args.seed).permutation(info['rows'])
 
-print(f"Data Loaded. Shape: {raw_data.shape}")
-print(f"Error range after normalization: [{errors.min():.4f}, {errors.max():.4f}]")
-print(f"Velocity range after normalization: [{velocities.min():.4f}, {velocities.max():.4f}]")
-print(f"Thrust range after normalization: [{thrusts.min():.4f}, {thrusts.max():.4f}]")
+# Normalisation stricte MinMax [0, 1], avec les min/max du parsing
+norm_params = dataset.normalization_params(info, columns)
+normalized = {}
+for name, col in columns.items():
+    values = raw_data[order, col]
+    normalized[name] = dataset.normalize(values, norm_params[f'{name}_min'], norm_params[f'{name}_max'])
+    print(f"{name.capitalize()} range after normalization: [{normalized[name].min():.4f}, {normalized[name].max():.4f}]")
 
 # Sauvegarde des paramètres de normalisation pour dénormalisation ultérieure
-norm_params = {
-    'error_min': float(raw_data[:, 0].min()),
-    'error_max': float(raw_data[:, 0].max()),
-    'velocity_min': float(raw_data[:, 1].min()),
-    'velocity_max': float(raw_data[:, 1].max()),
-    'thrust_min': float(raw_data[:, 2].min()),
-    'thrust_max': float(raw_data[:, 2].max())
-}
-np.save('data/normalization_params.npy', norm_params)
-print(f"Normalization parameters saved to data/normalization_params.npy")
-
-# Écriture simple (les fichiers existent déjà grâce au C++)
+norm_params['columns'] = columns
+norm_params['source'] = info['hash']
+dataset.save_normalization(norm_params)
+print(f"Normalization parameters saved to {dataset.NORMALIZATION_FILE}")
+
+# Écriture simple (les fichiers sont créés par le processeur, à la réception des règles)
 def write_var(name, data):
-    path = cx.variable.path_from(root_dir, 'img', name)
+    path = cx.variable.path_from(args.root_dir, 'img', name)
+    waiting.wait_exists([path], timeout=60.)
     with cx.variable.Realize(path) as v:
         v[0] = data
         print(f"Written {name}")
 
-write_var('error_data', errors)
-write_var('velocity_data', velocities)
-write_var('thrust_data', thrusts)
\ No newline at end of file
+write_var('error_data', normalized['error'])
+write_var('velocity_data', normalized['velocity'])
+write_var('thrust_data', normalized['thrust'])
+
+# Le log de base est connu, online.py append refuse de l'ajouter une seconde fois
+online.record_base(args.root_dir, args.data_file, info)
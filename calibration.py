@@ -0,0 +1,151 @@
+"""
+Offline calibration of the matching functions (no processor needed).
+
+The calibration timeline of xsom.cpp computes, for one sigma, the
+match_gaussian curve of a reference value against samples in [0, 1], for
+match_ctx, match_state and match_thrust. Here the curves are computed for
+a whole grid of sigmas and reference values at once, as a
+(sigmas, refs, side) array, and cached in data/cache.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+import dataset
+
+# Matching parameters of xsom.cpp, with their xsom name=value parameter.
+MATCHINGS = {'match_ctx': 'sigma-ctx', 'match_state': 'sigma-state', 'match_thrust': 'sigma-thrust'}
+SIGMA = .075
+SIDE = 100
+SIGMAS = [.025, .05, .075, .1, .15]
+REFS = [.5]
+
+
+def match_gaussian(refs, samples, sigmas):
+    """
+    Same as fx::match_gaussian: exp(-(ref - sample)^2 / (2 sigma^2)), for
+    all the sigmas and refs. Returns a (sigmas, refs, samples) array.
+    """
+    d = np.subtract.outer(np.asarray(refs, dtype=float), np.asarray(samples, dtype=float))
+    s = np.asarray(sigmas, dtype=float)[:, None, None]
+    return np.exp(-d * d / (2 * s * s))
+
+
+def cache_path(sigmas, refs, side, cache_dir=dataset.CACHE_DIR):
+    key = json.dumps({'sigmas': [float(s) for s in sigmas], 'refs': [float(r) for r in refs], 'side': side})
+    return os.path.join(cache_dir, f'calibration-{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz')
+
+
+def curves(sigmas, refs, side=SIDE, cache_dir=dataset.CACHE_DIR):
+    """
+    Returns (samples, curves), curves being match_gaussian(refs, samples,
+    sigmas) for side samples in [0, 1]. The result is cached.
+    """
+    path = cache_path(sigmas, refs, side, cache_dir)
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return cached['samples'], cached['curves']
+    samples = np.linspace(0, 1, side)
+    result = match_gaussian(refs, samples, sigmas)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(path, samples=samples, curves=result)
+    return samples, result
+
+
+def half_width(sigma):
+    """
+    Half width of the curve at half maximum.
+    """
+    return sigma * np.sqrt(2 * np.log(2))
+
+
+def current_sigmas(params):
+    """
+    The sigma of each matching for a list of xsom name=value parameters,
+    applied in order as parse_hyperparams in xsom.cpp does (sigma sets
+    the three of them, a later sigma-ctx overrides it and conversely).
+    """
+    sigmas = {m: SIGMA for m in MATCHINGS}
+    for param in params:
+        name, _, value = param.partition('=')
+        if name == 'sigma':
+            sigmas = {m: float(value) for m in MATCHINGS}
+        elif name in MATCHINGS.values():
+            sigmas[next(m for m, n in MATCHINGS.items() if n == name)] = float(value)
+    return sigmas
+
+
+def export(path, samples, result, sigmas, refs, current):
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump({'samples': samples.tolist(), 'sigmas': list(sigmas), 'refs': list(refs),
+                       'current': current, 'curves': result.tolist()}, f)
+    elif path.endswith('.npz'):
+        np.savez(path, samples=samples, sigmas=sigmas, refs=refs, curves=result)
+    else:
+        # CSV, one column per (sigma, ref).
+        columns = [samples] + [result[i, j] for i in range(len(sigmas)) for j in range(len(refs))]
+        header = ','.join(['sample'] + [f'sigma={s}/ref={r}' for s in sigmas for r in refs])
+        np.savetxt(path, np.column_stack(columns), delimiter=',', header=header, comments='')
+
+
+def show(samples, result, sigmas, refs, current, map_size=None, output=None):
+    import matplotlib
+    if output:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig, axes = plt.subplots(len(MATCHINGS), 1, figsize=(10, 8), sharex=True)
+    colors = plt.cm.viridis(np.linspace(0, .9, len(sigmas)))
+    for ax, m in zip(axes, MATCHINGS):
+        for i, s in enumerate(sigmas):
+            selected = np.isclose(s, current[m])
+            for j in range(len(refs)):
+                ax.plot(samples, result[i, j], color='red' if selected else colors[i],
+                        linewidth=2.5 if selected else 1, label=f'sigma={s}' if j == 0 else None)
+        ax.set_title(f'Matching curves for {m} (current sigma {current[m]})')
+        ax.set_ylim(0, 1.05)
+        ax.legend(loc='upper right', fontsize='small')
+    axes[-1].set_xlabel('Value (0-1)' + (f', {map_size} map positions' if map_size else ''))
+    plt.tight_layout()
+    if output:
+        fig.savefig(output)
+        print(f'{output} written.')
+    else:
+        plt.show()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plots or exports the matching curves for a grid of sigmas and reference values.')
+    parser.add_argument('params', nargs='*', help='xsom name=value parameters (sigma, sigma-ctx, sigma-state, sigma-thrust), highlighted in the plot')
+    parser.add_argument('--sigmas', default=','.join(str(s) for s in SIGMAS), help=f'comma separated (default {",".join(str(s) for s in SIGMAS)})')
+    parser.add_argument('--refs', default=','.join(str(r) for r in REFS), help='comma separated reference values (default .5)')
+    parser.add_argument('--side', type=int, default=SIDE, help=f'number of samples in [0, 1] (default {SIDE})')
+    parser.add_argument('--map-size', type=int, default=None, help='reports the number of map positions within the half width')
+    parser.add_argument('--export', default=None, help='writes the curves in this .csv, .json or .npz file instead of plotting')
+    parser.add_argument('--output', default=None, help='saves the plot in this image file instead of showing it')
+    args = parser.parse_args()
+
+    try:
+        current = current_sigmas(args.params)
+        sigmas = sorted(set(float(s) for s in args.sigmas.split(',')) | set(current.values()))
+        refs = [float(r) for r in args.refs.split(',')]
+    except ValueError as e:
+        print(f'Error: {e}')
+        sys.exit(1)
+
+    samples, result = curves(sigmas, refs, args.side)
+    print(f"{'sigma':>8} {'half width':>11}" + (f" {'positions':>10}" if args.map_size else '') + '  used by')
+    for s in sigmas:
+        used = ', '.join(m for m in MATCHINGS if np.isclose(current[m], s))
+        line = f'{s:8.4f} {half_width(s):11.4f}'
+        if args.map_size:
+            line += f' {2 * half_width(s) * args.map_size:10.1f}'
+        print(f'{line}  {used}')
+
+    if args.export:
+        export(args.export, samples, result, sigmas, refs, current)
+        print(f'{args.export} written.')
+    else:
+        show(samples, result, sigmas, refs, current, args.map_size, args.output)
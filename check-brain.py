@@ -1,5 +1,5 @@
 import sys
-import pycxsom as cx
+import varfile
 import os
 
 if len(sys.argv) < 2:
@@ -14,32 +14,45 @@ print(f"--- ANALYSE DU CERVEAU (Dossier: {root_dir}) ---")
 all_good = True
 max_snapshots = 999999
 
+# Le magasin d'instantanés (make pack-snapshots), s'il existe. snapshots
+# (et numpy) n'est chargé que dans ce cas, la vérification reste rapide.
+store = None
+if os.path.exists(os.path.join(root_dir, 'saved.snap')):
+    import snapshots
+    store = snapshots.Store(snapshots.store_path(root_dir))
+    size_kb = os.path.getsize(store.path) / 1024
+    print(f"📦 {snapshots.STORE_FILE} | Snapshots: {len(store):<4} | Temps: {store.time_range()} | Taille: {size_kb:.1f} Ko")
+
 for m in maps:
     for w in weights:
         # Attention au chemin: saved/MapName/WeightName
         full_name = f"{m}/{w}"
-        path = cx.variable.path_from(root_dir, 'saved', full_name)
+        path = varfile.path_from(root_dir, 'saved', full_name)
         
         # Vérification physique
-        if not os.path.exists(path + '.var'):
+        if not os.path.exists(path):
             print(f"❌ MANQUANT : {full_name}")
             all_good = False
             continue
             
         # Vérification logique
         try:
-            with cx.variable.Realize(path) as v:
-                r = v.time_range()
-                count = r[1]
-                size_kb = os.path.getsize(path + '.var') / 1024
-                
-                status = "✅ OK" if count > 10 else "⚠️ VIDE"
-                if count < 10: all_good = False
-                
-                # On garde le nombre minimal de snapshots commun à tous
-                if count > 0: max_snapshots = min(max_snapshots, count)
-                
-                print(f"{status} | {full_name:<15} | Snapshots: {count:<4} | Taille: {size_kb:.1f} Ko | Type: {v.datatype}")
+            # Seul l'en-tête est lu
+            header = varfile.read_header(path)
+            r = varfile.time_range(path)
+            count = r[1] if r is not None else 0
+            if store is not None and full_name in store.variables and len(store) > 0:
+                # Le magasin garde aussi les instantanés écrasés dans le .var
+                count = max(count, store.time_range()[1])
+            size_kb = os.path.getsize(path) / 1024
+            
+            status = "✅ OK" if count > 10 else "⚠️ VIDE"
+            if count < 10: all_good = False
+            
+            # On garde le nombre minimal de snapshots commun à tous
+            if count > 0: max_snapshots = min(max_snapshots, count)
+            
+            print(f"{status} | {full_name:<15} | Snapshots: {count:<4} | Taille: {size_kb:.1f} Ko | Type: {header.datatype}")
         except Exception as e:
             print(f"❌ ERREUR LECTURE : {full_name} ({e})")
             all_good = False
@@ -48,6 +61,7 @@ print("-" * 40)
 if all_good:
     print(f"Conclusion : CERVEAU SAIN. Vous avez {max_snapshots} instantanés valides.")
     print(f"Recommandation : Utilisez WEIGHTS_AT={max_snapshots - 1}")
+    print("Pour choisir le meilleur instantané : make checkpoint-sweep")
 else:
     print("Conclusion : CERVEAU ENDOMMAGÉ (Fichiers manquants ou vides).")
     print("Action requise : Relancer l'entraînement (Step 4 de la procédure précédente).")
\ No newline at end of file
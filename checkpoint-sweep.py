@@ -0,0 +1,110 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import dataset
+import snapshots
+import offline_xsom
+import tracing
+
+# Set in each worker by init_worker.
+worker = {}
+
+
+def init_worker(root_dir, relax_kwargs, seed):
+    tracing.worker_init()
+    worker['root_dir'] = root_dir
+    worker['kwargs'] = relax_kwargs
+    worker['seed'] = seed
+    worker['data'] = offline_xsom.load_dataset(root_dir)
+
+
+def evaluate(weights_at):
+    start = time.time()
+    weights = offline_xsom.load_weights(worker['root_dir'], weights_at)
+    error, velocity, thrust = worker['data']
+    # Same BMU initialization for all the snapshots, so that they are compared fairly.
+    rng = np.random.default_rng(worker['seed'])
+    result = offline_xsom.evaluate(weights, error, velocity, thrust, rng, **worker['kwargs'])
+    result['weights_at'] = int(weights_at)
+    result['duration'] = time.time() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluates the predicted thrust of all the saved snapshots offline, and picks the best WEIGHTS_AT.')
+    parser.add_argument('root_dir')
+    parser.add_argument('params', nargs='*', help='xsom name=value parameters used for training (the sigmas, beta, delta and deadline matter)')
+    parser.add_argument('--stride', type=int, default=1, help='evaluates one snapshot out of stride')
+    parser.add_argument('--first', type=int, default=None, help='first saved time')
+    parser.add_argument('--last', type=int, default=None, help='last saved time')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='parallel workers (default: number of cores)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the BMU initialization')
+    parser.add_argument('--output', default=None, help='writes <output>.json and <output>.csv')
+    args = parser.parse_args()
+
+    try:
+        params = dict(p.split('=', 1) for p in args.params)
+        kwargs = offline_xsom.relax_kwargs(params)
+    except ValueError:
+        print(f'Bad parameters {args.params}, name=value expected.')
+        sys.exit(1)
+
+    names = [f'{m}/{w}' for m in offline_xsom.MAPS for w in offline_xsom.WEIGHTS]
+    times = snapshots.saved_times(args.root_dir, names)
+    if args.first is not None:
+        times = times[times >= args.first]
+    if args.last is not None:
+        times = times[times <= args.last]
+    times = times[::args.stride]
+    if args.last is None and len(times) > 0:
+        # The last snapshot is always evaluated.
+        times = np.union1d(times, snapshots.saved_times(args.root_dir, names)[-1:])
+    if len(times) == 0:
+        print(f'No saved snapshots to evaluate in {args.root_dir}.')
+        sys.exit(1)
+
+    try:
+        norm = dataset.load_normalization()
+        thrust_range = norm['thrust_max'] - norm['thrust_min']
+    except (OSError, KeyError):
+        thrust_range = None
+
+    print(f'Evaluating {len(times)} snapshot(s) with {args.jobs} worker(s)...')
+    start = time.time()
+    results = []
+    with ProcessPoolExecutor(args.jobs, initializer=init_worker, initargs=(args.root_dir, kwargs, args.seed)) as pool:
+        for result in pool.map(evaluate, times):
+            if thrust_range is not None:
+                result['rmse_thrust'] = result['rmse'] * thrust_range
+                result['max_error_thrust'] = result['max_error'] * thrust_range
+            print(f"  WEIGHTS_AT={result['weights_at']:<6} rmse={result['rmse']:.4f}  max error={result['max_error']:.4f}")
+            results.append(result)
+    elapsed = time.time() - start
+
+    best = min(results, key=lambda r: r['rmse'])
+    print(f'{len(results)} snapshot(s) evaluated in {elapsed:.1f}s.')
+    if thrust_range is not None:
+        print(f"Best: WEIGHTS_AT={best['weights_at']} (rmse {best['rmse']:.4f}, i.e. {best['rmse_thrust']:.3f} thrust units)")
+    else:
+        print(f"Best: WEIGHTS_AT={best['weights_at']} (rmse {best['rmse']:.4f})")
+
+    if args.output:
+        with open(args.output + '.json', 'w') as f:
+            json.dump({'root_dir': args.root_dir, 'params': params, 'seed': args.seed,
+                       'best': best['weights_at'], 'results': results}, f, indent=2)
+        fields = ['weights_at', 'rmse', 'max_error', 'rmse_thrust', 'max_error_thrust', 'duration']
+        with open(args.output + '.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(results)
+        print(f'Results written in {args.output}.json and {args.output}.csv')
+
+
+# The workers re-import this file when processes are spawned.
+if __name__ == '__main__':
+    main()
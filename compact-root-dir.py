@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import varfile
+import waiting
+import scratch
+import snapshots
+
+# Timelines rewritten by make resume (clear-training) before the
+# processor opens them again.
+RESUMED = ['train-rlx']
+
+
+def timelines(root_dir):
+    return sorted(d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d)))
+
+
+def usage(root_dir):
+    sizes = {t: scratch.disk_usage(os.path.join(root_dir, t)) for t in timelines(root_dir)}
+    path = snapshots.store_path(root_dir)
+    if os.path.exists(path):
+        sizes[snapshots.STORE_FILE] = os.path.getsize(path)
+    return sizes
+
+
+def keep_last_gain(path, nb_kept):
+    header = varfile.read_header(path)
+    nb = (os.path.getsize(path) - varfile.HEADER_SIZE) // varfile.record_dtype(header.shape).itemsize
+    return max(0, nb - nb_kept) * varfile.record_dtype(header.shape).itemsize
+
+
+def keep_last(paths, nb_kept, dry_run):
+    freed = 0
+    for p in paths:
+        freed += keep_last_gain(p, nb_kept) if dry_run else varfile.keep_last(p, nb_kept)
+    return freed
+
+
+def recently_modified(root_dir, seconds):
+    now = time.time()
+    for d, _, files in os.walk(root_dir):
+        for f in files:
+            if f.endswith('.var') and now - os.path.getmtime(os.path.join(d, f)) < seconds:
+                return os.path.join(d, f)
+    return None
+
+
+parser = argparse.ArgumentParser(description='Compacts the timelines of a root-dir (the processor has to be stopped).')
+parser.add_argument('root_dir')
+parser.add_argument('--relaxation', type=int, default=None, metavar='N',
+                    help='keeps only the last N timesteps of train-rlx (cleared by make resume, the only way to go on training)')
+parser.add_argument('--outputs-only', action='store_true', help='removes the *-rlx and *-wgt timelines, only the *-out ones (and img, saved...) are kept')
+parser.add_argument('--saved-log', type=int, default=None, metavar='K', help=f'keeps about K logarithmically spaced snapshots in {snapshots.STORE_FILE}')
+parser.add_argument('--dry-run', action='store_true', help='only reports what would be reclaimed')
+parser.add_argument('--force', action='store_true', help='does not check that the processor is stopped')
+args = parser.parse_args()
+
+if not os.path.isdir(args.root_dir):
+    print(f'No root-dir {args.root_dir}.')
+    sys.exit(1)
+if not args.force:
+    # Compaction rewrites the .var files, nothing must be writing them.
+    busy = recently_modified(args.root_dir, 10.)
+    if busy:
+        print(f'{busy} has just been modified, is the processor still running ? (use --force otherwise)')
+        sys.exit(1)
+
+before = usage(args.root_dir)
+freed = {}
+relaxations = [t for t in timelines(args.root_dir) if t.endswith('-rlx')]
+
+if args.outputs_only:
+    for t in relaxations + [t for t in timelines(args.root_dir) if t.endswith('-wgt')]:
+        freed[t] = before[t]
+        if not args.dry_run:
+            shutil.rmtree(os.path.join(args.root_dir, t))
+elif args.relaxation is not None:
+    for t in relaxations:
+        if t not in RESUMED:
+            # check, predict and grid reopen their timelines when their
+            # rules are sent again, a shortened file would be misread.
+            print(f'{t} skipped: the processor reopens it, use make clear-* or --outputs-only instead.')
+            continue
+        freed[t] = keep_last(waiting.timeline_paths(args.root_dir, t), args.relaxation, args.dry_run)
+
+if args.saved_log is not None:
+    # Snapshots are packed first, so that none of them is lost.
+    path = snapshots.store_path(args.root_dir)
+    if not args.dry_run:
+        snapshots.pack(args.root_dir)
+    if os.path.exists(path):
+        store = snapshots.Store(path)
+        times = snapshots.log_times(store.times, args.saved_log)
+        if args.dry_run:
+            freed[snapshots.STORE_FILE] = (len(store) - len(times)) * store.dtype.itemsize
+        else:
+            freed[snapshots.STORE_FILE] = snapshots.thin(path, times)
+        print(f'{snapshots.STORE_FILE}: keeping snapshots {", ".join(str(t) for t in times)}.')
+
+if not freed:
+    print('Nothing to do, give at least one policy (see -h).')
+    sys.exit(0)
+
+after = usage(args.root_dir)
+print(f"{'':<16} {'before':>10} {'reclaimed':>10}")
+for name, size in before.items():
+    print(f'{name:<16} {size / 2**20:9.2f}M {freed.get(name, 0) / 2**20:9.2f}M')
+total = sum(freed.values())
+print(f"{'total':<16} {sum(before.values()) / 2**20:9.2f}M {total / 2**20:9.2f}M"
+      + (' (dry run)' if args.dry_run else f' (now {sum(after.values()) / 2**20:.2f}M)'))
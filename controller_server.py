@@ -0,0 +1,237 @@
+"""
+Inference server for the learned (Error, Velocity) -> Thrust controller.
+
+The saved weights at WEIGHTS_AT are loaded once, and the predictions are
+computed with offline_xsom (no cxsom processor). Concurrent requests are
+coalesced: the pending queries are relaxed together as one batch, which
+costs about the same as a single query.
+
+The protocol is line based, over a Unix socket or TCP on localhost:
+
+    <error> <velocity>        ->  <thrust>          (raw units)
+    stats                     ->  one JSON line (latencies, batch sizes)
+    reload [<weights-at>]     ->  ok <weights-at>   (last snapshot by default)
+
+Reloading swaps the weights between two batches, connections are kept.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import collections
+import numpy as np
+import dataset
+import snapshots
+import offline_xsom
+
+SOCKET_FILE = 'controller.sock'
+MAX_BATCH = 1024
+MAX_WAIT = .002
+LATENCY_WINDOW = 10000
+
+
+class Server:
+    def __init__(self, root_dir, weights_at=None, max_batch=MAX_BATCH, max_wait=MAX_WAIT, seed=None, **relax_kwargs):
+        self.root_dir = root_dir
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.relax_kwargs = relax_kwargs
+        self.rng = np.random.default_rng(seed)
+        self.norm = dataset.load_normalization()
+        self.weights_at, self.weights = self.load(weights_at)
+        self.queue = None
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = collections.Counter()
+        self.nb_requests = 0
+        self.started = time.time()
+
+    def load(self, weights_at=None):
+        if weights_at is None:
+            names = [f'{m}/{w}' for m in offline_xsom.MAPS for w in offline_xsom.WEIGHTS]
+            times = snapshots.saved_times(self.root_dir, names)
+            if len(times) == 0:
+                raise ValueError(f'No saved weights in {self.root_dir}')
+            weights_at = int(times[-1])
+        return weights_at, offline_xsom.load_weights(self.root_dir, weights_at)
+
+    def predict(self, queries):
+        """
+        queries is a (n, 2) array of raw (error, velocity).
+        """
+        n = self.norm
+        error = dataset.normalize(queries[:, 0], n['error_min'], n['error_max'])
+        velocity = dataset.normalize(queries[:, 1], n['velocity_min'], n['velocity_max'])
+        thrust = offline_xsom.predict(self.weights, error, velocity, self.rng, **self.relax_kwargs)
+        return n['thrust_min'] + thrust * (n['thrust_max'] - n['thrust_min'])
+
+    async def batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Requests keep on being queued while the batch is computed.
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            queries = np.array([q for q, _, _ in batch])
+            try:
+                thrust = await loop.run_in_executor(None, self.predict, queries)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                continue
+            now = time.perf_counter()
+            self.batch_sizes[len(batch)] += 1
+            for (_, future, start), value in zip(batch, thrust):
+                self.latencies.append(now - start)
+                if not future.cancelled():
+                    future.set_result(float(value))
+
+    async def thrust(self, error, velocity):
+        future = asyncio.get_running_loop().create_future()
+        self.nb_requests += 1
+        await self.queue.put(((error, velocity), future, time.perf_counter()))
+        return await future
+
+    async def reload(self, weights_at=None):
+        # Loaded aside, then swapped: the running batch keeps the old weights.
+        weights_at, weights = await asyncio.get_running_loop().run_in_executor(None, self.load, weights_at)
+        self.weights_at, self.weights = weights_at, weights
+        print(f'Weights at {weights_at} loaded.', flush=True)
+        return weights_at
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        sizes = np.repeat(list(self.batch_sizes.keys()), list(self.batch_sizes.values()))
+        stats = {'weights_at': self.weights_at, 'requests': self.nb_requests,
+                 'uptime': time.time() - self.started, 'batches': int(len(sizes))}
+        if len(latencies):
+            stats['latency_ms'] = {f'p{p}': float(np.percentile(latencies, p)) for p in (50, 90, 99)}
+            stats['latency_ms']['max'] = float(latencies.max())
+        if len(sizes):
+            stats['batch_size'] = {'mean': float(sizes.mean()), 'p50': float(np.percentile(sizes, 50)),
+                                   'max': int(sizes.max())}
+        return stats
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode().split()
+                if not words:
+                    continue
+                try:
+                    if words[0] == 'stats':
+                        answer = json.dumps(self.stats())
+                    elif words[0] == 'reload':
+                        answer = f'ok {await self.reload(int(words[1]) if len(words) > 1 else None)}'
+                    else:
+                        answer = repr(await self.thrust(float(words[0]), float(words[1])))
+                except (ValueError, IndexError, KeyError, OSError) as e:
+                    answer = f'error {e}'
+                writer.write(answer.encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, unix=None, port=None):
+        self.queue = asyncio.Queue()
+        batcher = asyncio.create_task(self.batcher())
+        if port is not None:
+            server = await asyncio.start_server(self.handle, '127.0.0.1', port)
+            address = f'127.0.0.1:{port}'
+        else:
+            if os.path.exists(unix):
+                os.remove(unix)
+            server = await asyncio.start_unix_server(self.handle, unix)
+            address = unix
+        loop = asyncio.get_running_loop()
+        serving = asyncio.ensure_future(server.serve_forever())
+        try:
+            loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.reload()))
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, serving.cancel)
+        except (NotImplementedError, AttributeError):
+            pass
+        print(f'Serving weights at {self.weights_at} on {address}.', flush=True)
+        try:
+            async with server:
+                await serving
+        except asyncio.CancelledError:
+            print('Stopped.', flush=True)
+        finally:
+            batcher.cancel()
+            if port is None and os.path.exists(unix):
+                os.remove(unix)
+
+
+class Client:
+    """
+    Blocking client, e.g. Client('controller.sock').thrust(error, velocity).
+    address is a Unix socket path or a TCP port on localhost.
+    """
+    def __init__(self, address=SOCKET_FILE):
+        if isinstance(address, int):
+            self.sock = socket.create_connection(('127.0.0.1', address))
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(address)
+        self.file = self.sock.makefile('rwb')
+
+    def request(self, line):
+        self.file.write(line.encode() + b'\n')
+        self.file.flush()
+        answer = self.file.readline().decode().strip()
+        if answer.startswith('error'):
+            raise ValueError(answer)
+        return answer
+
+    def thrust(self, error, velocity):
+        return float(self.request(f'{error!r} {velocity!r}'))
+
+    def stats(self):
+        return json.loads(self.request('stats'))
+
+    def reload(self, weights_at=None):
+        return int(self.request('reload' + ('' if weights_at is None else f' {weights_at}')).split()[1])
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves the thrust predicted from saved weights, with micro-batching.')
+    parser.add_argument('root_dir')
+    parser.add_argument('params', nargs='*', help='xsom name=value parameters used for training (the sigmas, beta, delta and deadline matter)')
+    parser.add_argument('--weights-at', type=int, default=None, help='saved weights to use (default: the last ones)')
+    parser.add_argument('--unix', default=SOCKET_FILE, help=f'Unix socket path (default {SOCKET_FILE})')
+    parser.add_argument('--port', type=int, default=None, help='serves on this localhost TCP port instead of a Unix socket')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT, help=f'seconds waited for filling a batch (default {MAX_WAIT})')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        kwargs = offline_xsom.relax_kwargs(dict(p.split('=', 1) for p in args.params))
+        server = Server(args.root_dir, args.weights_at, args.max_batch, args.max_wait, args.seed, **kwargs)
+    except (ValueError, KeyError, OSError) as e:
+        print(f'Error: {e}')
+        sys.exit(1)
+    asyncio.run(server.serve(args.unix, args.port))
@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+import varfile
+import waiting
+import snapshots
+import offline_xsom
+
+# External inputs of the maps, as loaded by offline_xsom.load_dataset.
+INPUTS = {'Error': 0, 'Velocity': 1, 'Thrust': 2}
+
+
+def measure(weights, previous, data):
+    """
+    Returns the weight delta with the previous snapshot (mean absolute
+    change, the largest one of all the weights) and the quantization
+    error of each map on its img data.
+    """
+    metrics = {'delta': None, 'qe': {}}
+    if previous is not None:
+        deltas = [float(np.mean(np.abs(weights[m][w] - previous[m][w])))
+                  for m in offline_xsom.MAPS for w in offline_xsom.WEIGHTS]
+        metrics['delta'] = max(deltas)
+    for m, col in INPUTS.items():
+        metrics['qe'][m] = offline_xsom.quantization_error(weights[m]['We-0'], data[col])
+    metrics['qe_mean'] = float(np.mean(list(metrics['qe'].values())))
+    return metrics
+
+
+def is_stable(history, args):
+    """
+    Stable when, for the last patience snapshots, the weights moved less
+    than the delta threshold and the quantization error did not improve
+    by more than qe_tolerance (relative).
+    """
+    if len(history) < max(args.min_snapshots, args.patience + 1):
+        return False
+    for previous, current in zip(history[-args.patience - 1:-1], history[-args.patience:]):
+        if current['delta'] is None or current['delta'] > args.delta:
+            return False
+        if previous['qe_mean'] - current['qe_mean'] > args.qe_tolerance * previous['qe_mean']:
+            return False
+    return True
+
+
+def stop_training(root_dir):
+    """
+    Stops the train-in walltime feed at the current time. Returns the
+    new walltime.
+    """
+    index = varfile.path_from(root_dir, 'train-in', 'index')
+    walltime = varfile.read_header(index).last_time + 1
+    subprocess.run(['make', '--quiet', 'feed-train-inputs', f'WALLTIME={walltime}'], check=True)
+    return walltime
+
+
+parser = argparse.ArgumentParser(description='Follows the saved weights while training runs, and stops training when the maps do not move anymore.')
+parser.add_argument('root_dir')
+parser.add_argument('--delta', type=float, default=1e-3, help='maximal mean absolute weight change between snapshots (default 1e-3)')
+parser.add_argument('--qe-tolerance', type=float, default=.01, help='maximal relative decrease of the quantization error between snapshots (default .01)')
+parser.add_argument('--patience', type=int, default=3, help='number of successive stable snapshots required (default 3)')
+parser.add_argument('--min-snapshots', type=int, default=5, help='never stops before this many snapshots (default 5)')
+parser.add_argument('--idle', type=float, default=600., help='gives up after this many seconds without a new snapshot (default 600)')
+parser.add_argument('--dry-run', action='store_true', help='reports the decision but does not stop training')
+parser.add_argument('--report', default=None, help='writes the metrics and the decision in this JSON file')
+args = parser.parse_args()
+
+names = [f'{m}/{w}' for m in offline_xsom.MAPS for w in offline_xsom.WEIGHTS]
+data = offline_xsom.load_dataset(args.root_dir)
+saved_dirs = [os.path.join(args.root_dir, 'saved', m) for m in offline_xsom.MAPS]
+
+history = []
+previous = None
+decision = None
+last_change = time.time()
+print(f"{'saved':>6} {'delta':>10} " + ' '.join(f'{"qe " + m:>12}' for m in INPUTS))
+try:
+    with waiting.Watcher(saved_dirs) as watcher:
+        while decision is None:
+            times = [] if not all(os.path.exists(d) for d in saved_dirs) else snapshots.saved_times(args.root_dir, names)
+            done = history[-1]['at'] if history else -1
+            for at in (t for t in times if t > done):
+                weights = offline_xsom.load_weights(args.root_dir, at)
+                metrics = measure(weights, previous, data)
+                metrics['at'] = int(at)
+                history.append(metrics)
+                previous = weights
+                last_change = time.time()
+                delta = f"{metrics['delta']:10.2e}" if metrics['delta'] is not None else f"{'-':>10}"
+                print(f'{at:>6} {delta} ' + ' '.join(f'{metrics["qe"][m]:12.5f}' for m in INPUTS), flush=True)
+                if is_stable(history, args):
+                    decision = {'stop': True, 'at': int(at),
+                                'reason': f'delta <= {args.delta} and qe improvement <= {args.qe_tolerance:.1%} for {args.patience} snapshots'}
+                    break
+            if decision is None and time.time() - last_change > args.idle:
+                decision = {'stop': False, 'at': history[-1]['at'] if history else None,
+                            'reason': f'no new snapshot for {args.idle:.0f}s (training over?)'}
+            if decision is None:
+                watcher.wait(waiting.MAX_SLEEP)
+except KeyboardInterrupt:
+    decision = {'stop': False, 'at': history[-1]['at'] if history else None, 'reason': 'interrupted'}
+
+print(f"Decision: {'stop' if decision['stop'] else 'continue'} at saved time {decision['at']} ({decision['reason']}).")
+if decision['stop'] and not args.dry_run:
+    decision['walltime'] = stop_training(args.root_dir)
+    print(f"Training stopped, walltime set to {decision['walltime']}. Use WEIGHTS_AT={decision['at']}.")
+    # Checkpoint: the snapshots are packed in the store.
+    store, _ = snapshots.pack(args.root_dir)
+    print(f'Snapshots up to {store.time_range()[1]} packed in {store.path}.')
+
+if args.report:
+    with open(args.report, 'w') as f:
+        json.dump({'criteria': {'delta': args.delta, 'qe_tolerance': args.qe_tolerance, 'patience': args.patience,
+                                'min_snapshots': args.min_snapshots},
+                   'decision': decision, 'snapshots': history}, f, indent=2)
+    print(f'Report written in {args.report}.')
+if decision['stop'] is False and decision['reason'] == 'interrupted':
+    sys.exit(1)
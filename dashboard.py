@@ -0,0 +1,191 @@
+import os
+import sys
+import csv
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import varfile
+import waiting
+import scratch
+import snapshots
+import offline_xsom
+
+
+def scan(root_dir, timeline):
+    """
+    Returns (lowest, highest) last time of the variables of a timeline
+    (None if no variable has a value yet), and the disk usage.
+    """
+    times = []
+    for path in waiting.timeline_paths(root_dir, timeline):
+        try:
+            t = varfile.read_header(path).last_time
+        except (OSError, ValueError):
+            continue
+        if t >= 0:
+            times.append(t)
+    size = scratch.disk_usage(os.path.join(root_dir, timeline))
+    if not times:
+        return None, size
+    return (min(times), max(times)), size
+
+
+def data_size(root_dir):
+    try:
+        return varfile.read_header(varfile.path_from(root_dir, 'img', 'error_data')).shape[0]
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def format_duration(seconds):
+    if seconds is None or not np.isfinite(seconds):
+        return '-'
+    seconds = int(seconds)
+    return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s'
+
+
+class Relaxation(threading.Thread):
+    """
+    The processor does not record the relaxation steps, they are
+    estimated in the background by the offline replay of the check
+    relaxation, on a subset of the samples, with the last saved weights.
+    relax_kwargs are the relaxation parameters (see offline_xsom.relax_kwargs).
+    """
+    def __init__(self, root_dir, relax_kwargs, nb_samples=500, refresh=60.):
+        super().__init__(daemon=True)
+        self.root_dir = root_dir
+        self.relax_kwargs = relax_kwargs
+        self.nb_samples = nb_samples
+        self.refresh = refresh
+        self.steps = None
+        self.at = None
+
+    def run(self):
+        names = [f'{m}/{w}' for m in offline_xsom.MAPS for w in offline_xsom.WEIGHTS]
+        while True:
+            try:
+                times = snapshots.saved_times(self.root_dir, names)
+                if len(times) and times[-1] != self.at:
+                    weights = offline_xsom.load_weights(self.root_dir, times[-1])
+                    data = offline_xsom.load_dataset(self.root_dir)
+                    rng = np.random.default_rng(0)
+                    rows = rng.choice(len(data[0]), min(self.nb_samples, len(data[0])), replace=False)
+                    inputs = dict(zip(offline_xsom.MAPS, (d[rows] for d in data)))
+                    _, steps = offline_xsom.relax(weights, inputs, rng, **self.relax_kwargs)
+                    self.steps, self.at = float(steps.mean()), int(times[-1])
+            except (OSError, ValueError, KeyError):
+                pass
+            time.sleep(self.refresh)
+
+
+parser = argparse.ArgumentParser(description='Live progress of the processor: timesteps/sec, ETA, disk growth and stalls of every timeline.')
+parser.add_argument('root_dir')
+parser.add_argument('params', nargs='*', help='xsom name=value parameters used for training (the sigmas, beta, delta and deadline matter)')
+parser.add_argument('--walltime', type=int, default=None, help='walltime fed for training, for the ETA of the train-* timelines')
+parser.add_argument('--period', type=float, default=2., help='sampling period (s)')
+parser.add_argument('--stall', type=float, default=60., help='a timeline is stalled after this many seconds without progress')
+parser.add_argument('--metrics', default=None, help='appends the samples to this CSV file')
+parser.add_argument('--no-relaxation', action='store_true', help='does not estimate the relaxation steps')
+parser.add_argument('--once', action='store_true', help='prints one sample and exits')
+args = parser.parse_args()
+
+if not os.path.isdir(args.root_dir):
+    print(f'No root-dir {args.root_dir}.')
+    sys.exit(1)
+
+try:
+    relax_kwargs = offline_xsom.relax_kwargs(dict(p.split('=', 1) for p in args.params))
+except ValueError:
+    print(f'Bad parameters {args.params}, name=value expected.')
+    sys.exit(1)
+
+relaxation = None
+if not args.no_relaxation and not args.once:
+    relaxation = Relaxation(args.root_dir, relax_kwargs)
+    relaxation.start()
+
+interactive = sys.stdout.isatty() and not args.once
+metrics = None
+if args.metrics:
+    new = not os.path.exists(args.metrics)
+    metrics_file = open(args.metrics, 'a', newline='')
+    metrics = csv.writer(metrics_file)
+    if new:
+        metrics.writerow(['date', 'timeline', 'first_last_time', 'last_time', 'timesteps_per_sec', 'disk_bytes', 'stalled'])
+
+previous = {}
+moving = set()
+rates = {}
+last_change = {}
+start = time.time()
+pool = ThreadPoolExecutor(max_workers=8)
+try:
+    while True:
+        now = time.time()
+        timelines = sorted(d for d in os.listdir(args.root_dir) if os.path.isdir(os.path.join(args.root_dir, d)))
+        scans = dict(zip(timelines, pool.map(lambda t: scan(args.root_dir, t), timelines)))
+        size = data_size(args.root_dir)
+        lines = [f'{args.root_dir}  {time.strftime("%H:%M:%S")}  (up {format_duration(now - start)})', '',
+                 f"{'timeline':<14} {'time':>14} {'steps/s':>9} {'ETA':>11} {'disk':>9} {'MiB/min':>8}"]
+        total_disk, total_growth = 0, 0.
+        for t, (times, disk) in scans.items():
+            last = times[1] if times else -1
+            if t not in previous:
+                previous[t] = (now, last, disk)
+                last_change[t] = now
+            p_now, p_last, p_disk = previous[t]
+            dt = now - p_now
+            if last != p_last:
+                last_change[t] = now
+                moving.add(t)
+            if dt > 0 and p_last >= 0:
+                rate = (last - p_last) / dt
+                # Smoothed, since the processor works by bursts.
+                rates[t] = rate if t not in rates else .7 * rates[t] + .3 * rate
+            growth = (disk - p_disk) / dt * 60 if dt > 0 else 0.
+            previous[t] = (now, last, disk)
+            total_disk += disk
+            total_growth += growth
+
+            target = None
+            if t.startswith('train-') and args.walltime:
+                target = args.walltime - 1
+            elif t.split('-')[0] in ('check', 'predict') and size:
+                target = size - 1
+            rate = rates.get(t)
+            eta = None
+            if target is not None and rate:
+                eta = max(0, target - last) / rate
+            done = target is not None and last >= target
+            # Timelines that never moved (img, saved once trained...) are not stalled.
+            stalled = (t in moving or target is not None) and not done and now - last_change[t] > args.stall
+            status = 'done' if done else ('STALLED' if stalled else '')
+            time_col = f'{last}' + (f'/{target + 1}' if target is not None else '') if times else '-'
+            lines.append(f'{t:<14} {time_col:>14} {rate or 0:9.1f} {format_duration(eta) if not done else "":>11} '
+                         f'{disk / 2**20:8.1f}M {growth / 2**20:8.2f} {status}')
+            if metrics:
+                metrics.writerow([time.strftime('%Y-%m-%d %H:%M:%S'), t, times[0] if times else '', last,
+                                  rates.get(t, ''), disk, int(stalled)])
+        lines.append('')
+        lines.append(f"{'total':<14} {'':>14} {'':>9} {'':>11} {total_disk / 2**20:8.1f}M {total_growth / 2**20:8.2f}")
+        if relaxation is not None and relaxation.steps is not None:
+            lines.append(f'Relaxation: {relaxation.steps:.1f} steps per sample (offline estimate, saved weights at {relaxation.at})')
+        if metrics:
+            metrics_file.flush()
+
+        if interactive:
+            # Redraws in place.
+            print('\x1b[H\x1b[J' + '\n'.join(lines), flush=True)
+        else:
+            print('\n'.join(lines) + '\n', flush=True)
+        if args.once:
+            break
+        time.sleep(max(0., args.period - (time.time() - now)))
+except KeyboardInterrupt:
+    pass
+finally:
+    pool.shutdown()
+    if metrics:
+        metrics_file.close()
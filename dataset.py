@@ -0,0 +1,127 @@
+"""
+Streaming, cached ingestion of the flight logs.
+
+A text log (one sample per line, whitespace separated columns) is parsed
+chunk by chunk into a raw float64 binary file, and the min/max of every
+column are computed during the same pass. The binary file and its
+metadata (shape, statistics) are stored in data/cache/, named after the
+hash of the log content, so that the parsing only happens once for a
+given log. The cached data is then accessed through a memmap.
+
+The normalization parameters are stored as plain JSON.
+"""
+import os
+import json
+import hashlib
+import itertools
+import numpy as np
+
+DATA_FILE = 'data/rocket-discrete-controller.dat'
+CACHE_DIR = 'data/cache'
+NORMALIZATION_FILE = 'data/normalization_params.json'
+LEGACY_NORMALIZATION_FILE = 'data/normalization_params.npy'
+CHUNK_ROWS = 100000
+
+# Default columns of the log used as error, velocity and thrust.
+COLUMNS = {'error': 0, 'velocity': 1, 'thrust': 2}
+
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _parse(path, raw_path, chunk_rows):
+    nb_rows, nb_cols = 0, None
+    mins, maxs = None, None
+    with open(path) as f, open(raw_path, 'wb') as out:
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                break
+            lines = [l for l in lines if l.strip() and not l.lstrip().startswith('#')]
+            if not lines:
+                continue
+            if nb_cols is None:
+                nb_cols = len(lines[0].split())
+            chunk = np.array(' '.join(lines).split(), dtype='<f8')
+            if len(chunk) % nb_cols != 0:
+                raise ValueError(f'{path}: lines do not all have {nb_cols} columns')
+            chunk = chunk.reshape(-1, nb_cols)
+            out.write(chunk.tobytes())
+            nb_rows += len(chunk)
+            cmin, cmax = chunk.min(axis=0), chunk.max(axis=0)
+            mins = cmin if mins is None else np.minimum(mins, cmin)
+            maxs = cmax if maxs is None else np.maximum(maxs, cmax)
+    if nb_rows == 0:
+        raise ValueError(f'{path}: no data')
+    return {'rows': nb_rows, 'cols': nb_cols, 'min': mins.tolist(), 'max': maxs.tolist()}
+
+
+def load(path=DATA_FILE, cache_dir=CACHE_DIR, chunk_rows=CHUNK_ROWS, verbose=True):
+    """
+    Returns (data, info), data being a read-only (rows, cols) memmap and
+    info the metadata ('rows', 'cols', 'min', 'max' per column, 'hash').
+    """
+    digest = file_hash(path)
+    raw_path = os.path.join(cache_dir, digest + '.f64')
+    info_path = os.path.join(cache_dir, digest + '.json')
+    if not (os.path.exists(raw_path) and os.path.exists(info_path)):
+        if verbose:
+            print(f'Parsing {path} into {raw_path}...')
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = raw_path + '.tmp'
+        info = _parse(path, tmp, chunk_rows)
+        info['hash'] = digest
+        info['source'] = path
+        os.replace(tmp, raw_path)
+        with open(info_path, 'w') as f:
+            json.dump(info, f, indent=2)
+    elif verbose:
+        print(f'Using cached {raw_path}.')
+    with open(info_path) as f:
+        info = json.load(f)
+    data = np.memmap(raw_path, dtype='<f8', mode='r', shape=(info['rows'], info['cols']))
+    return data, info
+
+
+def nb_rows(path=DATA_FILE):
+    """
+    Number of samples of a data file, i.e. the input size of xsom.
+    """
+    return load(path, verbose=False)[1]['rows']
+
+
+def normalization_params(info, columns=COLUMNS):
+    params = {}
+    for name, col in columns.items():
+        params[f'{name}_min'] = info['min'][col]
+        params[f'{name}_max'] = info['max'][col]
+    return params
+
+
+def save_normalization(params, path=NORMALIZATION_FILE):
+    with open(path, 'w') as f:
+        json.dump(params, f, indent=2)
+        f.write('\n')
+
+
+def load_normalization(path=NORMALIZATION_FILE):
+    if not os.path.exists(path) and os.path.exists(LEGACY_NORMALIZATION_FILE):
+        # Experiments prepared before the JSON format.
+        return np.load(LEGACY_NORMALIZATION_FILE, allow_pickle=True).item()
+    with open(path) as f:
+        return json.load(f)
+
+
+def normalize(values, vmin, vmax):
+    """
+    Strict MinMax normalization to [0, 1] range.
+    """
+    if vmax - vmin == 0:
+        print(f"Warning: constant column detected (min=max={vmin})")
+        return np.zeros(len(values))
+    return (np.asarray(values) - vmin) / (vmax - vmin)
@@ -0,0 +1,72 @@
+"""
+Density-binned rendering of large 2D point sets.
+
+Instead of drawing every point, the points are aggregated on a fixed
+bins x bins grid: the count of points per bin, and the mean of any
+value attached to the points (thrust, prediction error...). The grid is
+filled in chunks with np.bincount, so memory and drawing costs do not
+depend on the number of points, and no point is dropped.
+"""
+import numpy as np
+import tracing
+
+BINS = 200
+CHUNK = 1 << 20
+
+
+def auto_bins(nb_points, max_bins=BINS):
+    """
+    About one point per bin for small sets, max_bins x max_bins beyond.
+    """
+    return int(np.clip(np.sqrt(nb_points), 16, max_bins))
+
+
+class Density:
+    """
+    d = Density(); d.add(x, y, thrust=t) (as many times as needed), then
+    d.count and d.mean('thrust') are (bins, bins) arrays, indexed by
+    [x bin, y bin]. Points out of the extent are clipped to the border bins.
+    """
+    def __init__(self, bins=BINS, extent=(0, 1, 0, 1)):
+        self.bins = bins
+        self.extent = extent
+        self.count = np.zeros((bins, bins))
+        self.sums = {}
+
+    def _bins(self, values, low, high):
+        b = ((np.asarray(values, dtype=float) - low) * (self.bins / (high - low))).astype(int)
+        return np.clip(b, 0, self.bins - 1)
+
+    @tracing.traced('bin')
+    def add(self, x, y, chunk=CHUNK, **values):
+        x0, x1, y0, y1 = self.extent
+        size = self.bins * self.bins
+        for start in range(0, len(x), chunk):
+            end = start + chunk
+            flat = self._bins(x[start:end], x0, x1) * self.bins + self._bins(y[start:end], y0, y1)
+            self.count += np.bincount(flat, minlength=size).reshape(self.bins, self.bins)
+            for name, v in values.items():
+                s = np.bincount(flat, weights=np.asarray(v[start:end], dtype=float), minlength=size)
+                self.sums[name] = self.sums.get(name, 0) + s.reshape(self.bins, self.bins)
+        return self
+
+    def mean(self, name):
+        """
+        Mean of the values per bin, nan for the empty bins.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, self.sums[name] / self.count, np.nan)
+
+
+def draw(ax, grid, extent=(0, 1, 0, 1), log=False, **kwargs):
+    """
+    Draws a (bins, bins) grid indexed by [x bin, y bin] as an image, empty
+    (nan) bins being transparent. With log, grid is a count drawn in log
+    scale. Returns the image, for colorbars.
+    """
+    if log:
+        from matplotlib.colors import LogNorm
+        grid = np.where(grid > 0, grid, np.nan)
+        kwargs.setdefault('norm', LogNorm())
+    return ax.imshow(np.ma.masked_invalid(grid).T, origin='lower', extent=extent,
+                     aspect='auto', interpolation='nearest', **kwargs)
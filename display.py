@@ -1,24 +1,17 @@
 import sys
-import pycxsom as cx
+import re
 import numpy as np
+import varfile
 import matplotlib.pyplot as plt
 
 
 def get_weight_history(varpath):
-    with cx.variable.Realize(varpath) as v:
-        if not isinstance(v.datatype, cx.typing.Map1D):
-            raise ValueError(f'Bad type for {varpath}: {v.datatype}')
-        side = v.datatype.side
-        if isinstance(v.datatype.content, cx.typing.Pos1D):
-            depth = 1
-        elif isinstance(v.datatype.content, cx.typing.Array) and v.datatype.content.dim == 3:
-            depth = 3
-        else:
-            raise ValueError(f'Bad type for {varpath}: {v.datatype}')
+    header = varfile.read_header(varpath)
+    if not re.fullmatch(r'Map1D<(Pos1D|Array=3)>=\d+', header.datatype):
+        raise ValueError(f'Bad type for {varpath}: {header.datatype}')
     print(f'Reading history of {varpath}.')
-    if depth == 1:
-        return np.fromiter((value for _, value in cx.variable.data_range_full(varpath)), (float, side))
-    return np.fromiter((value for _, value in cx.variable.data_range_full(varpath)), dtype=(float, (side, 3)))
+    _, history = varfile.read_history(varpath)
+    return history
 
 def weight_history(ax, data, mapname, weight_kind, weight_rank, show_xticks, show_yticks):
     if weight_kind == 'c':
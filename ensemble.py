@@ -0,0 +1,271 @@
+"""
+Ensembles of independent trainings of the three maps.
+
+A training depends a lot on its random initial weights and on the
+random BMUs of the relaxation. train runs K independent trainings at
+the same time, each one on its own scratch processor pinned to its own
+core(s). The rules cannot seed the processor: every run draws its own
+random numbers and is not reproducible (params.json records it). Every
+prune-every snapshots, the last snapshot of each run is evaluated
+offline and the runs whose prediction error lags behind the best one
+(by more than the margin) are stopped, which frees their cores. The
+saved weights of the survivors are kept in <output>/k<K>/run-*/. With
+several values of K, the wall time of each ensemble tells how the
+trainings scale with the number of runs.
+
+evaluate combines the thrust predicted by the members (mean or median)
+and compares the ensemble with each of its members.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import varfile
+import offline_xsom
+
+COMBINE = {'mean': np.mean, 'median': np.median}
+
+
+def pinned_cores(nb_runs, nb_threads):
+    """
+    Cores of each run, the runs being spread over the available cores
+    (they share cores when there are more threads than cores).
+    """
+    available = sorted(os.sched_getaffinity(0))
+    return [{available[(i * nb_threads + j) % len(available)] for j in range(nb_threads)} for i in range(nb_runs)]
+
+
+def saved_path(root_dir):
+    return varfile.path_from(root_dir, 'saved', 'Thrust/We-0')
+
+
+class Run:
+    def __init__(self, index, sandbox):
+        self.index = index
+        self.name = f'run-{index:02d}'
+        self.sandbox = sandbox
+        self.alive = True
+        self.scores = {}
+        self.duration = None
+
+    def score(self, at, data, kwargs):
+        weights = offline_xsom.load_weights(self.sandbox.root_dir, at)
+        error, velocity, thrust = data
+        # Same random BMUs for all the runs, only the weights differ.
+        result = offline_xsom.evaluate(weights, error, velocity, thrust, np.random.default_rng(0), **kwargs)
+        self.scores[at] = result['rmse']
+        return result['rmse']
+
+
+def prune(runs, at, margin, keep):
+    """
+    Returns the runs to be stopped at snapshot at: those whose rmse is
+    more than (1 + margin) times the best one, the keep best ones being
+    always kept.
+    """
+    ranked = sorted(runs, key=lambda r: r.scores[at])
+    best = ranked[0].scores[at]
+    return [r for r in ranked[keep:] if r.scores[at] > best * (1 + margin)]
+
+
+def train(nb_runs, args):
+    """
+    Trains nb_runs runs concurrently, with pruning. Returns the report.
+    """
+    import scratch
+    import waiting
+    params = dict(p.split('=', 1) for p in args.params)
+    kwargs = offline_xsom.relax_kwargs(params)
+    directory = os.path.join(args.output, f'k{nb_runs}')
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    cores = pinned_cores(nb_runs, args.nb_threads)
+    runs = []
+    try:
+        for i in range(nb_runs):
+            sandbox = scratch.Scratch(os.path.join(args.workdir, f'k{nb_runs}-run-{i:02d}'), args.port + i,
+                                      args.skednet_port + i, args.nb_threads, cpus=cores[i]).create()
+            runs.append(Run(i, sandbox))
+            sandbox.launch()
+            sandbox.make('inputs-setup')
+            sandbox.make('train-setup', SAVE_PERIOD=args.save_period, DATA_SIZE=args.data_size,
+                         MAP_SIZE=args.map_size, XSOM_PARAMS=' '.join(args.params))
+        print(f'k={nb_runs}: {nb_runs} runs on cores {", ".join(",".join(map(str, sorted(c))) for c in cores)}')
+        start = time.time()
+        for run in runs:
+            run.sandbox.make('feed-train-inputs', WALLTIME=args.walltime)
+        data = offline_xsom.load_dataset(runs[0].sandbox.root_dir)
+
+        last = (args.walltime - 1) // args.save_period
+        checkpoints = list(range(args.prune_every, last, args.prune_every)) if not args.no_prune else []
+        for at in checkpoints:
+            alive = [r for r in runs if r.alive]
+            if len(alive) <= args.keep:
+                break
+            waiting.wait_time([saved_path(r.sandbox.root_dir) for r in alive], at, timeout=args.timeout)
+            for run in alive:
+                run.score(at, data, kwargs)
+            stopped = prune(alive, at, args.margin, args.keep)
+            for run in stopped:
+                run.sandbox.kill()
+                run.alive = False
+                run.duration = time.time() - start
+            scores = '  '.join(f'{r.name}={r.scores[at]:.4f}{"(x)" if not r.alive else ""}' for r in alive)
+            print(f'  saved {at:>3}: {scores}')
+
+        for run in runs:
+            if not run.alive:
+                continue
+            waiting.wait_time([run.sandbox.path('train-out', 'Thrust/BMU')], args.walltime - 1, timeout=args.timeout)
+            waiting.wait_stable(waiting.timeline_paths(run.sandbox.root_dir, 'saved'), timeout=args.timeout)
+            run.duration = time.time() - start
+        wall_time = time.time() - start
+
+        members = []
+        for run in runs:
+            if not run.alive:
+                continue
+            weights_at = varfile.time_range(saved_path(run.sandbox.root_dir))[1]
+            rmse = run.score(weights_at, data, kwargs)
+            destination = os.path.join(directory, run.name)
+            shutil.copytree(os.path.join(run.sandbox.root_dir, 'saved'), os.path.join(destination, 'saved'))
+            member = {'name': run.name, 'weights_at': weights_at, 'rmse': rmse, 'cores': sorted(cores[run.index]),
+                      'params': params, 'map_size': args.map_size, 'seeded': False}
+            with open(os.path.join(destination, 'params.json'), 'w') as f:
+                json.dump(member, f, indent=2)
+            members.append(member)
+    finally:
+        for run in runs:
+            run.sandbox.kill()
+            if not args.keep_runs:
+                run.sandbox.remove()
+
+    steps = sum(args.walltime if r.alive else max(r.scores, default=0) * args.save_period for r in runs)
+    report = {'nb_runs': nb_runs, 'wall_time': wall_time, 'survivors': len(members), 'training_steps': steps,
+              'steps_per_sec': steps / wall_time if wall_time > 0 else None,
+              'runs': [{'name': r.name, 'alive': r.alive, 'duration': r.duration, 'scores': r.scores} for r in runs],
+              'members': members}
+    with open(os.path.join(directory, 'ensemble.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def load_members(directory):
+    """
+    Returns [(name, weights)] for the members saved in directory.
+    """
+    members = []
+    for path in sorted(glob.glob(os.path.join(directory, 'run-*', 'params.json'))):
+        with open(path) as f:
+            member = json.load(f)
+        members.append((member['name'], offline_xsom.load_weights(os.path.dirname(path), member['weights_at'])))
+    if not members:
+        raise ValueError(f'No members in {directory}')
+    return members
+
+
+def member_predictions(members, error, velocity, rng=None, **kwargs):
+    """
+    Returns the (members, samples) predicted thrusts.
+    """
+    return np.array([offline_xsom.predict(weights, error, velocity, rng, **kwargs) for _, weights in members])
+
+
+def predict(members, error, velocity, combine='mean', rng=None, **kwargs):
+    """
+    Mean or median of the thrusts predicted by the members.
+    """
+    return COMBINE[combine](member_predictions(members, error, velocity, rng, **kwargs), axis=0)
+
+
+def rmse(pred, target):
+    return float(np.sqrt(np.mean((pred - target) ** 2)))
+
+
+def print_scaling(reports):
+    base = next((r for r in reports if r['nb_runs'] == 1), None)
+    print(f'{"K":>4} {"wall time (s)":>14} {"survivors":>10} {"steps/s":>10} {"efficiency":>11}')
+    for r in reports:
+        efficiency = ''
+        if base is not None and r['steps_per_sec'] and base['steps_per_sec']:
+            # Aggregated throughput relative to K independent runs of K=1.
+            efficiency = f'{r["steps_per_sec"] / (r["nb_runs"] * base["steps_per_sec"]):10.0%}'
+        print(f'{r["nb_runs"]:>4} {r["wall_time"]:14.1f} {r["survivors"]:>10} {r["steps_per_sec"] or 0:10.1f} {efficiency:>11}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ensembles: concurrent pinned trainings with pruning, ensemble prediction.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('train', help='trains K runs concurrently (several K for the scaling)')
+    p.add_argument('--runs', type=int, nargs='+', default=[4], help='values of K')
+    p.add_argument('--params', nargs='*', default=[], help='xsom name=value parameters')
+    p.add_argument('--map-size', type=int, default=500)
+    p.add_argument('--nb-threads', type=int, default=1, help='processor threads (and cores) per run')
+    p.add_argument('--walltime', type=int, default=30000)
+    p.add_argument('--save-period', type=int, default=1000)
+    p.add_argument('--data-size', type=int, default=None, help='default: number of samples in data/')
+    p.add_argument('--prune-every', type=int, default=5, help='snapshots between two pruning rounds')
+    p.add_argument('--margin', type=float, default=.25, help='runs worse than (1 + margin) x the best rmse are stopped')
+    p.add_argument('--keep', type=int, default=2, help='number of best runs never stopped')
+    p.add_argument('--no-prune', action='store_true')
+    p.add_argument('--timeout', type=float, default=24 * 3600.)
+    p.add_argument('--workdir', default='ensemble-runs')
+    p.add_argument('--output', default='ensemble-results')
+    p.add_argument('--port', type=int, default=None)
+    p.add_argument('--skednet-port', type=int, default=None)
+    p.add_argument('--keep-runs', action='store_true', help='keeps the scratch root-dirs')
+
+    p = commands.add_parser('evaluate', help='ensemble prediction error, compared with the members')
+    p.add_argument('root_dir', help='root-dir holding the img data')
+    p.add_argument('members_dir', help='e.g. ensemble-results/k4')
+    p.add_argument('--combine', choices=COMBINE, nargs='+', default=list(COMBINE))
+    p.add_argument('--params', nargs='*', default=[], help='xsom name=value parameters of the relaxation')
+    p.add_argument('--output', default=None, help='saves the predictions in this .npz file')
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        import scratch
+        import dataset
+        if args.data_size is None:
+            args.data_size = dataset.nb_rows()
+        if args.port is None:
+            args.port = int(scratch.read_config('port')) + 400
+        if args.skednet_port is None:
+            args.skednet_port = scratch.read_skednet_port() + 400
+        reports = []
+        for k in args.runs:
+            report = train(k, args)
+            reports.append(report)
+            for m in report['members']:
+                print(f'  {m["name"]}: rmse={m["rmse"]:.4f} (weights at {m["weights_at"]})')
+        print()
+        print_scaling(reports)
+        with open(os.path.join(args.output, 'scaling.json'), 'w') as f:
+            json.dump([{k: r[k] for k in ('nb_runs', 'wall_time', 'survivors', 'training_steps', 'steps_per_sec')}
+                       for r in reports], f, indent=2)
+        print(f'Members in {args.output}/k*/run-*, timings in {args.output}/scaling.json')
+    else:
+        kwargs = offline_xsom.relax_kwargs(dict(p.split('=', 1) for p in args.params))
+        try:
+            members = load_members(args.members_dir)
+            error, velocity, thrust = offline_xsom.load_dataset(args.root_dir)
+        except (KeyError, OSError, ValueError) as e:
+            print(f'Error: {e}')
+            sys.exit(1)
+        start = time.time()
+        preds = member_predictions(members, error, velocity, np.random.default_rng(0), **kwargs)
+        print(f'{len(members)} members predicted in {time.time() - start:.1f}s.')
+        for (name, _), p in zip(members, preds):
+            print(f'  {name}: rmse={rmse(p, thrust):.4f}')
+        results = {}
+        for combine in args.combine:
+            results[combine] = COMBINE[combine](preds, axis=0)
+            print(f'{combine:<7} ensemble: rmse={rmse(results[combine], thrust):.4f}')
+        if args.output:
+            np.savez(args.output, members=preds, thrust=thrust, **results)
+            print(f'Saved in {args.output}.')
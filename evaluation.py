@@ -0,0 +1,148 @@
+"""
+Row-ordered evaluation for the check and predict modes.
+
+With the order=rows xsom parameter, the index variable of check-out
+(or predict-out) has no rule: it is written here, one dataset row per
+timestep, so that every row of the dataset (or of a shard of it) is
+evaluated exactly once, in the minimal number of timesteps.
+
+index is a Pos1D, the row r of a dataset of n rows is written as the
+center (r + .5) / n of its cell, which value_at reads as row r, and
+rows() gives r back exactly. For N processors, the dataset is split in
+N contiguous shards, each one evaluated in its own root-dir (with the
+same img and saved timelines), and the outputs are merged afterwards.
+"""
+import os
+import sys
+import argparse
+import numpy as np
+import varfile
+import waiting
+
+TIMELINES = {'check': 'check-out', 'predict': 'predict-out'}
+
+
+def data_size(root_dir):
+    return varfile.read_header(varfile.path_from(root_dir, 'img', 'error_data')).shape[0]
+
+
+def shard_rows(size, shards=1, shard=0):
+    """
+    Rows of the shard-th of shards contiguous shards of range(size).
+    """
+    if not 0 <= shard < shards:
+        raise ValueError(f'Shard {shard} out of {shards} shards')
+    return np.array_split(np.arange(size), shards)[shard]
+
+
+def positions(rows, size):
+    return (np.asarray(rows) + .5) / size
+
+
+def rows(positions, size):
+    """
+    Rows read by value_at for index positions (random ones included).
+    """
+    return np.clip((np.asarray(positions) * size).astype(int), 0, size - 1)
+
+
+def fill(root_dir, mode, shards=1, shard=0, timeout=None):
+    """
+    Writes the rows of the shard in the index variable, after the rules
+    have been sent with order=rows (the processor creates the variable
+    meanwhile, it is waited for). Returns the number of timesteps.
+    """
+    import pycxsom as cx
+    size = data_size(root_dir)
+    values = positions(shard_rows(size, shards, shard), size)
+    path = varfile.path_from(root_dir, TIMELINES[mode], 'index')
+    waiting.wait_exists([path], timeout)
+    with cx.variable.Realize(path) as v:
+        for t, value in enumerate(values):
+            v[t] = value
+    return len(values)
+
+
+def collect(root_dir, mode):
+    """
+    Returns (rows, {varname: values}) for the scalar outputs of the mode
+    (index excepted), for the timesteps computed by all of them.
+    """
+    timeline = TIMELINES[mode]
+    size = data_size(root_dir)
+    outputs = {}
+    for path in waiting.timeline_paths(root_dir, timeline):
+        if varfile.read_header(path).shape != ():
+            continue
+        name = os.path.relpath(path, os.path.join(root_dir, timeline))[:-len('.var')]
+        outputs[name] = varfile.read_history(path)
+    if 'index' not in outputs:
+        raise ValueError(f'No {timeline}/index in {root_dir}')
+    # Only the timesteps present in all the variables.
+    common = None
+    for times, _ in outputs.values():
+        common = times if common is None else np.intersect1d(common, times)
+    result = {name: values[np.searchsorted(times, common)] for name, (times, values) in outputs.items()}
+    return rows(result.pop('index'), size), result
+
+
+def merge(root_dirs, mode):
+    """
+    Merges the outputs of the shards, sorted by row. Returns (rows,
+    outputs, missing rows, duplicated rows).
+    """
+    all_rows, all_outputs = [], {}
+    for root_dir in root_dirs:
+        r, outputs = collect(root_dir, mode)
+        all_rows.append(r)
+        for name, values in outputs.items():
+            all_outputs.setdefault(name, []).append(values)
+    merged = np.concatenate(all_rows)
+    order = np.argsort(merged, kind='stable')
+    merged = merged[order]
+    outputs = {name: np.concatenate(v)[order] for name, v in all_outputs.items() if len(v) == len(root_dirs)}
+    size = data_size(root_dirs[0])
+    counts = np.bincount(merged, minlength=size)
+    return merged, outputs, np.flatnonzero(counts == 0), np.flatnonzero(counts > 1)
+
+
+def save(path, rows, outputs):
+    np.savez(path, rows=rows, **{name.replace('/', '.'): values for name, values in outputs.items()})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Row-ordered, shardable check/predict evaluation (xsom order=rows).')
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('fill', help='writes the rows of a shard in the index variable')
+    p.add_argument('root_dir')
+    p.add_argument('mode', choices=TIMELINES)
+    p.add_argument('--shards', type=int, default=1)
+    p.add_argument('--shard', type=int, default=0)
+    p.add_argument('--timeout', type=float, default=60., help='maximal waiting for the index variable (s)')
+    p = commands.add_parser('size', help='prints the number of rows of the img data (DATA_SIZE)')
+    p.add_argument('root_dir')
+    p = commands.add_parser('merge', help='merges the outputs of root-dirs (shards) by row')
+    p.add_argument('mode', choices=TIMELINES)
+    p.add_argument('root_dirs', nargs='+')
+    p.add_argument('--output', default=None, help='saves rows and outputs in this .npz file')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'fill':
+            nb = fill(args.root_dir, args.mode, args.shards, args.shard, args.timeout)
+            print(f'Written {nb} rows in {TIMELINES[args.mode]}/index (shard {args.shard + 1}/{args.shards}).')
+        elif args.command == 'size':
+            print(data_size(args.root_dir))
+        else:
+            merged, outputs, missing, duplicated = merge(args.root_dirs, args.mode)
+            print(f'{len(merged)} evaluations of {len(np.unique(merged))} rows, outputs: {", ".join(outputs)}.')
+            if len(missing):
+                print(f'{len(missing)} rows not evaluated (first ones: {missing[:10].tolist()}).')
+            if len(duplicated):
+                print(f'{len(duplicated)} rows evaluated more than once (random order ?).')
+            if args.output:
+                save(args.output, merged, outputs)
+                print(f'Saved in {args.output}.')
+    except (ValueError, OSError, waiting.Timeout) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
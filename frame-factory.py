@@ -0,0 +1,195 @@
+"""
+Renders movie frames from the saved weights, without processor.
+
+Every frame is a snapshot of saved (read from saved.snap or the .var
+files), the frames are rendered in a process pool with the Agg backend
+and the PNG bytes are piped, in order, into ffmpeg. With --frames-dir,
+frame-%06d.png files are written instead (see make movie-generation).
+
+    weights : the weights of the three maps.
+    predict : the thrust predicted on the (error, velocity) grid, and the
+              predictions of the dataset samples sorted by target.
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import subprocess
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import snapshots
+import offline_xsom
+import thrust_table
+import tracing
+
+FPS = 25
+BITRATE = '5M'
+
+# Set by init_worker in each process of the pool.
+worker = {}
+
+
+def init_worker(root_dir, mode, image_side, dpi, relax_kwargs):
+    tracing.worker_init()
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    worker.update(root_dir=root_dir, mode=mode, dpi=dpi, relax_kwargs=relax_kwargs, plt=plt)
+    if mode == 'predict':
+        worker['data'] = offline_xsom.load_dataset(root_dir)
+        worker['grid'] = thrust_table.grid_inputs(image_side)
+        worker['image_side'] = image_side
+
+
+def weights_figure(plt, weights, at):
+    fig, axes = plt.subplots(len(offline_xsom.MAPS), len(offline_xsom.WEIGHTS), figsize=(12, 9), sharex=True, sharey=True)
+    for row, m in zip(axes, offline_xsom.MAPS):
+        for ax, w in zip(row, offline_xsom.WEIGHTS):
+            values = weights[m][w]
+            ax.plot(np.linspace(0, 1, len(values)), values, color='blue')
+            ax.set_title(f'{m} ({w})')
+            ax.set_ylim(0, 1)
+    fig.suptitle(f'Saved weights at {at}')
+    return fig
+
+
+def predict_figure(plt, weights, at):
+    error, velocity, thrust = worker['data']
+    rng = np.random.default_rng(0)
+    side = worker['image_side']
+    grid = offline_xsom.predict(weights, *worker['grid'], rng, **worker['relax_kwargs'])
+    preds = offline_xsom.predict(weights, error, velocity, rng, **worker['relax_kwargs'])
+    order = np.argsort(thrust, kind='stable')
+    rmse = np.sqrt(np.mean((preds - thrust) ** 2))
+
+    fig, (left, right) = plt.subplots(1, 2, figsize=(14, 6))
+    image = left.imshow(grid.reshape(side, side).T, origin='lower', extent=(0, 1, 0, 1), vmin=0, vmax=1, cmap='jet')
+    left.set_xlabel('error')
+    left.set_ylabel('velocity')
+    left.set_title('Predicted thrust')
+    fig.colorbar(image, ax=left)
+    right.plot(thrust[order], color='black', linewidth=2, label='Real Thrust (Target)')
+    right.scatter(np.arange(len(order)), preds[order], color='orange', s=5, alpha=0.3, label='Predicted Samples')
+    right.set_ylim(-.05, 1.05)
+    right.set_xlabel('Test Samples (sorted by target thrust)')
+    right.set_title(f'rmse {rmse:.4f}')
+    right.legend(loc='upper left')
+    fig.suptitle(f'Saved weights at {at}')
+    return fig
+
+
+@tracing.traced('render')
+def render(at):
+    """
+    Returns the PNG bytes of the frame of the saved weights at.
+    """
+    plt = worker['plt']
+    weights = offline_xsom.load_weights(worker['root_dir'], at)
+    if worker['mode'] == 'weights':
+        fig = weights_figure(plt, weights, at)
+    else:
+        fig = predict_figure(plt, weights, at)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=worker['dpi'])
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def ordered(pool, function, items, window):
+    """
+    Same as pool.map, but with at most window pending results, so that the
+    frames do not pile up in memory when the writer is slower.
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def ffmpeg(path, fps, bitrate):
+    return subprocess.Popen(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'image2pipe', '-framerate', str(fps),
+                             '-c:v', 'png', '-i', '-', '-b:v', bitrate, path], stdin=subprocess.PIPE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Renders a movie of the saved weights (one frame per snapshot).')
+    parser.add_argument('root_dir')
+    parser.add_argument('mode', choices=['weights', 'predict'])
+    parser.add_argument('params', nargs='*', help='xsom name=value parameters used for training (the sigmas, beta, delta and deadline matter)')
+    parser.add_argument('--output', default=None, help='movie file (default completion-xsom-<mode>.ogg)')
+    parser.add_argument('--frames-dir', default=None, help='writes frame-%%06d.png files in this directory instead of a movie')
+    parser.add_argument('--at', type=int, default=None, help='renders only the snapshot at this time in frame.png (or --output)')
+    parser.add_argument('--stride', type=int, default=1, help='renders one snapshot every stride')
+    parser.add_argument('--first', type=int, default=None)
+    parser.add_argument('--last', type=int, default=None)
+    parser.add_argument('--image-side', type=int, default=100, help='side of the predicted thrust image (predict mode)')
+    parser.add_argument('--dpi', type=int, default=80)
+    parser.add_argument('--fps', type=int, default=FPS)
+    parser.add_argument('--bitrate', default=BITRATE)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    try:
+        kwargs = offline_xsom.relax_kwargs(dict(p.split('=', 1) for p in args.params))
+    except ValueError as e:
+        print(f'Error: bad parameters {args.params}, name=value expected ({e}).')
+        sys.exit(1)
+    names = [f'{m}/{w}' for m in offline_xsom.MAPS for w in offline_xsom.WEIGHTS]
+    times = snapshots.saved_times(args.root_dir, names)
+    if args.at is not None:
+        times = times[times == args.at]
+    else:
+        if args.first is not None:
+            times = times[times >= args.first]
+        if args.last is not None:
+            times = times[times <= args.last]
+        times = times[::args.stride]
+    if len(times) == 0:
+        print('No saved weights to render.')
+        sys.exit(1)
+
+    if args.at is not None:
+        init_worker(args.root_dir, args.mode, args.image_side, args.dpi, kwargs)
+        path = args.output or 'frame.png'
+        with open(path, 'wb') as f:
+            f.write(render(args.at))
+        print(f'{path} written.')
+        return
+
+    if args.frames_dir is None:
+        output = args.output or f'completion-xsom-{args.mode}.ogg'
+        try:
+            encoder = ffmpeg(output, args.fps, args.bitrate)
+        except FileNotFoundError:
+            print('ffmpeg not found, use --frames-dir.')
+            sys.exit(1)
+    else:
+        os.makedirs(args.frames_dir, exist_ok=True)
+
+    start = time.time()
+    print(f'Rendering {len(times)} frames (saved times {times[0]} to {times[-1]}) with {args.jobs} processes.')
+    with ProcessPoolExecutor(args.jobs, initializer=init_worker,
+                             initargs=(args.root_dir, args.mode, args.image_side, args.dpi, kwargs)) as pool:
+        for i, png in enumerate(ordered(pool, render, [int(t) for t in times], 2 * args.jobs)):
+            if args.frames_dir is None:
+                encoder.stdin.write(png)
+            else:
+                with open(os.path.join(args.frames_dir, f'frame-{i:06d}.png'), 'wb') as f:
+                    f.write(png)
+            print(f'\r{i + 1}/{len(times)} frames, {(i + 1) / (time.time() - start):.1f} frames/s', end='', flush=True)
+    print()
+    if args.frames_dir is None:
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            print('ffmpeg failed.')
+            sys.exit(1)
+        print(f'{output} written in {time.time() - start:.1f}s.')
+
+
+if __name__ == '__main__':
+    main()
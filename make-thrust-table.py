@@ -0,0 +1,66 @@
+import sys
+import time
+import varfile
+import thrust_table
+
+usage = f'''Usage :
+  {sys.argv[0]} <root-dir> fill <grid-side>                         <-- writes the grid in grid-in (after xsom grid ...)
+  {sys.argv[0]} <root-dir> collect <grid-side> [table-file]         <-- builds the table from grid-out
+  {sys.argv[0]} <root-dir> offline <weights-at> <grid-side> [table-file] <-- builds the table without processor
+  {sys.argv[0]} <table-file> query <error> <velocity>               <-- raw thrust for raw inputs'''
+
+# Number of arguments (the script included) each mode requires.
+NB_ARGS = {'fill': 4, 'collect': 4, 'offline': 5, 'query': 5}
+
+mode = sys.argv[2] if len(sys.argv) > 2 else None
+if mode not in NB_ARGS or len(sys.argv) < NB_ARGS[mode]:
+    print(usage)
+    sys.exit(0 if len(sys.argv) < 3 else 1)
+
+try:
+    if mode == 'query':
+        error, velocity = float(sys.argv[3]), float(sys.argv[4])
+        controller = thrust_table.RocketController(sys.argv[1])
+        nb = 100000
+        start = time.perf_counter()
+        for _ in range(nb):
+            thrust = controller.thrust(error, velocity)
+        duration = (time.perf_counter() - start) / nb
+        print(f'thrust({error}, {velocity}) = {thrust}  ({duration * 1e6:.2f} us per query)')
+        sys.exit(0)
+
+    root_dir = sys.argv[1]
+
+    if mode == 'fill':
+        import pycxsom as cx
+        side = int(sys.argv[3])
+        error, velocity = thrust_table.grid_inputs(side)
+        for name, values in [('error', error), ('velocity', velocity)]:
+            with cx.variable.Realize(cx.variable.path_from(root_dir, 'grid-in', name)) as v:
+                for t, value in enumerate(values):
+                    v[t] = value
+            print(f'Written {len(values)} grid values in grid-in/{name}')
+
+    elif mode == 'collect':
+        side = int(sys.argv[3])
+        table_file = sys.argv[4] if len(sys.argv) > 4 else thrust_table.TABLE_FILE
+        times, thrust = varfile.read_history(varfile.path_from(root_dir, 'grid-out', 'predicted-thrust'))
+        if len(times) != side * side or times[0] != 0:
+            print(f'Error: grid-out/predicted-thrust has {len(times)} values, {side * side} expected (is the processor done ?).')
+            sys.exit(1)
+        thrust_table.save(table_file, thrust, side, thrust_table.load_normalization())
+        print(f'Table {side}x{side} saved in {table_file}')
+
+    elif mode == 'offline':
+        import offline_xsom
+        weights_at, side = int(sys.argv[3]), int(sys.argv[4])
+        table_file = sys.argv[5] if len(sys.argv) > 5 else thrust_table.TABLE_FILE
+        start = time.time()
+        weights = offline_xsom.load_weights(root_dir, weights_at)
+        error, velocity = thrust_table.grid_inputs(side)
+        thrust = offline_xsom.predict(weights, error, velocity)
+        thrust_table.save(table_file, thrust, side, thrust_table.load_normalization())
+        print(f'Table {side}x{side} computed in {time.time() - start:.2f}s, saved in {table_file}')
+except (KeyError, OSError, ValueError) as e:
+    print(f'Error: {e}')
+    sys.exit(1)
@@ -0,0 +1,265 @@
+"""
+Coarse-to-fine training: small maps first, then larger ones.
+
+The saved weights of a small map are resampled on a larger map: unit i
+of a map of n units sits at position i / (n - 1), so the weights are
+linearly interpolated at the positions of the new units. This holds for
+We-0 (input values) as for Wc-0 and Wc-1, which store positions of the
+BMUs of the other maps in [0, 1], and remain valid whatever the size of
+these maps. The resampled weights are written as the snapshot 0 of the
+saved timeline of a fresh root-dir, from which the resume mode of xsom
+goes on training at the new size.
+
+The run command trains a schedule of levels (map-size:steps) each one on
+its own scratch processor, and compares it with the single-resolution
+baseline: prediction error (offline) of every snapshot, against the
+wall time and the training steps spent so far.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import numpy as np
+import varfile
+import snapshots
+import offline_xsom
+
+# Same values as the defaults of xsom.cpp.
+CACHE = 2
+SAVE_TRACE = 1000
+
+
+def parse_levels(specs):
+    """
+    ['50:5000', '500:10000'] -> [(50, 5000), (500, 10000)]
+    """
+    levels = []
+    for spec in specs:
+        size, _, steps = spec.partition(':')
+        try:
+            levels.append((int(size), int(steps)))
+        except ValueError:
+            raise ValueError(f'Bad level "{spec}", expected <map-size>:<steps>')
+    return levels
+
+
+def resample(w, size):
+    return np.interp(np.linspace(0, 1, size), np.linspace(0, 1, len(w)), w)
+
+
+def upsample(weights, size):
+    """
+    Resamples {map: {weight: array}} on maps of size units.
+    """
+    return {m: {w: resample(values, size) for w, values in layers.items()} for m, layers in weights.items()}
+
+
+def write_weights(root_dir, weights, save_trace=SAVE_TRACE, cache=CACHE):
+    """
+    Writes the weights as the saved snapshot 0 of root_dir (the saved
+    timeline must not exist yet, or have the same map size).
+    """
+    for m, layers in weights.items():
+        for w, values in layers.items():
+            datatype = f'{snapshots.WEIGHT_TYPES[w]}={len(values)}'
+            varfile.create(varfile.path_from(root_dir, 'saved', f'{m}/{w}'), datatype, values, cache, save_trace)
+
+
+def saved_times(root_dir):
+    r = varfile.time_range(varfile.path_from(root_dir, 'saved', 'Thrust/We-0'))
+    return [] if r is None else list(range(r[0], r[1] + 1))
+
+
+def train_level(sandbox, size, steps, weights, args):
+    """
+    Trains a level on a scratch processor, from random weights (weights is
+    None) or from the given ones. Returns the training duration.
+    """
+    import waiting
+    params = dict(p.split('=', 1) for p in args.params)
+    variables = {'SAVE_PERIOD': args.save_period, 'DATA_SIZE': args.data_size,
+                 'MAP_SIZE': size, 'XSOM_PARAMS': ' '.join(args.params)}
+    sandbox.launch()
+    sandbox.make('inputs-setup')
+    start = time.time()
+    if weights is None:
+        sandbox.make('train-setup', **variables)
+        sandbox.make('feed-train-inputs', WALLTIME=steps)
+    else:
+        write_weights(sandbox.root_dir, weights,
+                      int(params.get('save-trace', SAVE_TRACE)), int(params.get('cache', CACHE)))
+        sandbox.make('resume', RESUME_AT=0, WALLTIME=steps, **variables)
+    waiting.wait_time([sandbox.path('train-out', 'Thrust/BMU')], steps - 1, timeout=args.timeout)
+    waiting.wait_stable(waiting.timeline_paths(sandbox.root_dir, 'saved'), timeout=args.timeout)
+    return time.time() - start
+
+
+def score(root_dir, at, data, kwargs):
+    """
+    Offline prediction error of a snapshot, and the mean number of
+    relaxation steps per sample (the processor does not record it).
+    """
+    weights = offline_xsom.load_weights(root_dir, at)
+    error, velocity, thrust = data
+    result = offline_xsom.evaluate(weights, error, velocity, thrust, np.random.default_rng(0), **kwargs)
+    _, steps = offline_xsom.relax(weights, {'Error': error, 'Velocity': velocity, 'Thrust': thrust},
+                                  np.random.default_rng(0), **kwargs)
+    result['relaxation_steps'] = float(steps.mean())
+    return result
+
+
+def run_schedule(name, levels, args, offset):
+    """
+    Trains the levels in turn. Returns one row per saved snapshot, with
+    the cumulated training steps, relaxation steps and wall time (spread
+    linearly over the steps of a level, only the level ends are timed).
+    """
+    import scratch
+    params = dict(p.split('=', 1) for p in args.params)
+    kwargs = offline_xsom.relax_kwargs(params)
+    rows = []
+    weights = previous = None
+    elapsed, steps_done, relaxations = 0., 0, 0.
+    for index, (size, steps) in enumerate(levels):
+        directory = os.path.join(args.workdir, f'{name}-{index}-{size}')
+        sandbox = scratch.Scratch(directory, args.port + offset + index, args.skednet_port + offset + index,
+                                  args.nb_threads).create()
+        print(f'{name}: level {index + 1}/{len(levels)}, {size} units, {steps} steps')
+        try:
+            duration = train_level(sandbox, size, steps, weights, args)
+            data = offline_xsom.load_dataset(sandbox.root_dir)
+            for at in saved_times(sandbox.root_dir):
+                if at == 0 and index > 0:
+                    # The upsampled last snapshot of the previous level.
+                    continue
+                level_steps = at * args.save_period
+                row = {'schedule': name, 'level': index, 'map_size': size, 'saved_at': at,
+                       'steps': steps_done + level_steps,
+                       'duration': elapsed + duration * level_steps / steps}
+                row.update(score(sandbox.root_dir, at, data, kwargs))
+                if previous is not None:
+                    # Relaxations between two snapshots, at the mean cost of both.
+                    relaxations += args.save_period * (previous['relaxation_steps'] + row['relaxation_steps']) / 2
+                row['total_relaxation_steps'] = relaxations
+                rows.append(row)
+                previous = row
+                print(f'  saved {at:>3}  rmse={row["rmse"]:.4f}  {row["relaxation_steps"]:6.1f} relaxation steps/sample')
+            last = saved_times(sandbox.root_dir)[-1]
+            if index + 1 < len(levels):
+                weights = upsample(offline_xsom.load_weights(sandbox.root_dir, last), levels[index + 1][0])
+            elapsed += duration
+            steps_done += last * args.save_period
+        finally:
+            sandbox.kill()
+            if not args.keep:
+                sandbox.remove()
+    return rows
+
+
+def time_to_quality(rows, rmse):
+    """
+    First row of a schedule whose prediction error is rmse or less.
+    """
+    for row in rows:
+        if row['rmse'] <= rmse:
+            return row
+    return None
+
+
+def run(args):
+    levels = parse_levels(args.levels)
+    baseline = parse_levels([args.baseline]) if args.baseline else [(levels[-1][0], sum(s for _, s in levels))]
+    os.makedirs(args.workdir, exist_ok=True)
+    schedules = {'multires': run_schedule('multires', levels, args, 0)}
+    if not args.no_baseline:
+        schedules['baseline'] = run_schedule('baseline', baseline, args, len(levels))
+
+    rows = [row for r in schedules.values() for row in r]
+    target = args.target_rmse
+    if target is None:
+        # Default: the final quality of the coarse-to-fine schedule.
+        target = schedules['multires'][-1]['rmse']
+    summary = {}
+    for name, r in schedules.items():
+        reached = time_to_quality(r, target)
+        summary[name] = None if reached is None else {k: reached[k] for k in ('map_size', 'saved_at', 'steps', 'duration',
+                                                                              'total_relaxation_steps', 'rmse')}
+    report = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'levels': levels, 'baseline': baseline,
+              'save_period': args.save_period, 'params': args.params, 'target_rmse': target,
+              'time_to_quality': summary, 'snapshots': rows}
+    with open(args.output + '.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    fields = ['schedule', 'level', 'map_size', 'saved_at', 'steps', 'duration',
+              'relaxation_steps', 'total_relaxation_steps', 'rmse', 'max_error']
+    with open(args.output + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print()
+    print(f'Time to rmse <= {target:.4f}:')
+    for name, reached in summary.items():
+        if reached is None:
+            print(f'  {name:<9} not reached')
+        else:
+            print(f'  {name:<9} {reached["duration"]:8.0f} s  {reached["steps"]:>7} steps  '
+                  f'{reached["total_relaxation_steps"]:12.0f} relaxation steps  (map {reached["map_size"]}, rmse {reached["rmse"]:.4f})')
+    print(f'Results written in {args.output}.json and {args.output}.csv')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Coarse-to-fine training: upsampling of the saved weights, and schedule benchmark.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('upsample', help='writes the upsampled weights as snapshot 0 of a fresh root-dir')
+    p.add_argument('root_dir')
+    p.add_argument('weights_at', type=int)
+    p.add_argument('destination', help='root-dir to resume from (RESUME_AT=0), with its own img timeline')
+    p.add_argument('map_size', type=int)
+    p.add_argument('--save-trace', type=int, default=SAVE_TRACE, help='same as the save-trace xsom parameter')
+
+    p = commands.add_parser('run', help='trains a coarse-to-fine schedule and the single-resolution baseline')
+    p.add_argument('levels', nargs='+', help='<map-size>:<steps> for each level, e.g. 50:5000 150:5000 500:10000')
+    p.add_argument('--baseline', default=None, help='<map-size>:<steps> (default: last map size, total steps)')
+    p.add_argument('--no-baseline', action='store_true')
+    p.add_argument('--target-rmse', type=float, default=None, help='default: final rmse of the schedule')
+    p.add_argument('--params', nargs='*', default=[], help='xsom name=value parameters, for all the levels')
+    p.add_argument('--save-period', type=int, default=1000)
+    p.add_argument('--data-size', type=int, default=None, help='default: number of samples in data/')
+    p.add_argument('--nb-threads', type=int, default=None)
+    p.add_argument('--timeout', type=float, default=24 * 3600., help='maximal training duration of a level (s)')
+    p.add_argument('--workdir', default='multires-runs')
+    p.add_argument('--port', type=int, default=None)
+    p.add_argument('--skednet-port', type=int, default=None)
+    p.add_argument('--keep', action='store_true', help='keeps the scratch root-dirs')
+    p.add_argument('--output', default='multires-results', help='writes <output>.json and <output>.csv')
+    args = parser.parse_args()
+
+    if args.command == 'upsample':
+        try:
+            weights = offline_xsom.load_weights(args.root_dir, args.weights_at)
+        except (KeyError, OSError, ValueError) as e:
+            print(f'Error: {e}')
+            sys.exit(1)
+        sizes = {len(layers['We-0']) for layers in weights.values()}
+        write_weights(args.destination, upsample(weights, args.map_size), args.save_trace)
+        print(f'Weights saved at {args.weights_at} ({", ".join(map(str, sorted(sizes)))} units) written in '
+              f'{args.destination}/saved at 0 ({args.map_size} units).')
+        print(f'Train them with: make resume RESUME_AT=0 MAP_SIZE={args.map_size} ...')
+    else:
+        import scratch
+        import dataset
+        if args.data_size is None:
+            args.data_size = dataset.nb_rows()
+        if args.port is None:
+            args.port = int(scratch.read_config('port')) + 300
+        if args.skednet_port is None:
+            args.skednet_port = scratch.read_skednet_port() + 300
+        try:
+            parse_levels(args.levels + ([args.baseline] if args.baseline else []))
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        run(args)
@@ -0,0 +1,191 @@
+"""
+Pure NumPy replay of the check/predict rules of xsom.cpp.
+
+The saved weights of the Error/Velocity/Thrust maps are loaded once, and
+the relaxation is computed for all the samples at the same time (arrays
+are samples x map positions), so that no cxsom processor is needed.
+"""
+import numpy as np
+import varfile
+import snapshots
+import tracing
+
+MAPS = ['Error', 'Velocity', 'Thrust']
+WEIGHTS = ['We-0', 'Wc-0', 'Wc-1']
+
+# Contextual layers, in the order they are declared in xsom.cpp:
+# Wc-0 and Wc-1 of each map are matched against the BMUs of these maps.
+CONTEXTS = {'Error'   : ('Velocity', 'Thrust'),
+            'Velocity': ('Error',    'Thrust'),
+            'Thrust'  : ('Error',    'Velocity')}
+
+# Same values as in the Params struct of xsom.cpp.
+SIGMA    = .075
+BETA     = .5
+DELTA    = .02
+DEADLINE = 1000
+
+CYCLE_DEPTH = 128
+
+
+def load_weights(root_dir, weights_at):
+    """
+    Returns {map: {weight: array}} for the saved weights at weights_at.
+    """
+    weights = {}
+    for m in MAPS:
+        weights[m] = {}
+        for w in WEIGHTS:
+            weights[m][w] = snapshots.read_at(root_dir, f'{m}/{w}', weights_at)
+    return weights
+
+
+def load_dataset(root_dir):
+    """
+    Returns the (error, velocity, thrust) normalized columns stored in img.
+    """
+    data = []
+    for name in ['error_data', 'velocity_data', 'thrust_data']:
+        data.append(varfile.read_at(varfile.path_from(root_dir, 'img', name), 0))
+    return tuple(data)
+
+
+def match_gaussian(x, w, sigma=SIGMA):
+    # x is (n,), w is (side,), result is (n, side). Computed in float32
+    # and in place, since this is where all the time goes.
+    a = np.subtract.outer(np.asarray(x, dtype=np.float32), np.asarray(w, dtype=np.float32))
+    a *= a
+    a *= np.float32(-.5 / (sigma * sigma))
+    return np.exp(a, out=a)
+
+
+def merge(ae, ac, beta=BETA):
+    return np.sqrt(ae * (beta * ae + (1 - beta) * ac))
+
+
+def quantization_error(w, x):
+    """
+    Mean distance of the samples x to their closest weight in w (1D).
+    """
+    w = np.sort(w)
+    idx = np.clip(np.searchsorted(w, x), 1, len(w) - 1)
+    return float(np.mean(np.minimum(np.abs(x - w[idx - 1]), np.abs(x - w[idx]))))
+
+
+def value_at(w, pos):
+    """
+    Reads the map w at the Pos1D positions pos (in [0, 1]).
+    """
+    idx = np.rint(pos * (len(w) - 1)).astype(int)
+    return w[np.clip(idx, 0, len(w) - 1)]
+
+
+@tracing.traced('relax')
+def relax(weights, inputs, rng=None, sigma_ctx=SIGMA, sigma_state=SIGMA, sigma_thrust=SIGMA,
+          beta=BETA, delta=DELTA, deadline=DEADLINE):
+    """
+    Relaxes the three maps for all the samples at once.
+
+    inputs is {map: values} for the maps that have an external input
+    (the other maps only rely on their contextual activity). As in
+    xsom.cpp, contextual layers match with sigma_ctx, the external ones
+    with sigma_thrust for Thrust and sigma_state otherwise. BMUs start
+    at random positions and move toward the argmax of the global
+    activity by at most delta, until none of them moves or the deadline
+    is reached. Returns ({map: bmu}, steps), steps being the number of
+    relaxation steps consumed by each sample.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    n = len(next(iter(inputs.values())))
+
+    ae = {m: match_gaussian(x, weights[m]['We-0'], sigma_thrust if m == 'Thrust' else sigma_state)
+          for m, x in inputs.items()}
+    beta_ae = {m: beta * a for m, a in ae.items()}
+    positions = {m: np.linspace(0, 1, len(weights[m]['We-0'])) for m in MAPS}
+    bmus = rng.random((len(MAPS), n))
+    steps = np.zeros(n, dtype=int)
+
+    # A relaxation step only depends on the current BMUs, so a sample
+    # whose BMUs come back to a previous state will cycle until the
+    # deadline. Such cycles are detected on the last CYCLE_DEPTH states
+    # and the state reached at the deadline is picked directly.
+    history = np.empty((CYCLE_DEPTH,) + bmus.shape)
+    active = np.arange(n)
+    for step in range(1, deadline + 1):
+        rows = slice(None) if len(active) == n else active
+        current = bmus[:, active]
+        new = np.empty_like(current)
+        for i, m in enumerate(MAPS):
+            c0, c1 = (MAPS.index(c) for c in CONTEXTS[m])
+            a = match_gaussian(current[c0], weights[m]['Wc-0'], sigma_ctx)
+            a += match_gaussian(current[c1], weights[m]['Wc-1'], sigma_ctx)
+            if m in ae:
+                # This is merge(ae, ac) squared, in place, which has the same argmax.
+                a *= .5 * (1 - beta)
+                a += beta_ae[m][rows]
+                a *= ae[m][rows]
+            target = positions[m][np.argmax(a, axis=1)]
+            new[i] = current[i] + np.clip(target - current[i], -delta, delta)
+        history[(step - 1) % CYCLE_DEPTH] = bmus
+        bmus[:, active] = new
+        steps[active] = step
+
+        # past[k - 1] is the state k steps before the new one.
+        back = (step - np.arange(1, min(step, CYCLE_DEPTH) + 1)) % CYCLE_DEPTH
+        past = history[back][:, :, active]
+        same = np.all(past == new, axis=1)
+        settled = np.any(same, axis=0)
+        period = np.argmax(same, axis=0) + 1
+        cycling = np.flatnonzero(settled & (period > 1))
+        if len(cycling) > 0:
+            k = period[cycling]
+            r = (deadline - step) % k
+            bmus[:, active[cycling]] = past[k - r - 1, :, cycling].T
+            steps[active[cycling]] = deadline
+        active = active[~settled]
+        if len(active) == 0:
+            break
+    return dict(zip(MAPS, bmus)), steps
+
+
+def predict(weights, error, velocity, rng=None, **kwargs):
+    """
+    Same as the predict mode: returns the thrust read at the Thrust BMU.
+    """
+    bmus, _ = relax(weights, {'Error': error, 'Velocity': velocity}, rng, **kwargs)
+    return value_at(weights['Thrust']['We-0'], bmus['Thrust'])
+
+
+def check(weights, error, velocity, thrust, rng=None, **kwargs):
+    """
+    Same as the check mode: returns {map: We-0 at BMU}.
+    """
+    bmus, _ = relax(weights, {'Error': error, 'Velocity': velocity, 'Thrust': thrust}, rng, **kwargs)
+    return {m: value_at(weights[m]['We-0'], bmus[m]) for m in MAPS}
+
+
+def evaluate(weights, error, velocity, thrust, rng=None, **kwargs):
+    """
+    Returns the RMSE and max error of the predicted thrust (normalized).
+    """
+    diff = predict(weights, error, velocity, rng, **kwargs) - thrust
+    return {'rmse': float(np.sqrt(np.mean(diff * diff))), 'max_error': float(np.max(np.abs(diff)))}
+
+
+def relax_kwargs(params):
+    """
+    Picks, in xsom name=value parameters, the ones that change the
+    relaxation. They are applied in order, as parse_hyperparams does:
+    sigma sets the three matching widths.
+    """
+    kwargs = {}
+    for name, value in params.items():
+        if name == 'sigma':
+            kwargs.update(dict.fromkeys(['sigma_ctx', 'sigma_state', 'sigma_thrust'], float(value)))
+        elif name in ('sigma-ctx', 'sigma-state', 'sigma-thrust'):
+            kwargs[name.replace('-', '_')] = float(value)
+    kwargs.update({k: float(params[k]) for k in ('beta', 'delta') if k in params})
+    if 'deadline' in params:
+        kwargs['deadline'] = int(params['deadline'])
+    return kwargs
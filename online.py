@@ -0,0 +1,223 @@
+"""
+Incremental training from flight logs appended to the dataset.
+
+append normalizes a new log with the existing normalization_params (the
+scale the maps have learned is kept, out of range values are handled
+explicitly: clipped, dropped or refused), shuffles its rows and appends
+them at the end of the img data variables. The rows already there are
+neither reshuffled nor renormalized.
+
+feed writes the train-in inputs of a training sent with feed=client:
+each timestep is a row drawn at random from the img data, re-read as
+soon as rows have been appended. The inputs are written a window ahead
+of the processor (train-out/Thrust/BMU), the window being smaller than
+the trace of the train-in variables (train-trace). Training thus goes on
+with the enlarged dataset, without new rules and from the current
+weights.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+import varfile
+import waiting
+import dataset
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+INPUTS = {'error': 'error_data', 'velocity': 'velocity_data', 'thrust': 'thrust_data'}
+HISTORY_FILE = 'appended-logs.json'
+WINDOW = 500
+OUT_OF_RANGE = ['clip', 'drop', 'refuse']
+
+
+def ping_processor(directory=HERE):
+    subprocess.run(['make', '--quiet', '-C', directory, 'cxsom-ping-processor'], check=True)
+
+
+def data_paths(root_dir):
+    return {name: varfile.path_from(root_dir, 'img', var) for name, var in INPUTS.items()}
+
+
+def load_data(root_dir):
+    """
+    Returns {input: values}. A dataset being appended may have columns
+    of different lengths for a moment, only the common rows are kept.
+    """
+    data = {name: varfile.read_at(path, 0) for name, path in data_paths(root_dir).items()}
+    size = min(len(v) for v in data.values())
+    return {name: v[:size] for name, v in data.items()}
+
+
+def history_path(root_dir):
+    return os.path.join(root_dir, 'img', HISTORY_FILE)
+
+
+def load_history(root_dir):
+    path = history_path(root_dir)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(root_dir, history):
+    with open(history_path(root_dir), 'w') as f:
+        json.dump(history, f, indent=2)
+
+
+def record_base(root_dir, log_file, info):
+    """
+    Starts the history of the img data with the log it has been built
+    from, so that this log is not appended again.
+    """
+    save_history(root_dir, [{'log': log_file, 'hash': info['hash'], 'rows': info['rows'], 'appended': info['rows'],
+                             'data_size': info['rows'], 'base': True}])
+
+
+def append(root_dir, log_file, out_of_range='clip', seed=None, force=False):
+    """
+    Appends the rows of log_file to the img data. Returns a report.
+    """
+    params = dataset.load_normalization()
+    columns = params.get('columns', dataset.COLUMNS)
+    raw, info = dataset.load(log_file)
+    if max(columns.values()) >= info['cols']:
+        raise ValueError(f'{log_file} only has {info["cols"]} columns.')
+    history = load_history(root_dir)
+    if not history or not history[0].get('base'):
+        raise ValueError(f'The log the img data of {root_dir} is built from is unknown (no img/{HISTORY_FILE}), '
+                         f'rebuild the dataset with make inputs-setup.')
+    known = {h['hash'] for h in history}
+    if info['hash'] in known and not force:
+        raise ValueError(f'{log_file} is already in the dataset (use --force to append it again).')
+
+    order = np.random.default_rng(seed).permutation(info['rows'])
+    new = {name: dataset.normalize(raw[order, col], params[f'{name}_min'], params[f'{name}_max'])
+           for name, col in columns.items()}
+    outside = {name: (v < 0) | (v > 1) for name, v in new.items()}
+    report = {'log': log_file, 'hash': info['hash'], 'rows': info['rows'],
+              'out_of_range': {name: int(o.sum()) for name, o in outside.items()}}
+    rows_outside = np.logical_or.reduce(list(outside.values()))
+    if rows_outside.any():
+        if out_of_range == 'refuse':
+            raise ValueError(f'{int(rows_outside.sum())} rows out of the normalization range '
+                             f'({report["out_of_range"]}), rebuild the dataset or use --out-of-range clip|drop.')
+        if out_of_range == 'drop':
+            new = {name: v[~rows_outside] for name, v in new.items()}
+        else:
+            new = {name: np.clip(v, 0, 1) for name, v in new.items()}
+    report['appended'] = len(new['thrust'])
+
+    current = load_data(root_dir)
+    size = len(current['thrust']) + report['appended']
+    # thrust last: readers only keep the rows common to all the columns.
+    for name in ['error', 'velocity', 'thrust']:
+        values = np.concatenate((current[name], new[name]))
+        varfile.create(data_paths(root_dir)[name], f'Map1D<Scalar>={size}', values, 1, 1)
+    report['data_size'] = size
+
+    history.append({k: report[k] for k in ('log', 'hash', 'rows', 'appended', 'data_size')})
+    save_history(root_dir, history)
+    return report
+
+
+class Rows:
+    """
+    The img data, re-read when it has changed on disk.
+    """
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.stamp = None
+        self.data = None
+
+    def get(self):
+        stamp = tuple(os.stat(p).st_mtime_ns for p in data_paths(self.root_dir).values())
+        if stamp != self.stamp:
+            self.data = load_data(self.root_dir)
+            self.stamp = stamp
+        return self.data
+
+
+def feed(root_dir, walltime=None, window=WINDOW, seed=None, timeout=None, ping=ping_processor):
+    """
+    Writes random rows in the train-in inputs, window timesteps ahead of
+    the processor, until walltime (or forever).
+    """
+    import pycxsom as cx
+    paths = {name: varfile.path_from(root_dir, 'train-in', name) for name in INPUTS}
+    progress = varfile.path_from(root_dir, 'train-out', 'Thrust/BMU')
+    waiting.wait_exists(list(paths.values()), timeout)
+    headers = [varfile.read_header(p) for p in paths.values()]
+    trace = min(h.file_size for h in headers)
+    if trace > 0:
+        # Values written further ahead would overwrite unread ones.
+        window = min(window, trace - 1)
+    if window < 1:
+        raise ValueError(f'train-in trace is {trace}, send the train rules with train-trace=<window + 1>.')
+    t = min(h.last_time for h in headers) + 1
+    rng = np.random.default_rng(seed)
+    rows = Rows(root_dir)
+    size = None
+    while walltime is None or t < walltime:
+        try:
+            done = varfile.read_header(progress).last_time
+        except (OSError, ValueError):
+            done = -1
+        end = done + 1 + window
+        if walltime is not None:
+            end = min(end, walltime)
+        if end <= t:
+            # Refilled once half of the window is consumed.
+            waiting.wait_time([progress], t - 1 - window // 2, timeout)
+            continue
+        data = rows.get()
+        if len(data['thrust']) != size:
+            size = len(data['thrust'])
+            print(f'Feeding from time {t}, {size} rows.')
+        drawn = rng.integers(size, size=end - t)
+        for name, path in paths.items():
+            with cx.variable.Realize(path) as v:
+                for at, value in zip(range(t, end), data[name][drawn]):
+                    v[at] = value
+        t = end
+        ping()
+    return t
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Incremental training from appended flight logs (xsom feed=client).')
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('append', help='appends a flight log to the img data, with the current normalization')
+    p.add_argument('root_dir')
+    p.add_argument('log_file')
+    p.add_argument('--out-of-range', choices=OUT_OF_RANGE, default='clip',
+                   help='rows out of the normalization range are clipped, dropped or refused (default clip)')
+    p.add_argument('--seed', type=int, default=None, help='seed of the shuffle of the new rows')
+    p.add_argument('--force', action='store_true', help='appends a log that is already in the dataset')
+    p = commands.add_parser('feed', help='writes random rows in the train-in inputs, ahead of the processor')
+    p.add_argument('root_dir')
+    p.add_argument('--walltime', type=int, default=None, help='last time + 1 (default: forever)')
+    p.add_argument('--window', type=int, default=WINDOW, help='timesteps written ahead of the processor')
+    p.add_argument('--seed', type=int, default=None)
+    p.add_argument('--timeout', type=float, default=None, help='maximal waiting for the processor (s)')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'append':
+            report = append(args.root_dir, args.log_file, args.out_of_range, args.seed, args.force)
+            outside = ', '.join(f'{k} {v}' for k, v in report['out_of_range'].items() if v)
+            if outside:
+                print(f'Out of range values ({args.out_of_range}): {outside}.')
+            print(f'{report["appended"]} rows appended, the dataset has {report["data_size"]} rows '
+                  f'(DATA_SIZE={report["data_size"]} for check and predict).')
+        else:
+            t = feed(args.root_dir, args.walltime, args.window, args.seed, args.timeout)
+            print(f'Inputs written up to time {t - 1}.')
+    except (ValueError, OSError, waiting.Timeout) as e:
+        print(f'Error: {e}')
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
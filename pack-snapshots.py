@@ -0,0 +1,43 @@
+import sys
+import os
+import argparse
+import waiting
+import snapshots
+
+parser = argparse.ArgumentParser(description='Packs the saved weights of a root-dir into a single snapshot store.')
+parser.add_argument('root_dir')
+parser.add_argument('--output', default=None, help=f'store file (default <root-dir>/{snapshots.STORE_FILE})')
+parser.add_argument('--float64', action='store_true', help='stores float64 values instead of float32')
+parser.add_argument('--follow', action='store_true', help='keeps on packing new snapshots while training runs (Ctrl-C to stop)')
+parser.add_argument('--until', type=int, default=None, help='with --follow, stops once this saved time is packed')
+args = parser.parse_args()
+
+path = args.output or snapshots.store_path(args.root_dir)
+value_type = '<f8' if args.float64 else '<f4'
+
+
+def pack():
+    store, nb = snapshots.pack(args.root_dir, path, value_type)
+    if nb:
+        print(f'{nb} snapshot(s) added, {path} holds times {store.time_range()} ({os.path.getsize(path) / 2**20:.1f} MiB).')
+    return store
+
+
+try:
+    store = pack()
+    if args.follow:
+        saved = os.path.join(args.root_dir, 'saved')
+        with waiting.Watcher([d for d, _, _ in os.walk(saved)]) as watcher:
+            while args.until is None or store.time_range() is None or store.time_range()[1] < args.until:
+                watcher.wait(waiting.MAX_SLEEP)
+                store = pack()
+except ValueError as e:
+    print(f'Error: {e}')
+    sys.exit(1)
+except KeyboardInterrupt:
+    pass
+
+store = snapshots.Store(path)
+store_size = os.path.getsize(path)
+var_size = sum(os.path.getsize(p) for p in waiting.timeline_paths(args.root_dir, 'saved'))
+print(f'{path}: {len(store)} snapshots, {store_size / 2**20:.1f} MiB (saved/*.var: {var_size / 2**20:.1f} MiB).')
@@ -0,0 +1,45 @@
+"""
+Prepares the saved timeline for make resume at a given saved time.
+
+The resume rules write the new snapshots after this time, and the
+processor does not recompute the ones that are already there: resuming
+before the last saved time is refused, unless --truncate drops the
+later snapshots (in saved/*.var and in saved.snap).
+
+When the saved timeline is missing (e.g. only saved.snap has been
+copied from another machine), the snapshot of saved.snap is written back as saved/*.var files holding
+only this time, laid out as the processor writes them.
+"""
+import os
+import sys
+import argparse
+import snapshots
+import multires
+
+parser = argparse.ArgumentParser(description='Checks or restores the saved snapshot to resume from.')
+parser.add_argument('root_dir')
+parser.add_argument('at', type=int, help='saved time to resume from (RESUME_AT)')
+parser.add_argument('params', nargs='*', help='xsom name=value parameters (cache and save-trace are used)')
+parser.add_argument('--truncate', action='store_true', help='drops the snapshots saved after at')
+args = parser.parse_args()
+
+try:
+    last = snapshots.last_time(args.root_dir)
+    if last is None:
+        raise ValueError(f'No saved snapshot in {args.root_dir}')
+    if args.at > last:
+        raise ValueError(f'No snapshot saved at {args.at}, the last one is at {last}.')
+    if args.at < last:
+        if not args.truncate:
+            raise ValueError(f'Snapshots are saved up to {last}, resuming at {args.at} would keep them '
+                             f'(RESUME_TRUNCATE=1 drops the snapshots after {args.at}).')
+        snapshots.truncate(args.root_dir, args.at)
+        print(f'Snapshots after {args.at} dropped.')
+    if not os.path.exists(os.path.join(args.root_dir, 'saved')):
+        params = dict(p.split('=', 1) for p in args.params)
+        names = snapshots.restore(args.root_dir, args.at, int(params.get('cache', multires.CACHE)),
+                                  int(params.get('save-trace', multires.SAVE_TRACE)))
+        print(f'{len(names)} saved variables restored at {args.at} from {snapshots.STORE_FILE}.')
+except (KeyError, OSError, ValueError) as e:
+    print(f'Error: {e}')
+    sys.exit(1)
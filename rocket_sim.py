@@ -0,0 +1,247 @@
+"""
+Vectorized closed-loop simulation of the rocket, for comparing
+controllers.
+
+The rocket is a point mass on a vertical axis: error is the altitude
+minus the target altitude, velocity the vertical velocity. The thrust
+(0 to 15, as in the dataset) gives an acceleration gain * thrust -
+gravity. gravity and gain are not given with the dataset, they are
+fitted on the switching curve of the discrete controller of
+rocket-discrete-controller.dat, assuming it is the time optimal
+bang-bang control of that model (coasting up to the target with
+v^2 = 2 gravity |error| below it, braking down to it with
+v^2 = 2 (15 gain - gravity) error above it).
+
+All the episodes are simulated at once, one array entry per episode.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import numpy as np
+import dataset
+import thrust_table
+
+MAX_THRUST = 15.
+DT = .05
+DURATION = 60.
+BAND = 10.
+
+
+def discrete_table(data=None):
+    """
+    Returns (errors, velocities, thrust) of the dataset grid, thrust being
+    (len(errors), len(velocities)).
+    """
+    if data is None:
+        data, _ = dataset.load(verbose=False)
+    errors = np.unique(data[:, 0])
+    velocities = np.unique(data[:, 1])
+    thrust = np.zeros((len(errors), len(velocities)))
+    thrust[np.searchsorted(errors, data[:, 0]), np.searchsorted(velocities, data[:, 1])] = data[:, 2]
+    return errors, velocities, thrust
+
+
+def fit_dynamics(table=None):
+    """
+    Returns (gravity, gain) from the switching curve of the discrete table.
+    """
+    errors, velocities, thrust = table or discrete_table()
+    switch = []
+    for i, e in enumerate(errors):
+        off = np.flatnonzero(thrust[i] == 0)
+        if len(off) and off[0] > 0:
+            # Thrust is on below the switching velocity.
+            switch.append((e, (velocities[off[0] - 1] + velocities[off[0]]) / 2))
+    e, v = np.array(switch).T
+    below, above = (e < 0) & (v > 0), (e > 0) & (v < 0)
+    gravity = np.sum(v[below] ** 2 * -e[below]) / (2 * np.sum(e[below] ** 2))
+    braking = np.sum(v[above] ** 2 * e[above]) / (2 * np.sum(e[above] ** 2))
+    return float(gravity), float((braking + gravity) / MAX_THRUST)
+
+
+class TableController:
+    """
+    The original discrete controller: thrust of the closest grid point.
+    """
+    name = 'table'
+
+    def __init__(self, table=None):
+        self.errors, self.velocities, self.thrust = table or discrete_table()
+        # The grid is regular.
+        self.error_step = (self.errors[-1] - self.errors[0]) / (len(self.errors) - 1)
+        self.velocity_step = (self.velocities[-1] - self.velocities[0]) / (len(self.velocities) - 1)
+
+    def __call__(self, error, velocity):
+        i = np.clip(np.rint((error - self.errors[0]) / self.error_step), 0, len(self.errors) - 1).astype(int)
+        j = np.clip(np.rint((velocity - self.velocities[0]) / self.velocity_step), 0, len(self.velocities) - 1).astype(int)
+        return self.thrust[i, j]
+
+
+class LookupController:
+    """
+    A compiled thrust table (see thrust_table.py), interpolated.
+    """
+    def __init__(self, path):
+        self.name = f'lut:{path}'
+        self.controller = thrust_table.RocketController(path)
+
+    def __call__(self, error, velocity):
+        return self.controller.thrust_batch(error, velocity)
+
+
+class SOMController:
+    """
+    The trained maps at weights_at. By default they are evaluated once on
+    a grid_side x grid_side grid and interpolated (as a thrust table), with
+    exact=True every step is a relaxation of all the episodes.
+    """
+    def __init__(self, root_dir, weights_at, grid_side=101, exact=False, **relax_kwargs):
+        import offline_xsom
+        self.offline_xsom = offline_xsom
+        self.name = f'som:{weights_at}' + (' (exact)' if exact else '')
+        self.weights = offline_xsom.load_weights(root_dir, weights_at)
+        self.norm = dataset.load_normalization()
+        self.relax_kwargs = relax_kwargs
+        self.rng = np.random.default_rng(0)
+        self.controller = None
+        if not exact:
+            error, velocity = thrust_table.grid_inputs(grid_side)
+            thrust = offline_xsom.predict(self.weights, error, velocity, self.rng, **relax_kwargs)
+            with tempfile.TemporaryDirectory() as d:
+                path = os.path.join(d, 'som.lut')
+                thrust_table.save(path, thrust, grid_side, self.norm)
+                self.controller = thrust_table.RocketController(path)
+
+    def __call__(self, error, velocity):
+        if self.controller is not None:
+            return self.controller.thrust_batch(error, velocity)
+        n = self.norm
+        thrust = self.offline_xsom.predict(self.weights,
+                                           np.clip(dataset.normalize(error, n['error_min'], n['error_max']), 0, 1),
+                                           np.clip(dataset.normalize(velocity, n['velocity_min'], n['velocity_max']), 0, 1),
+                                           self.rng, **self.relax_kwargs)
+        return n['thrust_min'] + thrust * (n['thrust_max'] - n['thrust_min'])
+
+
+def initial_states(nb, error_range=90., velocity_range=10., seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-error_range, error_range, nb), rng.uniform(-velocity_range, velocity_range, nb)
+
+
+def simulate(controller, error, velocity, gravity, gain, dt=DT, duration=DURATION, band=BAND):
+    """
+    Runs the episodes starting at (error, velocity) arrays. Returns the
+    per episode metrics: settling time (nan if the error never stays in
+    [-band, band]), overshoot (largest error on the other side of the
+    target), and the final error.
+    """
+    e = np.array(error, dtype=float)
+    v = np.array(velocity, dtype=float)
+    e0 = e.copy()
+    nb_steps = int(round(duration / dt))
+    # Last step at which the error was out of the band.
+    last_out = np.where(np.abs(e) > band, 0, -1)
+    overshoot = np.zeros(len(e))
+    for step in range(1, nb_steps + 1):
+        thrust = np.clip(controller(e, v), 0, MAX_THRUST)
+        v += (gain * thrust - gravity) * dt
+        e += v * dt
+        last_out[np.abs(e) > band] = step
+        np.maximum(overshoot, -np.sign(e0) * e, out=overshoot)
+    settling = np.where(last_out < nb_steps, (last_out + 1) * dt, np.nan)
+    return {'settling_time': settling, 'overshoot': overshoot, 'final_error': np.abs(e)}
+
+
+def summarize(name, metrics, e0, duration, band=BAND):
+    settling = metrics['settling_time']
+    settled = ~np.isnan(settling)
+    overshoot = metrics['overshoot']
+    # Relative to the initial error, for the episodes starting out of the band.
+    far = np.abs(e0) > band
+    relative = overshoot[far] / np.abs(e0[far]) if far.any() else np.zeros(1)
+    summary = {'controller': name, 'episodes': len(settling), 'settled': float(settled.mean()),
+               'settling_time_mean': None, 'settling_time_p50': None, 'settling_time_p90': None,
+               'overshoot_mean': float(overshoot.mean()), 'overshoot_p90': float(np.percentile(overshoot, 90)),
+               'overshoot_relative_mean': float(relative.mean()),
+               'final_error_mean': float(metrics['final_error'].mean()),
+               'duration': duration, 'episodes_per_sec': len(settling) / duration}
+    if settled.any():
+        summary['settling_time_mean'] = float(settling[settled].mean())
+        summary['settling_time_p50'] = float(np.percentile(settling[settled], 50))
+        summary['settling_time_p90'] = float(np.percentile(settling[settled], 90))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs rocket episodes in closed loop with several controllers.')
+    parser.add_argument('controllers', nargs='+',
+                        help='table (discrete dataset controller), lut:<table-file>, som:<weights-at> (needs --root-dir), '
+                             'and the xsom name=value parameters used for training (the sigmas, beta, delta and deadline matter)')
+    parser.add_argument('--root-dir', default=None, help='root-dir of the saved weights, for the som controllers')
+    parser.add_argument('--episodes', type=int, default=10000)
+    parser.add_argument('--duration', type=float, default=DURATION, help=f'simulated seconds per episode (default {DURATION})')
+    parser.add_argument('--dt', type=float, default=DT)
+    parser.add_argument('--band', type=float, default=BAND, help=f'settled when |error| stays below this (default {BAND})')
+    parser.add_argument('--error-range', type=float, default=90., help='initial errors are uniform in [-range, range]')
+    parser.add_argument('--velocity-range', type=float, default=10., help='initial velocities are uniform in [-range, range]')
+    parser.add_argument('--gravity', type=float, default=None, help='default: fitted on the dataset')
+    parser.add_argument('--gain', type=float, default=None, help='acceleration per thrust unit (default: fitted on the dataset)')
+    parser.add_argument('--grid-side', type=int, default=101, help='grid on which the som controllers are evaluated')
+    parser.add_argument('--exact', action='store_true', help='relaxes the maps at every step for the som controllers (slow)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='writes the results in this JSON file')
+    args = parser.parse_args()
+    params = dict(a.split('=', 1) for a in args.controllers if '=' in a)
+    controllers = [a for a in args.controllers if '=' not in a]
+    if not controllers:
+        parser.error('no controller given')
+    import offline_xsom
+    try:
+        relax_kwargs = offline_xsom.relax_kwargs(params)
+    except ValueError as e:
+        print(f'Error: {e}')
+        sys.exit(1)
+
+    table = discrete_table()
+    gravity, gain = fit_dynamics(table)
+    gravity = args.gravity if args.gravity is not None else gravity
+    gain = args.gain if args.gain is not None else gain
+    print(f'Dynamics: acceleration = {gain:.4f} * thrust - {gravity:.4f}, dt = {args.dt}')
+
+    e0, v0 = initial_states(args.episodes, args.error_range, args.velocity_range, args.seed)
+    results = []
+    for spec in controllers:
+        kind, _, arg = spec.partition(':')
+        try:
+            if kind == 'table':
+                controller = TableController(table)
+            elif kind == 'lut':
+                controller = LookupController(arg or thrust_table.TABLE_FILE)
+            elif kind == 'som' and args.root_dir and arg:
+                controller = SOMController(args.root_dir, int(arg), args.grid_side, args.exact, **relax_kwargs)
+            else:
+                raise ValueError('som controllers need --root-dir and a saved time')
+        except (ValueError, KeyError, OSError) as e:
+            print(f'Bad controller {spec}: {e}')
+            sys.exit(1)
+        start = time.time()
+        metrics = simulate(controller, e0, v0, gravity, gain, args.dt, args.duration, args.band)
+        summary = summarize(controller.name, metrics, e0, time.time() - start, args.band)
+        results.append(summary)
+        settling = f"{summary['settling_time_p50']:.2f}s" if summary['settling_time_p50'] is not None else '-'
+        print(f"{summary['controller']:<20} settled {summary['settled']:6.1%}  settling p50 {settling:>7}  "
+              f"overshoot {summary['overshoot_mean']:6.2f} ({summary['overshoot_relative_mean']:.1%})  "
+              f"final |error| {summary['final_error_mean']:6.2f}  {summary['episodes_per_sec']:9.0f} episodes/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'gravity': gravity, 'gain': gain, 'dt': args.dt, 'duration': args.duration, 'band': args.band,
+                       'episodes': args.episodes, 'results': results}, f, indent=2)
+        print(f'Results written in {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the scripts of this directory.
+
+    rocketctl [--root-dir DIR] [--headless [--figures DIR]] <command> [args]
+
+The root-dir defaults to the content of .cxsom-rootdir-config (the one
+of the makefile) and is given to the commands that need it. As with
+make, the commands run in this directory (data/ is relative to it), so
+relative paths in their arguments are relative to it too. Only the
+script of the command is loaded, so numpy, matplotlib or tkinter are
+imported by the commands that use them and nothing else: status and
+root-dir only read the .var headers and start in a few tens of ms.
+
+With --headless, matplotlib uses the Agg backend and the figures of the
+plotting commands are saved as <command>-<n>.png instead of being shown.
+
+Install with make install-rocketctl (a symbolic link in ~/.local/bin).
+"""
+import os
+import sys
+import argparse
+import collections
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR_CONFIG = '.cxsom-rootdir-config'
+
+# Root-dir handling: 'arg' when it is the first positional argument of
+# the script, 'option' when it is given by --root-dir, None otherwise.
+Command = collections.namedtuple('Command', ['script', 'root_dir', 'plot', 'help'])
+COMMANDS = {
+    'dataset':          Command('build-rocket-dataset.py', 'arg', False, 'builds the shuffled dataset in the root-dir'),
+    'analyze':          Command('analyze_data.py', None, False, 'statistics of the raw data file'),
+    'check':            Command('check-brain.py', 'arg', False, 'checks the saved weights'),
+    'online':           Command('online.py', None, False, 'appends flight logs and feeds the training'),
+    'checkpoints':      Command('checkpoint-sweep.py', 'arg', False, 'evaluates all the saved weights offline'),
+    'pack':             Command('pack-snapshots.py', 'arg', False, 'packs the saved weights in saved.snap'),
+    'compact':          Command('compact-root-dir.py', 'arg', False, 'retention policies on the timelines'),
+    'monitor':          Command('convergence-monitor.py', 'arg', False, 'stops training when the maps converged'),
+    'dashboard':        Command('dashboard.py', 'arg', False, 'live progress of the processor'),
+    'wait':             Command('wait_stable.py', 'arg', False, 'waits for variables to be computed'),
+    'serve':            Command('controller_server.py', 'arg', False, 'serves the learned controller'),
+    'simulate':         Command('rocket_sim.py', 'option', False, 'closed-loop rocket episodes'),
+    'thrust-table':     Command('make-thrust-table.py', 'arg', False, 'builds or queries a thrust lookup table'),
+    'frames':           Command('frame-factory.py', 'arg', False, 'renders movies of the saved weights'),
+    'benchmark':        Command('benchmark.py', None, False, 'train/check/predict throughput'),
+    'sweep':            Command('sweep.py', None, False, 'parallel hyperparameter sweep'),
+    'ensemble':         Command('ensemble.py', None, False, 'concurrent trainings and ensemble prediction'),
+    'multires':         Command('multires.py', None, False, 'coarse-to-fine training and weights upsampling'),
+    'set-calibration':  Command('set-calibration.py', 'arg', False, 'sets the calibration inputs'),
+    'calibration':      Command('calibration.py', None, True, 'offline matching curves'),
+    'show-calibration': Command('show-calibration.py', 'arg', True, 'plots the processor calibration'),
+    'show-weights':     Command('show-weights-history.py', 'arg', True, 'plots the weights history'),
+    'show-predictions': Command('show-rocket-predictions.py', 'arg', True, 'plots predicted vs target thrust'),
+    'show-samples':     Command('show-samples.py', 'arg', True, 'plots the samples'),
+    'show-mapping':     Command('show-rgb-mapping.py', 'arg', True, 'interactive view of the mapping (tkinter)'),
+    'debug-weights':    Command('debug-weights.py', 'arg', False, 'dumps the weights (needs pycxsom)'),
+    'debug-vars':       Command('debug_cxsom_vars.py', 'arg', False, 'dumps the cxsom variables (needs pycxsom)'),
+}
+# These ones need a display anyway.
+INTERACTIVE = {'show-mapping'}
+
+
+def default_root_dir():
+    path = os.path.join(HERE, ROOT_DIR_CONFIG)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return os.path.normpath(os.path.join(HERE, f.read().strip()))
+
+
+def status(root_dir):
+    """
+    Last time of the variables of every timeline, from the headers only.
+    Returns 1 if the root-dir has no timeline.
+    """
+    import varfile
+    import waiting
+    timelines = sorted(d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d)))
+    if not timelines:
+        print(f'No timeline in {root_dir}.')
+        return 1
+    print(f"{'timeline':<14} {'variables':>9} {'first':>9} {'last':>9}")
+    for t in timelines:
+        times = []
+        paths = waiting.timeline_paths(root_dir, t)
+        for path in paths:
+            try:
+                times.append(varfile.read_header(path).last_time)
+            except (OSError, ValueError):
+                pass
+        first, last = (min(times), max(times)) if times else ('-', '-')
+        print(f'{t:<14} {len(paths):>9} {first:>9} {last:>9}')
+    store = os.path.join(root_dir, 'saved.snap')
+    if os.path.exists(store):
+        print(f'saved.snap: {os.path.getsize(store) / 2**20:.2f}M')
+    return 0
+
+
+def save_figures(name, directory):
+    pyplot = sys.modules.get('matplotlib.pyplot')
+    if pyplot is None:
+        return
+    import tracing
+    os.makedirs(directory, exist_ok=True)
+    for n in pyplot.get_fignums():
+        path = os.path.join(directory, f'{name}-{n}.png')
+        with tracing.stage('plot', figure=path):
+            pyplot.figure(n).savefig(path)
+        print(f'{path} written.')
+
+
+def run(name, args, root_dir, headless, figures):
+    import runpy
+    command = COMMANDS[name]
+    if command.root_dir == 'arg' and root_dir is not None:
+        args = [root_dir] + args
+    elif command.root_dir == 'option' and root_dir is not None and '--root-dir' not in args:
+        args = args + ['--root-dir', root_dir]
+    if headless:
+        if name in INTERACTIVE:
+            print(f'{name} is interactive, it cannot run headless.')
+            return 1
+        os.environ['MPLBACKEND'] = 'Agg'
+    script = os.path.join(HERE, command.script)
+    sys.argv = [script] + args
+    sys.path.insert(0, HERE)
+    if os.environ.get('ROCKET_TRACE'):
+        import tracing
+        tracing.resolve()
+    os.chdir(HERE)
+    try:
+        if headless:
+            import warnings
+            # plt.show() does nothing with Agg, the figures are saved below.
+            warnings.filterwarnings('ignore', message='.*non-interactive.*')
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            return e.code
+    if headless and command.plot:
+        save_figures(name, figures)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='rocketctl', description='Runs the rocket tools.',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='commands:\n' + '\n'.join(f'  {n:<18} {c.help}' for n, c in COMMANDS.items())
+                                     + '\n  status             last times of the timelines (headers only)'
+                                     + '\n  root-dir           prints the root-dir')
+    parser.add_argument('--root-dir', default=None, help=f'default: the content of {ROOT_DIR_CONFIG}')
+    parser.add_argument('--headless', action='store_true', help='no display, the figures are saved')
+    parser.add_argument('--figures', default='.', help='directory of the figures saved with --headless')
+    parser.add_argument('command')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    root_dir = os.path.abspath(args.root_dir) if args.root_dir else default_root_dir()
+    if args.command not in COMMANDS and args.command not in ('status', 'root-dir'):
+        parser.error(f'unknown command {args.command}')
+    needs_root_dir = args.command in ('status', 'root-dir') or COMMANDS[args.command].root_dir is not None
+    # --help is left to the script.
+    if needs_root_dir and root_dir is None and not {'-h', '--help'} & set(args.args):
+        parser.error(f'no root-dir, give --root-dir or write it in {ROOT_DIR_CONFIG}')
+    if args.command == 'root-dir':
+        print(root_dir)
+        return 0
+    if args.command == 'status':
+        return status(root_dir)
+    return run(args.command, args.args, root_dir, args.headless, os.path.abspath(args.figures))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Scratch experiment directories, with their own processor.
+
+A scratch directory mirrors the experiment directory (makefile, xsom,
+python scripts and a copy of data/) but has its own .cxsom-*-config
+files, so that the usual makefile targets can be run against its own
+root-dir, port and skednet port without touching the main experiment.
+"""
+import os
+import glob
+import time
+import shutil
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_config(name, directory=HERE):
+    with open(os.path.join(directory, f'.cxsom-{name}-config')) as f:
+        return f.read().strip()
+
+
+def read_skednet_port(directory=HERE):
+    with open(os.path.join(directory, '.skednet-port-config')) as f:
+        return int(f.read())
+
+
+def disk_usage(directory):
+    total = 0
+    for d, _, files in os.walk(directory):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(d, f))
+            except OSError:
+                pass
+    return total
+
+
+class Scratch:
+    def __init__(self, directory, port, skednet_port, nb_threads=None, xsom=None, hostname='localhost', cpus=None):
+        self.directory = os.path.abspath(directory)
+        self.port = port
+        self.skednet_port = skednet_port
+        self.hostname = hostname
+        self.nb_threads = nb_threads if nb_threads is not None else int(read_config('nbthreads'))
+        self.xsom = os.path.abspath(xsom) if xsom is not None else os.path.join(HERE, 'xsom')
+        self.root_dir = os.path.join(self.directory, 'root-dir')
+        self.log = os.path.join(self.directory, 'make.log')
+        # Cores the processor (and everything make starts) is pinned to.
+        self.cpus = set(cpus) if cpus is not None else None
+
+    def create(self):
+        os.makedirs(self.root_dir, exist_ok=True)
+        links = [os.path.join(HERE, f) for f in ['makefile', 'xsom.cpp']] + glob.glob(os.path.join(HERE, '*.py'))
+        for src in links:
+            dst = os.path.join(self.directory, os.path.basename(src))
+            if not os.path.lexists(dst):
+                os.symlink(src, dst)
+        # xsom is copied (newer than xsom.cpp) so that make never rebuilds it.
+        shutil.copy(self.xsom, os.path.join(self.directory, 'xsom'))
+        # data/ is copied since inputs-setup writes normalization_params.json in it.
+        if not os.path.exists(os.path.join(self.directory, 'data')):
+            shutil.copytree(os.path.join(HERE, 'data'), os.path.join(self.directory, 'data'))
+        venv = os.path.join(HERE, read_config('venv'))
+        configs = {'rootdir': self.root_dir, 'hostname': self.hostname, 'port': self.port,
+                   'nbthreads': self.nb_threads, 'venv': os.path.normpath(venv)}
+        for name, value in configs.items():
+            with open(os.path.join(self.directory, f'.cxsom-{name}-config'), 'w') as f:
+                f.write(f'{value}\n')
+        with open(os.path.join(self.directory, '.skednet-port-config'), 'w') as f:
+            f.write(f'{self.skednet_port}\n')
+        return self
+
+    def make(self, *targets, **variables):
+        """
+        Runs make targets in the scratch directory, output goes to make.log.
+        """
+        args = ['make', '--quiet', '-C', self.directory] + list(targets) + [f'{k}={v}' for k, v in variables.items()]
+        with open(self.log, 'a') as log:
+            log.write(f'$ {" ".join(args)}\n')
+            log.flush()
+            pin = (lambda: os.sched_setaffinity(0, self.cpus)) if self.cpus else None
+            subprocess.run(args, stdout=log, stderr=subprocess.STDOUT, check=True, preexec_fn=pin)
+
+    def launch(self):
+        self.make('cxsom-launch-processor')
+        time.sleep(1)
+
+    def kill(self):
+        try:
+            self.make('cxsom-kill-processor')
+        except subprocess.CalledProcessError:
+            pass
+
+    def path(self, timeline, varname):
+        return os.path.join(self.root_dir, timeline, varname + '.var')
+
+    def disk_usage(self):
+        return disk_usage(self.root_dir)
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -1,50 +1,87 @@
 import sys
 import pycxsom as cx
 import numpy as np
-import matplotlib.pyplot as plt
 import tkinter as tk
+import offline_xsom
+import density
+import snapshot_cache
+import tracing
+
+# Samples relaxed at once (the relaxation arrays are samples x map size).
+RELAX_CHUNK = 16384
 
 
 if len(sys.argv) < 2:
-    print(f'Usage : {sys.argv[0]} <root-dir>')
+    print(f'Usage : {sys.argv[0]} <root-dir> [name=value ...]')
+    print('  name=value are the relaxation parameters of xsom (sigma, beta, deadline...).')
     sys.exit(0)
 
 root_dir = sys.argv[1]
-    
-
-class RGBView(cx.tkviewer.At):
-    def __init__(self, master, RGB=None, figsize=(10,10), dpi=100):
-        super().__init__(master, 'RGB mapping', figsize, dpi)
-        self.R = RGB[..., 0]
-        self.G = RGB[..., 1]
-        self.B = RGB[..., 2]
-        self.COLOR = RGB
-        
+try:
+    relax_kwargs = offline_xsom.relax_kwargs(dict(p.split('=', 1) for p in sys.argv[2:]))
+except ValueError as e:
+    print(f'Error: {e}')
+    sys.exit(1)
+
+
+class MappingView(cx.tkviewer.At):
+    """
+    Target thrust, predicted thrust and prediction error over the
+    (Error, Velocity) plane, as density-binned images: all the samples
+    are used, the drawing cost only depends on the number of bins.
+
+    The binned predictions of each snapshot are cached, the neighbours of
+    the slider position are computed in the background, and the redraws
+    are coalesced while the slider is dragged.
+    """
+    def __init__(self, master, data, figsize=(15,5), dpi=100):
+        super().__init__(master, 'Thrust mapping', figsize, dpi)
+        self.error, self.velocity, self.thrust = data
+        self.bins = density.auto_bins(len(self.error))
+        self.target = density.Density(self.bins).add(self.error, self.velocity, thrust=self.thrust).mean('thrust')
+        self.cache = snapshot_cache.SnapshotCache(root_dir, self.predictions)
+        self.redraw = snapshot_cache.Coalescer(master, self.draw)
+
+    def predictions(self, root_dir, at):
+        weights = offline_xsom.load_weights(root_dir, at)
+        rng = np.random.default_rng(0)
+        grid = density.Density(self.bins)
+        for start in range(0, len(self.error), RELAX_CHUNK):
+            chunk = slice(start, start + RELAX_CHUNK)
+            pred = offline_xsom.predict(weights, self.error[chunk], self.velocity[chunk], rng, **relax_kwargs)
+            grid.add(self.error[chunk], self.velocity[chunk], prediction=pred, error=np.abs(pred - self.thrust[chunk]))
+        return grid.mean('prediction'), grid.mean('error')
+
     def on_draw_at(self, at):
+        self.cache.focus(at)
+        self.redraw.request(at)
+
+    @tracing.traced('plot')
+    def draw(self, at):
+        prediction, error = self.cache.get(at)
         self.fig.clear()
-        ax = self.fig.add_subplot(projection='3d')
-        ax.set_xlabel('R')
-        ax.set_ylabel('G')
-        ax.set_zlabel('B')
-        ax.scatter(self.R, self.G, self.B, color=self.COLOR)
-        with cx.variable.Realize(cx.variable.path_from(root_dir, 'saved', 'RGB/We-0')) as som:
-            rgb = som[at]
-            plt.plot(rgb[..., 0], rgb[..., 1], rgb[..., 2], lw=3, color='k')
-        
-
-RGB = np.fromiter((v for _,v in cx.variable.data_range_full(cx.variable.path_from(root_dir, 'img', 'rgb'))), dtype=(float, 3))
-
-# RGB is too big, let us pick up a subset of it.
-np.random.shuffle(RGB)
-RGB = RGB[:2000]
-    
+        axes = self.fig.subplots(1, 3, sharex=True, sharey=True)
+        for ax, values, title, cmap in zip(axes,
+                                           (self.target, prediction, error),
+                                           ('Target thrust', f'Predicted thrust (saved at {at})', 'Mean |error| per bin'),
+                                           ('viridis', 'viridis', 'magma')):
+            image = density.draw(ax, values, vmin=0, vmax=1, cmap=cmap)
+            ax.set_title(title)
+            ax.set_xlabel('Error')
+            self.fig.colorbar(image, ax=ax)
+        axes[0].set_ylabel('Velocity')
+        self.fig.canvas.draw_idle()
+
+
+data = offline_xsom.load_dataset(root_dir)
+
 root = tk.Tk()
 root.protocol('WM_DELETE_WINDOW', lambda : sys.exit(0))
 
-slider = cx.tkviewer.HistoryFromVariableSlider(root, 'Saved weights index', cx.variable.path_from(root_dir, 'saved', 'W/We-0'))
+slider = cx.tkviewer.HistoryFromVariableSlider(root, 'Saved weights index', cx.variable.path_from(root_dir, 'saved', 'Thrust/We-0'))
 slider.widget().pack(fill=tk.BOTH, side=tk.TOP)
 
-viewer = RGBView(root, RGB=RGB)
+viewer = MappingView(root, data)
 viewer.widget().pack(fill=tk.BOTH, side=tk.TOP)
 viewer.set_history_slider(slider)
 
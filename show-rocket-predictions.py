@@ -4,12 +4,23 @@ import os
 import pycxsom as cx
 import numpy as np
 import matplotlib.pyplot as plt
+import varfile
+import waiting
+import evaluation
+import tracing
 
 if len(sys.argv) < 2:
-    print(f'Usage : {sys.argv[0]} <root-dir>')
+    print(f'Usage : {sys.argv[0]} <root-dir> [weights-at] [name=value ...]')
+    print('  with weights-at, predictions are computed offline (no processor needed),')
+    print('  with the relaxation parameters of xsom given as name=value.')
     sys.exit(0)
 
 root_dir = sys.argv[1]
+weights_at = None
+args = [a for a in sys.argv[2:] if '=' not in a]
+params = dict(a.split('=', 1) for a in sys.argv[2:] if '=' in a)
+if args:
+    weights_at = int(args[0])
 
 def get_real_path(cx_path):
     if cx_path.endswith('.var'): return cx_path
@@ -32,54 +43,65 @@ if not os.path.exists(thrust_file_check):
     print(f"Error: {thrust_file_check} not found.")
     sys.exit(1)
 try:
-    with cx.variable.Realize(thrust_real_path) as v:
-        real_thrust_map = v[0]
+    with tracing.stage('open variable', var='img/thrust_data'), cx.variable.Realize(thrust_real_path) as v:
+        with tracing.stage('read range', var='img/thrust_data'):
+            real_thrust_map = v[0]
 except Exception as e:
     print(f"Error reading ground truth: {e}")
     sys.exit(1)
 
-# 2. Attente Fichier
-print(f"Waiting for prediction file: {pred_file_check}")
-file_ready = False
-for i in range(20):
-    if os.path.exists(pred_file_check):
-        file_ready = True
-        break
-    time.sleep(1)
-    print(".", end='', flush=True)
-print()
-
-if not file_ready:
-    print("\nError: Prediction file not created. Did you run 'make predict'?")
-    sys.exit(1)
+if weights_at is not None:
+    import offline_xsom
+    print(f"Computing predictions offline with saved weights at {weights_at}...")
+    start = time.time()
+    try:
+        kwargs = offline_xsom.relax_kwargs(params)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    weights = offline_xsom.load_weights(root_dir, weights_at)
+    error, velocity, _ = offline_xsom.load_dataset(root_dir)
+    preds = offline_xsom.predict(weights, error, velocity, **kwargs)
+    targets = np.asarray(real_thrust_map)
+    count = len(preds)
+    print(f"Success! {count} predictions computed in {time.time() - start:.2f}s.")
+else:
+    # 2. Attente Fichier
+    print(f"Waiting for prediction file: {pred_file_check}")
+    try:
+        waiting.wait_exists([pred_file_check], timeout=20)
+    except waiting.Timeout:
+        print("\nError: Prediction file not created. Did you run 'make predict'?")
+        sys.exit(1)
 
-# 3. Attente Données
-print("File found. Waiting for data...")
-with cx.variable.Realize(pred_path_var) as v_pred, cx.variable.Realize(idx_path_var) as v_idx:
-    data_ready = False
-    for i in range(20):
-        r = v_pred.time_range()
-        if r is not None and r[1] > 0: 
-            data_ready = True
-            break
-        time.sleep(0.5)
-        print("o", end='', flush=True)
-    print()
-    
-    if not data_ready:
-        print(f"Error: No data found in {pred_file_check} (time_range={r}).")
+    # 3. Attente Données
+    print("File found. Waiting for data...")
+    try:
+        waiting.wait_time([pred_file_check, get_real_path(idx_path_var)], 1, timeout=10)
+    except waiting.Timeout:
+        print(f"Error: No data found in {pred_file_check} (time_range={varfile.time_range(pred_file_check)}).")
         print("Tip: Restart the processor (make cxsom-kill-processor && make cxsom-launch-processor)")
         sys.exit(1)
 
-    count = r[1] + 1
-    print(f"Success! Reading {count} predictions.")
-    preds = np.array(v_pred[0:count])
-    idxs  = np.array(v_idx[0:count])
+    with tracing.stage('open variable', var='predict-out'), \
+         cx.variable.Realize(pred_path_var) as v_pred, cx.variable.Realize(idx_path_var) as v_idx:
+        r = v_pred.time_range()
+        count = r[1] + 1
+        print(f"Success! Reading {count} predictions.")
+        with tracing.stage('read range', var='predict-out', records=count):
+            preds = v_pred[0:count]
+            idxs  = v_idx[0:count]
+    with tracing.stage('convert', records=count):
+        preds = np.array(preds)
+        idxs  = np.array(idxs)
+    if tracing.enabled:
+        for name in ['predicted-thrust', 'index']:
+            tracing.count(f'predict-out/{name}', count, 8 * count)
+
+    # Lignes exactes avec order=rows (voir evaluation.py)
+    targets = np.asarray(real_thrust_map)[evaluation.rows(idxs, len(real_thrust_map))]
 
 # 4. Affichage
-pixel_indices = (idxs * len(real_thrust_map)).astype(int)
-pixel_indices = np.clip(pixel_indices, 0, len(real_thrust_map)-1)
-targets = real_thrust_map[pixel_indices]
 
 data = np.column_stack((targets, preds))
 data = data[data[:, 0].argsort()] # Tri
@@ -90,17 +112,19 @@ def moving_average(a, n=20):
     ret[n:] = ret[n:] - ret[:-n]
     return ret[n - 1:] / n
 
-plt.figure(figsize=(10, 6))
-plt.title(f"Rocket Thrust Prediction (Test on {count} samples)")
-plt.plot(data[:, 0], color='black', linewidth=2, label='Real Thrust (Target)')
-plt.scatter(range(len(data)), data[:, 1], color='orange', s=5, alpha=0.3, label='Predicted Samples')
-
-if len(data) > 50:
-    smoothed = moving_average(data[:, 1], n=50)
-    plt.plot(np.arange(len(smoothed)) + 25, smoothed, color='red', linewidth=2, label='Prediction Trend')
-
-plt.xlabel('Test Samples (sorted by target thrust)')
-plt.ylabel('Thrust Value (normalized)')
-plt.legend()
-plt.grid(True, alpha=0.3)
-plt.show()
\ No newline at end of file
+with tracing.stage('plot'):
+    plt.figure(figsize=(10, 6))
+    plt.title(f"Rocket Thrust Prediction (Test on {count} samples)")
+    plt.plot(data[:, 0], color='black', linewidth=2, label='Real Thrust (Target)')
+    plt.scatter(range(len(data)), data[:, 1], color='orange', s=5, alpha=0.3, label='Predicted Samples')
+
+    if len(data) > 50:
+        smoothed = moving_average(data[:, 1], n=50)
+        plt.plot(np.arange(len(smoothed)) + 25, smoothed, color='red', linewidth=2, label='Prediction Trend')
+
+    plt.xlabel('Test Samples (sorted by target thrust)')
+    plt.ylabel('Thrust Value (normalized)')
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+with tracing.stage('show'):
+    plt.show()
\ No newline at end of file
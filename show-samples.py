@@ -1,6 +1,8 @@
 import sys
-import pycxsom as cx
 import numpy as np
+import varfile
+import density
+import tracing
 import matplotlib.pyplot as plt
 
 if len(sys.argv) < 8:
@@ -18,24 +20,19 @@ frame_id = None
 if len(sys.argv) == 9:
     frame_id = int(sys.argv[8])
 
-with cx.variable.Realize(cx.variable.path_from(root_dir, w_timeline, w_varname)) as var:
-    plot_range = var.time_range()
+plot_range = varfile.time_range(varfile.path_from(root_dir, w_timeline, w_varname))
 
-# Helper function to extract scalar value from cxsom output
-# cxsom Map1D<Scalar> returns a numpy array of shape (1,) or similar for scalars in 1D maps.
-# We need to extract the float value.
-def extract_scalar(gen):
-    for _, value in gen:
-        # If value is a numpy array or list, try to get the first element
-        if hasattr(value, '__getitem__') and hasattr(value, 'size'):
-             for x in value.flat:
-                 yield float(x)
-        else:
-            yield float(value)
+# The whole history of each variable is read at once from the mmaped file.
+# Scalar variables give one value per timestep, Map1D<Scalar> variables
+# (e.g. img/*_data) give all their values, as in a flattened history.
+def read_values(timeline, varname):
+    _, values = varfile.read_history(varfile.path_from(root_dir, timeline, varname))
+    with tracing.stage('convert', var=f'{timeline}/{varname}'):
+        return np.asarray(values, dtype=float).ravel()
 
-Error = np.fromiter(extract_scalar(cx.variable.data_range_full(cx.variable.path_from(root_dir, w_timeline  , w_varname  ))), float)
-Velocity = np.fromiter(extract_scalar(cx.variable.data_range_full(cx.variable.path_from(root_dir, h_timeline  , h_varname  ))), float)
-Thrust = np.fromiter(extract_scalar(cx.variable.data_range_full(cx.variable.path_from(root_dir, rgb_timeline, rgb_varname))), float)
+Error = read_values(w_timeline, w_varname)
+Velocity = read_values(h_timeline, h_varname)
+Thrust = read_values(rgb_timeline, rgb_varname)
 
 print(f"Loaded {len(Error)} points.")
 if len(Error) > 0:
@@ -45,22 +42,30 @@ if len(Velocity) > 0:
 if len(Thrust) > 0:
     print(f"Range Thrust: {Thrust.min()}-{Thrust.max()}")
 
-plt.figure(figsize=(10,10))
+fig, ax = plt.subplots(figsize=(10,10))
 if frame_id is None:
     plt.title(f'Inputs in {plot_range}')
 plt.xlim(0,1)
 plt.ylim(0,1)
 plt.xlabel('Error')
 plt.ylabel('Velocity')
+# Les points sont agrégés sur une grille (aucun point n'est perdu, le coût
+# du tracé ne dépend pas du nombre de points) : poussée moyenne par case,
+# ou nombre de points par case sans poussée.
 if len(Error) > 0 and len(Error) == len(Velocity):
     if len(Thrust) == len(Error):
-        plt.scatter(Error, 1 - Velocity, c=Thrust, cmap='viridis')
+        grid = density.Density(density.auto_bins(len(Error))).add(Error, 1 - Velocity, thrust=Thrust)
+        image = density.draw(ax, grid.mean('thrust'), cmap='viridis')
+        plt.colorbar(image, label='Thrust (mean per bin)')
     else:
-        plt.scatter(Error, 1 - Velocity)
-plt.colorbar(label='Thrust')
+        grid = density.Density(density.auto_bins(len(Error))).add(Error, 1 - Velocity)
+        image = density.draw(ax, grid.count, log=True)
+        plt.colorbar(image, label='Samples per bin')
 if frame_id is None:
-    plt.show()
+    with tracing.stage('show'):
+        plt.show()
 else:
     filename = 'frame-{:06d}.png'.format(frame_id)
-    plt.savefig(filename, bbox_inches='tight')
+    with tracing.stage('plot'):
+        plt.savefig(filename, bbox_inches='tight')
     print(f'image "{filename}" generated.')
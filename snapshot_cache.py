@@ -0,0 +1,146 @@
+"""
+Snapshot cache for the tk history viewers.
+
+Scrubbing through the saved weights with a history slider asks for the
+same snapshots again and again, and for their neighbours next. The
+SnapshotCache keeps the last decoded snapshots in a bounded LRU, and a
+background thread loads the neighbours of the current slider position
+before they are asked for. What a snapshot decodes to is up to the
+viewer (the weights by default, or anything computed from them).
+
+The Coalescer limits the redraws while the slider is dragged: only the
+last position asked for is drawn, at most once every delay ms.
+"""
+import threading
+import collections
+import offline_xsom
+
+CAPACITY = 64
+PREFETCH = 8
+DELAY = 50
+
+
+class SnapshotCache:
+    """
+    cache.get(at) returns load(root_dir, at), from the cache when
+    possible. cache.focus(at) tells the prefetching thread where the
+    slider is.
+    """
+    def __init__(self, root_dir, load=offline_xsom.load_weights, capacity=CAPACITY, prefetch=PREFETCH):
+        self.root_dir = root_dir
+        self.load = load
+        self.capacity = capacity
+        self.prefetch = prefetch
+        self.entries = collections.OrderedDict()
+        self.loading = {}
+        self.missing = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.at = None
+        self.hits = 0
+        self.misses = 0
+        threading.Thread(target=self._prefetch, daemon=True).start()
+
+    def _lookup(self, at):
+        # With the lock held: the entry, or the event of a pending load.
+        if at in self.entries:
+            self.entries.move_to_end(at)
+            return self.entries[at], None
+        return None, self.loading.get(at)
+
+    def _store(self, at, value):
+        with self.lock:
+            self.entries[at] = value
+            self.entries.move_to_end(at)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            self.loading.pop(at).set()
+
+    def get(self, at):
+        with self.lock:
+            value, pending = self._lookup(at)
+            if pending is None and value is None:
+                self.misses += 1
+                self.loading[at] = threading.Event()
+            else:
+                self.hits += 1
+        if value is not None:
+            return value
+        if pending is not None:
+            # Being prefetched, waited for rather than loaded twice.
+            pending.wait()
+            with self.lock:
+                if at in self.entries:
+                    return self.entries[at]
+            return self.get(at)
+        try:
+            value = self.load(self.root_dir, at)
+        except BaseException:
+            with self.lock:
+                self.loading.pop(at).set()
+            raise
+        self._store(at, value)
+        return value
+
+    def focus(self, at):
+        with self.lock:
+            self.at = at
+            # Times missing before may have been saved since.
+            self.missing.clear()
+            self.wakeup.notify()
+
+    def _next(self):
+        # With the lock held: the closest neighbour of the focus that is
+        # neither cached nor loading (after first, then before).
+        if self.at is None:
+            return None
+        for d in range(1, self.prefetch + 1):
+            for t in (self.at + d, self.at - d):
+                if t >= 0 and t not in self.entries and t not in self.loading and t not in self.missing:
+                    return t
+        return None
+
+    def _prefetch(self):
+        while True:
+            with self.lock:
+                at = self._next()
+                while at is None:
+                    self.wakeup.wait()
+                    at = self._next()
+                event = self.loading[at] = threading.Event()
+            try:
+                self._store(at, self.load(self.root_dir, at))
+            except Exception:
+                # Out of the saved times, or not loadable: get() loads it
+                # again, and raises, if it is asked for.
+                with self.lock:
+                    self.missing.add(at)
+            finally:
+                # The waiters of get() are released whatever happened.
+                with self.lock:
+                    if self.loading.get(at) is event:
+                        del self.loading[at]
+                event.set()
+
+
+class Coalescer:
+    """
+    coalescer.request(at) calls draw(at) in delay ms, from the tk loop of
+    widget. Requests coming meanwhile only replace at.
+    """
+    def __init__(self, widget, draw, delay=DELAY):
+        self.widget = widget
+        self.draw = draw
+        self.delay = delay
+        self.at = None
+        self.pending = False
+
+    def request(self, at):
+        self.at = at
+        if not self.pending:
+            self.pending = True
+            self.widget.after(self.delay, self._fire)
+
+    def _fire(self):
+        self.pending = False
+        self.draw(self.at)
@@ -0,0 +1,328 @@
+"""
+Consolidated store of the saved weights.
+
+All the variables of the saved timeline (Error/We-0, Error/Wc-0, ...)
+are packed in a single file, root-dir/saved.snap by default. The file
+starts with a HEADER_SIZE bytes header (magic, then a JSON description
+of the variables, padded with spaces) followed by fixed-size records,
+one per snapshot: the saved time (int64) and the values of every
+variable, stored as float32 unless asked otherwise.
+
+Records are only appended, in increasing time order, so that the store
+can be filled while training runs and read at the same time (a
+partially written record at the end of the file is ignored). Any
+snapshot is found by a binary search on the time column of the mmap.
+"""
+import os
+import json
+import numpy as np
+import varfile
+import tracing
+
+MAGIC = b'RKTSNAP1'
+HEADER_SIZE = 4096
+STORE_FILE = 'saved.snap'
+
+# cxsom types of the weights of a map, as declared by xsom.
+WEIGHT_TYPES = {'We-0': 'Map1D<Scalar>', 'Wc-0': 'Map1D<Pos1D>', 'Wc-1': 'Map1D<Pos1D>'}
+
+
+def store_path(root_dir):
+    return os.path.join(root_dir, STORE_FILE)
+
+
+def saved_variables(root_dir):
+    """
+    Returns the sorted names of the variables of the saved timeline.
+    """
+    saved = os.path.join(root_dir, 'saved')
+    names = []
+    for d, _, files in os.walk(saved):
+        for f in files:
+            if f.endswith('.var'):
+                names.append(os.path.relpath(os.path.join(d, f[:-4]), saved).replace(os.sep, '/'))
+    return sorted(names)
+
+
+class Store:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            raw = f.read(HEADER_SIZE)
+        if len(raw) < HEADER_SIZE or raw[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a snapshot store')
+        description = json.loads(raw[len(MAGIC):].decode())
+        self.value_type = description['dtype']
+        self.variables = {name: tuple(shape) for name, shape in description['variables'].items()}
+        self.dtype = np.dtype([('time', '<i8')] + [(name, self.value_type, shape)
+                                                   for name, shape in self.variables.items()])
+        self._mmap = None
+
+    @classmethod
+    def create(cls, path, variables, value_type='<f4'):
+        """
+        variables is {name: shape}.
+        """
+        description = json.dumps({'dtype': value_type,
+                                  'variables': {name: list(shape) for name, shape in variables.items()}}).encode()
+        if len(MAGIC) + len(description) > HEADER_SIZE:
+            raise ValueError(f'Too many variables for a {HEADER_SIZE} bytes header')
+        with open(path, 'wb') as f:
+            f.write((MAGIC + description).ljust(HEADER_SIZE, b' '))
+        return cls(path)
+
+    def records(self):
+        """
+        The (read-only) records, remapped if the file has grown.
+        """
+        nb = (os.path.getsize(self.path) - HEADER_SIZE) // self.dtype.itemsize
+        if self._mmap is None or len(self._mmap) != nb:
+            if nb == 0:
+                self._mmap = np.zeros(0, dtype=self.dtype)
+            else:
+                self._mmap = np.memmap(self.path, dtype=self.dtype, mode='r', offset=HEADER_SIZE, shape=(nb,))
+        return self._mmap
+
+    def __len__(self):
+        return len(self.records())
+
+    @property
+    def times(self):
+        return self.records()['time']
+
+    def time_range(self):
+        times = self.times
+        if len(times) == 0:
+            return None
+        return (int(times[0]), int(times[-1]))
+
+    def append(self, times, values):
+        """
+        Appends the snapshots at times (increasing, after the last stored
+        one). values is {name: (len(times), ...) array}.
+        """
+        times = np.asarray(times)
+        if len(times) == 0:
+            return
+        last = self.time_range()
+        if last is not None and times[0] <= last[1]:
+            raise ValueError(f'{self.path}: time {times[0]} is already stored')
+        new = np.zeros(len(times), dtype=self.dtype)
+        new['time'] = times
+        for name in self.variables:
+            new[name] = values[name]
+        # One write, so that readers see whole records only.
+        with open(self.path, 'ab') as f:
+            f.write(new.tobytes())
+
+    def _row(self, at):
+        times = self.times
+        row = np.searchsorted(times, at)
+        if row == len(times) or times[row] != at:
+            raise KeyError(f'{self.path}: no snapshot at time {at}')
+        return row
+
+    def read_at(self, varname, at):
+        if tracing.enabled:
+            tracing.count(f'{STORE_FILE}/{varname}', 1, self.records().dtype[varname].itemsize)
+        return np.array(self.records()[self._row(at)][varname], dtype=float)
+
+    def snapshot(self, at):
+        """
+        Returns {name: value} for all the variables at time at.
+        """
+        record = self.records()[self._row(at)]
+        return {name: np.array(record[name], dtype=float) for name in self.variables}
+
+    def read_history(self, varname):
+        """
+        Returns (times, values), values being a read-only view on the mmap.
+        """
+        records = self.records()
+        if tracing.enabled:
+            tracing.count(f'{STORE_FILE}/{varname}', len(records), len(records) * records.dtype[varname].itemsize)
+        return np.array(records['time']), records[varname]
+
+
+def pack(root_dir, path=None, value_type='<f4'):
+    """
+    Appends to the store the snapshots of root-dir/saved that it does not
+    contain yet (only the times available for all the variables). The
+    store is created if needed. Returns (store, number of new snapshots).
+    """
+    path = path or store_path(root_dir)
+    names = saved_variables(root_dir)
+    if not names:
+        raise ValueError(f'No saved variables in {root_dir}')
+    histories = {name: varfile.read_history(varfile.path_from(root_dir, 'saved', name)) for name in names}
+    if os.path.exists(path):
+        store = Store(path)
+        if set(store.variables) != set(names):
+            raise ValueError(f'{path} does not hold the same variables as {root_dir}/saved')
+    else:
+        store = Store.create(path, {name: values.shape[1:] for name, (_, values) in histories.items()}, value_type)
+
+    common = None
+    for times, _ in histories.values():
+        common = times if common is None else np.intersect1d(common, times)
+    last = store.time_range()
+    if last is not None:
+        common = common[common > last[1]]
+    values = {}
+    for name, (times, history) in histories.items():
+        values[name] = history[np.searchsorted(times, common)]
+    store.append(common, values)
+    return store, len(common)
+
+
+def _store(root_dir, varname):
+    """
+    The store of root_dir if it holds varname, None otherwise.
+    """
+    path = store_path(root_dir)
+    if not os.path.exists(path):
+        return None
+    store = Store(path)
+    if varname not in store.variables:
+        return None
+    return store
+
+
+@tracing.traced('read snapshot history')
+def read_history(root_dir, varname):
+    """
+    Same as varfile.read_history for saved/<varname>, completed with the
+    times that only the store still holds. The .var values are used
+    whenever they are there, the store may hold float32 values.
+    """
+    var_path = varfile.path_from(root_dir, 'saved', varname)
+    store = _store(root_dir, varname)
+    if store is None:
+        return varfile.read_history(var_path)
+    stored_times, stored_values = store.read_history(varname)
+    if not os.path.exists(var_path):
+        return stored_times, stored_values
+    times, values = varfile.read_history(var_path)
+    older = ~np.isin(stored_times, times)
+    if not np.any(older):
+        return times, values
+    times = np.concatenate((stored_times[older], times))
+    values = np.concatenate((np.asarray(stored_values[older], dtype=float), values))
+    order = np.argsort(times, kind='stable')
+    return times[order], values[order]
+
+
+@tracing.traced('read snapshot')
+def read_at(root_dir, varname, at):
+    """
+    Same as varfile.read_at for saved/<varname>, from the store when the
+    .var file no longer holds at.
+    """
+    var_path = varfile.path_from(root_dir, 'saved', varname)
+    try:
+        return varfile.read_at(var_path, at)
+    except (KeyError, FileNotFoundError):
+        store = _store(root_dir, varname)
+        if store is None:
+            raise
+    return store.read_at(varname, at)
+
+
+def saved_times(root_dir, varnames):
+    """
+    The saved times available for all the given variables, in the .var
+    files or in the store.
+    """
+    common = None
+    for varname in varnames:
+        var_path = varfile.path_from(root_dir, 'saved', varname)
+        store = _store(root_dir, varname)
+        times = np.zeros(0, dtype=int)
+        if store is None or os.path.exists(var_path):
+            times, _ = varfile.read_history(var_path)
+        if store is not None:
+            times = np.union1d(times, store.times)
+        common = times if common is None else np.intersect1d(common, times)
+    return common
+
+
+def restore(root_dir, at, cache_size, file_size):
+    """
+    Writes the snapshot at of the store as saved/*.var files holding this
+    time only, for a resume rule to read them (the saved timeline must
+    not exist). Returns the names of the variables.
+    """
+    store = Store(store_path(root_dir))
+    snapshot = store.snapshot(at)
+    for name, value in snapshot.items():
+        datatype = f'{WEIGHT_TYPES[name.split("/")[-1]]}={len(value)}'
+        varfile.create(varfile.path_from(root_dir, 'saved', name), datatype, value, cache_size, file_size, at)
+    return sorted(snapshot)
+
+
+def last_time(root_dir):
+    """
+    Last saved time, in saved/*.var or in the store (None if none).
+    """
+    last = [varfile.read_header(varfile.path_from(root_dir, 'saved', name)).last_time
+            for name in saved_variables(root_dir)]
+    path = store_path(root_dir)
+    if os.path.exists(path) and Store(path).time_range() is not None:
+        last.append(Store(path).time_range()[1])
+    last = [t for t in last if t >= 0]
+    return max(last) if last else None
+
+
+def truncate(root_dir, at):
+    """
+    Drops the snapshots after at, in saved/*.var (the earlier records stay
+    in their slots) and in the store.
+    """
+    store = Store(store_path(root_dir)) if os.path.exists(store_path(root_dir)) else None
+    for name in saved_variables(root_dir):
+        path = varfile.path_from(root_dir, 'saved', name)
+        try:
+            varfile.truncate_after(path, at)
+        except KeyError:
+            if store is None:
+                raise
+            # Overwritten in the circular buffer, as all the earlier
+            # records: the file only holds at, from the store.
+            header = varfile.read_header(path)
+            varfile.create(path, header.datatype, store.read_at(name, at),
+                           header.cache_size, header.file_size, at)
+    if store is not None:
+        times = np.array(store.times)
+        thin(store.path, times[times <= at])
+
+
+def log_times(times, nb):
+    """
+    Picks about nb times, logarithmically spaced (dense at the beginning
+    of the training, when the weights move a lot). The first and the last
+    times are always kept.
+    """
+    times = np.asarray(times)
+    if len(times) <= nb:
+        return times
+    rows = np.unique(np.geomspace(1, len(times), nb).astype(int) - 1)
+    return np.union1d(times[rows], times[[0, -1]])
+
+
+def thin(path, times):
+    """
+    Rewrites the store with the snapshots at the given times only.
+    Returns the number of bytes freed.
+    """
+    store = Store(path)
+    records = store.records()
+    kept = records[np.isin(records['time'], times)]
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(kept.tobytes())
+    os.replace(tmp, path)
+    return size - os.path.getsize(path)
@@ -0,0 +1,133 @@
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import varfile
+import dataset
+import waiting
+import scratch
+import offline_xsom
+
+PARAMS = ['sigma', 'sigma-ctx', 'sigma-state', 'sigma-thrust', 'alpha', 'Rext', 'Rctx', 'beta', 'delta', 'deadline']
+
+print_lock = threading.Lock()
+
+
+def log(*args):
+    with print_lock:
+        print(*args, flush=True)
+
+
+def parse_grid(specs):
+    """
+    ['sigma=.05,.075', 'alpha=.1'] -> {'sigma': ['.05', '.075'], 'alpha': ['.1']}
+    """
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in PARAMS or not values:
+            raise ValueError(f'Bad parameter specification "{spec}" (names are {", ".join(PARAMS)})')
+        grid[name] = values.split(',')
+    return grid
+
+
+def run(job, args):
+    index, params, map_size = job['index'], job['params'], job['map_size']
+    name = f'job-{index:03d}'
+    sandbox = scratch.Scratch(os.path.join(args.workdir, name), args.port + index, args.skednet_port + index,
+                              args.nb_threads).create()
+    xsom_params = ' '.join(f'{k}={v}' for k, v in params.items())
+    result = dict(job, name=name, rmse=None, max_error=None, weights_at=None)
+    start = time.time()
+    try:
+        sandbox.launch()
+        sandbox.make('inputs-setup')
+        sandbox.make('train-setup', SAVE_PERIOD=args.save_period, DATA_SIZE=args.data_size,
+                     MAP_SIZE=map_size, XSOM_PARAMS=xsom_params)
+        sandbox.make('feed-train-inputs', WALLTIME=args.walltime)
+        log(f'{name}: training {xsom_params} map_size={map_size}')
+        waiting.wait_time([sandbox.path('train-out', 'Thrust/BMU')], args.walltime - 1, timeout=args.timeout)
+        # The last save may land slightly after the last training step.
+        waiting.wait_stable(waiting.timeline_paths(sandbox.root_dir, 'saved'), timeout=args.timeout)
+        result['train_duration'] = time.time() - start
+
+        saved = varfile.time_range(sandbox.path('saved', 'Thrust/We-0'))
+        result['weights_at'] = saved[1]
+        weights = offline_xsom.load_weights(sandbox.root_dir, saved[1])
+        error, velocity, thrust = offline_xsom.load_dataset(sandbox.root_dir)
+        result.update(offline_xsom.evaluate(weights, error, velocity, thrust, **offline_xsom.relax_kwargs(params)))
+
+        destination = os.path.join(args.output, name)
+        shutil.rmtree(destination, ignore_errors=True)
+        shutil.copytree(os.path.join(sandbox.root_dir, 'saved'), os.path.join(destination, 'saved'))
+        with open(os.path.join(destination, 'params.json'), 'w') as f:
+            json.dump(result, f, indent=2)
+        log(f'{name}: rmse={result["rmse"]:.4f} in {result["train_duration"]:.0f}s')
+    except Exception as e:
+        result['failure'] = str(e)
+        log(f'{name}: failed ({e}), see {sandbox.log}')
+    finally:
+        sandbox.kill()
+        # Failed jobs are kept for inspection.
+        if not args.keep and 'failure' not in result:
+            sandbox.remove()
+    return result
+
+
+parser = argparse.ArgumentParser(description='Trains a grid of hyperparameters in parallel, each job on its own processor.')
+parser.add_argument('params', nargs='*', help='name=v1,v2,... with name in ' + ', '.join(PARAMS))
+parser.add_argument('--map-size', type=int, nargs='+', default=[500])
+parser.add_argument('--nb-threads', type=int, default=1, help='processor threads per job')
+parser.add_argument('--jobs', type=int, default=None, help='parallel jobs (default: cores / nb-threads)')
+parser.add_argument('--walltime', type=int, default=30000)
+parser.add_argument('--save-period', type=int, default=1000)
+parser.add_argument('--data-size', type=int, default=None, help='default: number of samples in data/')
+parser.add_argument('--timeout', type=float, default=24 * 3600., help='maximal training duration of a job (s)')
+parser.add_argument('--workdir', default='sweep-runs')
+parser.add_argument('--output', default='sweep-results')
+parser.add_argument('--port', type=int, default=int(scratch.read_config('port')) + 200)
+parser.add_argument('--skednet-port', type=int, default=scratch.read_skednet_port() + 200)
+parser.add_argument('--keep', action='store_true', help='keeps the scratch root-dirs')
+args = parser.parse_args()
+if args.data_size is None:
+    args.data_size = dataset.nb_rows()
+
+try:
+    grid = parse_grid(args.params)
+except ValueError as e:
+    print(e)
+    sys.exit(1)
+
+names = list(grid)
+jobs = [{'index': i, 'params': dict(zip(names, values)), 'map_size': map_size}
+        for i, (map_size, values) in enumerate(itertools.product(args.map_size, itertools.product(*grid.values())))]
+nb_workers = args.jobs or max(1, (os.cpu_count() or 1) // args.nb_threads)
+print(f'{len(jobs)} jobs, {nb_workers} at a time.')
+
+os.makedirs(args.output, exist_ok=True)
+results = []
+with ThreadPoolExecutor(max_workers=nb_workers) as pool:
+    for future in as_completed([pool.submit(run, job, args) for job in jobs]):
+        results.append(future.result())
+
+results.sort(key=lambda r: (r['rmse'] is None, r['rmse'] or 0))
+with open(os.path.join(args.output, 'summary.json'), 'w') as f:
+    json.dump(results, f, indent=2)
+with open(os.path.join(args.output, 'summary.csv'), 'w', newline='') as f:
+    writer = csv.writer(f)
+    writer.writerow(['name', 'map_size'] + names + ['weights_at', 'rmse', 'max_error', 'train_duration'])
+    for r in results:
+        writer.writerow([r['name'], r['map_size']] + [r['params'][n] for n in names]
+                        + [r['weights_at'], r['rmse'], r['max_error'], r.get('train_duration')])
+
+print()
+for r in results:
+    score = f'{r["rmse"]:.4f}' if r['rmse'] is not None else 'failed'
+    print(f'{r["name"]}  map_size={r["map_size"]:<5} {" ".join(f"{k}={v}" for k, v in r["params"].items()):<40} rmse={score}')
+print(f'Results in {args.output}/summary.json and {args.output}/summary.csv')
@@ -0,0 +1,43 @@
+import os
+import sys
+import struct
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import varfile
+import snapshots
+
+
+def write_var(path, last, file_size):
+    """
+    Writes a Scalar .var file holding the value t at each time t <= last,
+    the record of t being in slot t modulo file_size, as the processor does.
+    """
+    nb = last + 1 if file_size <= 0 else min(last + 1, file_size)
+    records = np.zeros(nb, dtype=varfile.record_dtype(()))
+    for t in range(max(0, last - nb + 1), last + 1):
+        records[t % nb] = (varfile.READY, t)
+    next_free = last + 1 if file_size <= 0 else (last + 1) % file_size
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'Scalar\n'.ljust(varfile.TYPE_SIZE, b'\0'))
+        f.write(struct.pack('<4q', 2, file_size, last, next_free))
+        f.write(records.tobytes())
+
+
+@pytest.mark.parametrize('last, file_size, at', [(9, 100, 4), (9, 0, 4), (9, 10, 4), (13, 5, 11)])
+def test_truncate_keeps_earlier_snapshots(tmp_path, last, file_size, at):
+    path = varfile.path_from(str(tmp_path), 'saved', 'Map/We-0')
+    write_var(path, last, file_size)
+    before, _ = varfile.read_history(path)
+    snapshots.truncate(str(tmp_path), at)
+    header = varfile.read_header(path)
+    assert header.last_time == at
+    times, values = varfile.read_history(path)
+    assert list(times) == [t for t in before if t <= at]
+    assert list(values) == list(times)
+    # The processor goes on writing at the slot of at + 1.
+    expected = at + 1 if file_size <= 0 else (at + 1) % file_size
+    assert header.next_free == expected
+    assert varfile.read_at(path, at) == at
@@ -0,0 +1,109 @@
+"""
+Compiled Thrust lookup table, for using the learned controller in a
+control loop without any relaxation.
+
+The table holds the thrust predicted on a regular Error x Velocity grid,
+in raw (denormalized) units. The file starts with a fixed-size header
+(magic, grid sides, min/max of error, velocity and thrust) followed by
+the float32 table, table[i, j] being the thrust for the i-th error and
+the j-th velocity of the grid.
+"""
+import numpy as np
+import dataset
+
+MAGIC = b'RKTLUT1\0'
+HEADER = np.dtype([('magic', 'S8'), ('error_side', '<u4'), ('velocity_side', '<u4'),
+                   ('error_min', '<f8'), ('error_max', '<f8'),
+                   ('velocity_min', '<f8'), ('velocity_max', '<f8'),
+                   ('thrust_min', '<f8'), ('thrust_max', '<f8')])
+
+NORMALIZATION_FILE = dataset.NORMALIZATION_FILE
+TABLE_FILE = 'data/thrust-table.lut'
+
+
+def load_normalization(path=NORMALIZATION_FILE):
+    return dataset.load_normalization(path)
+
+
+def grid_inputs(side):
+    """
+    Returns the normalized (error, velocity) of the grid points, flattened
+    in table order (velocity varies first).
+    """
+    error, velocity = np.meshgrid(np.linspace(0, 1, side), np.linspace(0, 1, side), indexing='ij')
+    return error.ravel(), velocity.ravel()
+
+
+def save(path, thrust, side, norm):
+    """
+    thrust contains the normalized predictions for grid_inputs(side).
+    """
+    header = np.zeros(1, dtype=HEADER)
+    header['magic'] = MAGIC
+    header['error_side'] = side
+    header['velocity_side'] = side
+    for key in ['error_min', 'error_max', 'velocity_min', 'velocity_max', 'thrust_min', 'thrust_max']:
+        header[key] = norm[key]
+    raw = norm['thrust_min'] + np.asarray(thrust) * (norm['thrust_max'] - norm['thrust_min'])
+    with open(path, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(raw.astype('<f4').reshape(side, side).tobytes())
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    header = np.frombuffer(raw, dtype=HEADER, count=1)[0]
+    if header['magic'] != MAGIC.rstrip(b'\0'):
+        raise ValueError(f'{path} is not a thrust table')
+    shape = (int(header['error_side']), int(header['velocity_side']))
+    table = np.frombuffer(raw, dtype='<f4', offset=HEADER.itemsize).reshape(shape)
+    return header, table
+
+
+class RocketController:
+    """
+    Answers raw (error, velocity) -> thrust queries by bilinear
+    interpolation in the table. Out of range inputs are clamped.
+
+    thrust(error, velocity) is the scalar version, written in plain python
+    floats since numpy scalars are slower than that for a single query.
+    thrust_batch works on arrays.
+    """
+    def __init__(self, path=TABLE_FILE):
+        header, table = load(path)
+        self.table = table
+        self.rows = table.astype(float).tolist()
+        self.error_min = float(header['error_min'])
+        self.velocity_min = float(header['velocity_min'])
+        self.ne, self.nv = table.shape
+        self.error_scale = (self.ne - 1) / (float(header['error_max']) - self.error_min)
+        self.velocity_scale = (self.nv - 1) / (float(header['velocity_max']) - self.velocity_min)
+
+    def __call__(self, error, velocity):
+        return self.thrust(error, velocity)
+
+    def thrust(self, error, velocity):
+        x = min(max((error - self.error_min) * self.error_scale, 0.), self.ne - 1.)
+        y = min(max((velocity - self.velocity_min) * self.velocity_scale, 0.), self.nv - 1.)
+        i = min(int(x), self.ne - 2)
+        j = min(int(y), self.nv - 2)
+        fx = x - i
+        fy = y - j
+        r0 = self.rows[i]
+        r1 = self.rows[i + 1]
+        top = r0[j] + fy * (r0[j + 1] - r0[j])
+        bottom = r1[j] + fy * (r1[j + 1] - r1[j])
+        return top + fx * (bottom - top)
+
+    def thrust_batch(self, error, velocity):
+        x = np.clip((np.asarray(error, dtype=float) - self.error_min) * self.error_scale, 0, self.ne - 1)
+        y = np.clip((np.asarray(velocity, dtype=float) - self.velocity_min) * self.velocity_scale, 0, self.nv - 1)
+        i = np.minimum(x.astype(int), self.ne - 2)
+        j = np.minimum(y.astype(int), self.nv - 2)
+        fx = x - i
+        fy = y - j
+        t = self.table
+        top = t[i, j] + fy * (t[i, j + 1] - t[i, j])
+        bottom = t[i + 1, j] + fy * (t[i + 1, j + 1] - t[i + 1, j])
+        return top + fx * (bottom - top)
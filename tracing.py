@@ -0,0 +1,212 @@
+"""
+Opt-in profiling of the Python tooling.
+
+Setting ROCKET_TRACE enables it, for any script (directly, through make
+or through rocketctl):
+
+    ROCKET_TRACE=trace.json python3 check-brain.py root-dir
+    ROCKET_TRACE=1 make show-predictions      # trace-<pid>.json
+
+Scripts started by a traced script write trace-<pid>.json files of
+their own (or <name>-<pid>.json), and so do the workers of a process
+pool that call worker_init() from their initializer.
+
+The modules time named stages (open variable, read range, convert, relax,
+plot, wait...) and count the records and bytes read per variable. At
+exit, the stages are written as a Chrome trace (chrome://tracing or
+ui.perfetto.dev), the per variable counts being added under the
+"variables" key, and a summary table is printed on stderr.
+
+When ROCKET_TRACE is not set, stage() returns a shared no-op context,
+traced() returns the function itself and count() returns at once, so
+that the instrumentation costs nearly nothing.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import contextlib
+
+ENV = 'ROCKET_TRACE'
+
+enabled = bool(os.environ.get(ENV))
+
+_null = contextlib.nullcontext()
+_events = []
+_variables = {}
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+class _Stage:
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _events.append((self.name, self.category, self.start, end - self.start, threading.get_ident(), self.args))
+        return False
+
+
+def stage(name, category='stage', **args):
+    """
+    with stage('read range', var='Thrust/We-0'): ... is timed as one event.
+    """
+    if not enabled:
+        return _null
+    return _Stage(name, category, args)
+
+
+def traced(name=None, category='stage'):
+    """
+    Decorator timing every call of a function as a stage.
+    """
+    def decorate(f):
+        if not enabled:
+            return f
+        label = name or f.__qualname__
+
+        def wrapper(*args, **kwargs):
+            with _Stage(label, category, None):
+                return f(*args, **kwargs)
+        wrapper.__name__, wrapper.__qualname__, wrapper.__doc__ = f.__name__, f.__qualname__, f.__doc__
+        return wrapper
+    return decorate
+
+
+def count(variable, records, nbytes):
+    """
+    Adds a read of records records (nbytes bytes) of variable.
+    """
+    if not enabled:
+        return
+    with _lock:
+        c = _variables.setdefault(variable, [0, 0, 0])
+        c[0] += 1
+        c[1] += int(records)
+        c[2] += int(nbytes)
+
+
+def variable_name(path):
+    """
+    timeline/varname of a .var path, as counted per variable (the map
+    names, capitalized, are in varname).
+    """
+    parts = os.path.normpath(path).split(os.sep)
+    depth = 3 if len(parts) >= 3 and parts[-2][:1].isupper() else 2
+    name = '/'.join(parts[-depth:])
+    return name[:-len('.var')] if name.endswith('.var') else name
+
+
+def summary():
+    """
+    Returns ({stage: (calls, total s, max s)}, {variable: (reads, records, bytes)}).
+    """
+    stages = {}
+    for name, _, _, duration, _, _ in list(_events):
+        calls, total, longest = stages.get(name, (0, 0., 0.))
+        stages[name] = (calls + 1, total + duration, max(longest, duration))
+    with _lock:
+        variables = {name: tuple(c) for name, c in _variables.items()}
+    return stages, variables
+
+
+def chrome_trace():
+    pid = os.getpid()
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+               'args': {'name': os.path.basename(sys.argv[0]) or 'python'}}]
+    for name, category, start, duration, tid, args in list(_events):
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                 'ts': (start - _origin) * 1e6, 'dur': duration * 1e6}
+        if args:
+            event['args'] = {k: str(v) for k, v in args.items()}
+        events.append(event)
+    _, variables = summary()
+    return {'traceEvents': events, 'displayTimeUnit': 'ms',
+            'variables': {name: {'reads': r, 'records': n, 'bytes': b} for name, (r, n, b) in variables.items()}}
+
+
+def print_summary(file=sys.stderr):
+    stages, variables = summary()
+    total = time.perf_counter() - _origin
+    print(f'\n--- {ENV}: {total:.3f}s in {os.path.basename(sys.argv[0])} ---', file=file)
+    if stages:
+        print(f'{"stage":<28} {"calls":>8} {"total (s)":>10} {"mean (ms)":>10} {"max (ms)":>10} {"%":>6}', file=file)
+        for name, (calls, spent, longest) in sorted(stages.items(), key=lambda s: -s[1][1]):
+            print(f'{name:<28} {calls:>8} {spent:10.3f} {1000 * spent / calls:10.3f} {1000 * longest:10.3f} '
+                  f'{100 * spent / total:6.1f}', file=file)
+    if variables:
+        print(f'{"variable":<36} {"reads":>8} {"records":>12} {"MiB":>10}', file=file)
+        for name, (reads, records, nbytes) in sorted(variables.items(), key=lambda v: -v[1][2]):
+            print(f'{name:<36} {reads:>8} {records:>12} {nbytes / 2**20:10.2f}', file=file)
+
+
+def _default(value):
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def resolve():
+    """
+    Makes a relative ROCKET_TRACE path absolute, before a chdir.
+    """
+    value = os.environ.get(ENV, '')
+    if value and not _default(value):
+        os.environ[ENV] = os.path.abspath(value)
+
+
+def output_path():
+    value = os.environ.get(ENV, '')
+    if _default(value):
+        return f'trace-{os.getpid()}.json'
+    if os.environ.get(ENV + '_OWNER') != str(os.getpid()):
+        # Scripts started by a traced one (make, scratch processors...)
+        # do not overwrite its trace.
+        stem, ext = os.path.splitext(value)
+        return f'{stem}-{os.getpid()}{ext or ".json"}'
+    return value
+
+
+def _write(summary=True):
+    path = output_path()
+    try:
+        with open(path, 'w') as f:
+            json.dump(chrome_trace(), f)
+    except OSError as e:
+        print(f'{ENV}: cannot write {path} ({e})', file=sys.stderr)
+        path = None
+    if summary:
+        print_summary()
+    if path:
+        print(f'Trace written in {path}', file=sys.stderr)
+
+
+def worker_init():
+    """
+    To be called by the initializer of a process pool: pool workers exit
+    without running atexit, their trace is written by a multiprocessing
+    finalizer instead (without summary, the parent prints its own).
+    """
+    import multiprocessing.util
+    if not enabled or multiprocessing.parent_process() is None:
+        # Not a pool worker (e.g. the initializer called for --jobs 1).
+        return
+    # A forked worker starts with the events of its parent.
+    del _events[:]
+    with _lock:
+        _variables.clear()
+    multiprocessing.util.Finalize(None, _write, kwargs={'summary': False}, exitpriority=10)
+
+
+if enabled:
+    os.environ.setdefault(ENV + '_OWNER', str(os.getpid()))
+    atexit.register(_write)
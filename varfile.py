@@ -0,0 +1,227 @@
+"""
+Direct, memory-mapped access to the cxsom .var files.
+
+A .var file starts with a 96 bytes header: the datatype string (ending
+with '\\n', padded with zeros to 64 bytes) followed by four 64 bits
+integers (cache size, file size, last time, next free slot). Then come
+the records, each being one status byte followed by the float64 values.
+The file is a circular buffer of file-size records, so that only the
+last file-size timesteps are kept.
+
+This allows to read the whole history of a variable with one mmap call,
+without pycxsom and without iterating over the timesteps.
+
+numpy is only imported by the functions reading the records, so that
+the headers can be read by fast-starting commands (rocketctl status).
+"""
+import os
+import re
+import struct
+from math import prod
+from collections import namedtuple
+import tracing
+
+TYPE_SIZE = 64
+HEADER_SIZE = TYPE_SIZE + 4 * 8
+READY = 1
+
+Header = namedtuple('Header', ['datatype', 'shape', 'cache_size', 'file_size', 'last_time', 'next_free'])
+
+
+def path_from(root_dir, timeline, varname):
+    return os.path.join(root_dir, timeline, varname + '.var')
+
+
+def parse_datatype(datatype):
+    """
+    Returns the shape of a value of the given cxsom type, e.g. () for
+    'Scalar', (500,) for 'Map1D<Pos1D>=500', (500, 3) for 'Map1D<Array=3>=500'.
+    """
+    if datatype in ('Scalar', 'Pos1D'):
+        return ()
+    if datatype == 'Pos2D':
+        return (2,)
+    m = re.fullmatch(r'Array=(\d+)', datatype)
+    if m:
+        return (int(m.group(1)),)
+    m = re.fullmatch(r'Map([12])D<(.+)>=(\d+)', datatype)
+    if m:
+        side = int(m.group(3))
+        return (side,) * int(m.group(1)) + parse_datatype(m.group(2))
+    raise ValueError(f'Unsupported type {datatype}')
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f'{path} is not a valid .var file')
+    datatype = raw[:TYPE_SIZE].split(b'\n')[0].decode()
+    cache_size, file_size, last_time, next_free = struct.unpack_from('<4q', raw, TYPE_SIZE)
+    return Header(datatype, parse_datatype(datatype), cache_size, file_size, last_time, next_free)
+
+
+def record_dtype(shape):
+    import numpy as np
+    return np.dtype([('status', 'u1'), ('value', '<f8', shape)])
+
+
+@tracing.traced('open variable')
+def _records(path, header):
+    import numpy as np
+    dtype = record_dtype(header.shape)
+    nb = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if nb == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(nb,))
+
+
+def time_range(path):
+    """
+    Same as pycxsom's time_range: (first, last) available times, or None.
+    """
+    header = read_header(path)
+    # Same as len(_records(...)), without numpy.
+    record_size = 1 + 8 * prod(header.shape)
+    nb = (os.path.getsize(path) - HEADER_SIZE) // record_size
+    if nb == 0 or header.last_time < 0:
+        return None
+    return (header.last_time - nb + 1, header.last_time)
+
+
+@tracing.traced('read range')
+def read_history(path, ready_only=True):
+    """
+    Returns (times, values) for all the timesteps stored in the file,
+    values being a (T, ...) array. When the circular buffer has not
+    wrapped yet, values is a read-only view on the mmap (no copy).
+    """
+    import numpy as np
+    header = read_header(path)
+    records = _records(path, header)
+    nb = len(records)
+    if nb == 0 or header.last_time < 0:
+        return np.zeros(0, dtype=int), np.zeros((0,) + header.shape)
+    if nb == header.file_size and header.next_free % nb != 0:
+        # The buffer has wrapped, the oldest record is at next_free.
+        start = header.next_free % nb
+        records = np.concatenate((records[start:], records[:start]))
+    times = np.arange(header.last_time - nb + 1, header.last_time + 1)
+    if tracing.enabled:
+        tracing.count(tracing.variable_name(path), nb, records.nbytes)
+    if ready_only:
+        ready = records['status'] == READY
+        if not np.all(ready):
+            return times[ready], records['value'][ready]
+    return times, records['value']
+
+
+@tracing.traced('read at')
+def read_at(path, at):
+    """
+    Returns a copy of the value stored at time at.
+    """
+    import numpy as np
+    header = read_header(path)
+    records = _records(path, header)
+    nb = len(records)
+    first = header.last_time - nb + 1
+    if nb == 0 or not first <= at <= header.last_time:
+        raise KeyError(f'{path}: no data at time {at}')
+    slot = (header.next_free - 1 - (header.last_time - at)) % nb
+    if records[slot]['status'] != READY:
+        raise KeyError(f'{path}: data at time {at} is not ready')
+    if tracing.enabled:
+        tracing.count(tracing.variable_name(path), 1, records.dtype.itemsize)
+    return np.array(records[slot]['value'])
+
+
+def keep_last(path, nb_kept):
+    """
+    Rewrites the file so that only its last nb_kept timesteps remain, in
+    time order as in a buffer that has not wrapped yet. Returns the number
+    of bytes freed. The records are no longer at the slots of their times
+    (time modulo file size): only this module reads the file correctly,
+    the processor and pycxsom must not reopen it.
+    """
+    import numpy as np
+    if nb_kept < 1:
+        raise ValueError('At least one timestep has to be kept')
+    header = read_header(path)
+    records = _records(path, header)
+    nb = len(records)
+    if nb <= nb_kept or header.last_time < 0:
+        return 0
+    if nb == header.file_size and header.next_free % nb != 0:
+        start = header.next_free % nb
+        records = np.concatenate((records[start:], records[:start]))
+    kept = np.array(records[nb - nb_kept:])
+    with open(path, 'rb') as f:
+        datatype = f.read(TYPE_SIZE)
+    size = os.path.getsize(path)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(datatype)
+        f.write(struct.pack('<4q', header.cache_size, header.file_size, header.last_time, nb_kept))
+        f.write(kept.tobytes())
+    os.replace(tmp, path)
+    return size - os.path.getsize(path)
+
+
+def create(path, datatype, value, cache_size, file_size, at=0):
+    """
+    Writes a new .var file of type datatype, holding value at time at
+    (the earlier times being not ready), as the processor would have
+    written it (e.g. weights to be copied by a resume rule): the record
+    of time t is in slot t modulo file size. The cache and file sizes have
+    to be the ones declared by the rules.
+    """
+    import numpy as np
+    shape = parse_datatype(datatype)
+    nb = at + 1 if file_size <= 0 else min(at + 1, file_size)
+    records = np.zeros(nb, dtype=record_dtype(shape))
+    records[at % nb]['status'] = READY
+    records[at % nb]['value'] = np.asarray(value, dtype=float).reshape(shape)
+    next_free = at + 1 if file_size <= 0 else (at + 1) % file_size
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write((datatype + '\n').encode().ljust(TYPE_SIZE, b'\0'))
+        f.write(struct.pack('<4q', cache_size, file_size, at, next_free))
+        f.write(records.tobytes())
+    os.replace(tmp, path)
+
+
+def truncate_after(path, at):
+    """
+    Drops the timesteps after at, as if the processor had stopped at at:
+    the records of the earlier times stay in their slots, the later ones
+    are no longer ready (or cut off when the buffer has not wrapped yet).
+    Raises KeyError when at is no longer in the file.
+    """
+    import numpy as np
+    header = read_header(path)
+    records = np.array(_records(path, header))
+    nb = len(records)
+    first = header.last_time - nb + 1
+    if nb == 0 or not first <= at <= header.last_time:
+        raise KeyError(f'{path}: no data at time {at}')
+    if at == header.last_time:
+        return
+    dropped = header.last_time - at
+    if nb == header.file_size and header.next_free % nb != 0:
+        # Wrapped buffer: the slots of the dropped times become free.
+        next_free = (header.next_free - dropped) % nb
+        for k in range(dropped):
+            records[(next_free + k) % nb]['status'] = 0
+    else:
+        records = records[:nb - dropped]
+        next_free = len(records) if header.file_size <= 0 else len(records) % header.file_size
+    with open(path, 'rb') as f:
+        datatype = f.read(TYPE_SIZE)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(datatype)
+        f.write(struct.pack('<4q', header.cache_size, header.file_size, at, next_free))
+        f.write(records.tobytes())
+    os.replace(tmp, path)
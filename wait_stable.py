@@ -1,27 +1,34 @@
-import os
 import sys
-import time
-import pycxsom as cx
+import argparse
+import varfile
+import waiting
 
+parser = argparse.ArgumentParser(description='Waits for the processor to fill variables.')
+parser.add_argument('root_dir')
+parser.add_argument('timeline')
+parser.add_argument('varnames', nargs='*', help='variables to wait for (all the timeline variables if none)')
+parser.add_argument('--at', type=int, default=None, help='waits until the variables have reached this time, instead of waiting for them to stop growing')
+parser.add_argument('--quiet', type=float, default=.5, help='seconds without any change for variables to be considered as stable (default .5)')
+parser.add_argument('--timeout', type=float, default=None, help='gives up after this many seconds (exit code 1)')
+parser.add_argument('--silent', action='store_true', help='no progress output')
+args = parser.parse_args()
 
-if len(sys.argv) != 4:
-    print()
-    print('Usage:')
-    print('  {} <root_dir> <timeline> <varname>'.format(sys.argv[0]))
-    print()
-    sys.exit(0)
-    
-root_dir = sys.argv[1]
-timeline = sys.argv[2]
-varname  = sys.argv[3]
+if args.varnames:
+    paths = [varfile.path_from(args.root_dir, args.timeline, name) for name in args.varnames]
+else:
+    paths = waiting.timeline_paths(args.root_dir, args.timeline)
+    if not paths:
+        print(f'No variables found in {args.root_dir}/{args.timeline}.')
+        sys.exit(1)
 
-path = str(cx.variable.path_from(root_dir, timeline, varname))
-file_size = None
-while True:
-    time.sleep(1.0)
-    s = os.stat(path).st_size
-    if s == file_size:
-        break
-    file_size = s
-
-    
+progress = None if args.silent else waiting.print_progress(paths)
+try:
+    if args.at is None:
+        elapsed = waiting.wait_stable(paths, args.quiet, args.timeout, progress)
+    else:
+        elapsed = waiting.wait_time(paths, args.at, args.timeout, progress)
+except waiting.Timeout as e:
+    print(e)
+    sys.exit(1)
+if not args.silent:
+    print(f'{args.timeline}: {len(paths)} variable(s) ready after {elapsed:.2f}s.')
@@ -0,0 +1,182 @@
+"""
+Waiting for the processor to fill variables, without sleep-polling.
+
+The directories of the watched variables are monitored with inotify
+(through ctypes, Linux only), so that the waiting functions wake up as
+soon as a file is written. When inotify is not available, a short
+polling period is used instead. Files are checked at least every
+MAX_SLEEP seconds anyway, in case some writes are not notified.
+"""
+import os
+import sys
+import time
+import select
+import ctypes
+import ctypes.util
+import varfile
+import tracing
+
+POLL_PERIOD = .05
+MAX_SLEEP = 1.
+
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_NONBLOCK    = os.O_NONBLOCK
+IN_CLOEXEC     = os.O_CLOEXEC
+
+
+class Timeout(Exception):
+    pass
+
+
+def _libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError, TypeError):
+        return None
+
+
+class Watcher:
+    """
+    Context manager telling when something happened in a set of
+    directories. wait(timeout) returns once an event is received (or
+    after POLL_PERIOD if inotify is not available).
+    """
+    def __init__(self, dirs):
+        self.dirs = set(dirs)
+        self.fd = -1
+        self.watched = set()
+        libc = _libc()
+        if libc is not None:
+            self.libc = libc
+            self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+
+    def __enter__(self):
+        self.add_dirs()
+        return self
+
+    def __exit__(self, *args):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_dirs(self):
+        # Directories may not exist yet, they are added as soon as they do.
+        if self.fd < 0:
+            return
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        for d in self.dirs - self.watched:
+            existing = d
+            while not os.path.isdir(existing):
+                existing = os.path.dirname(existing) or '.'
+            if self.libc.inotify_add_watch(self.fd, existing.encode(), mask) >= 0 and existing == d:
+                self.watched.add(d)
+
+    def wait(self, timeout):
+        if self.fd < 0:
+            time.sleep(min(timeout, POLL_PERIOD))
+            return True
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        self.add_dirs()
+        return True
+
+
+def timeline_paths(root_dir, timeline):
+    """
+    Returns the paths of all the .var files of a timeline.
+    """
+    paths = []
+    for d, _, files in os.walk(os.path.join(root_dir, timeline)):
+        paths += [os.path.join(d, f) for f in files if f.endswith('.var')]
+    return sorted(paths)
+
+
+def _state(path):
+    try:
+        return os.path.getsize(path), varfile.read_header(path).last_time
+    except (OSError, ValueError):
+        return None
+
+
+@tracing.traced('wait')
+def _wait(paths, done, timeout, progress):
+    start = time.time()
+    with Watcher(os.path.dirname(p) for p in paths) as watcher:
+        while True:
+            status = done()
+            if progress:
+                progress(status)
+            if status is True:
+                return time.time() - start
+            sleep = MAX_SLEEP if status is False else min(MAX_SLEEP, status)
+            if timeout is not None:
+                remaining = start + timeout - time.time()
+                if remaining <= 0:
+                    raise Timeout(f'Timeout after {timeout}s while waiting for {len(paths)} variable(s).')
+                sleep = min(sleep, remaining)
+            watcher.wait(sleep)
+
+
+def wait_exists(paths, timeout=None, progress=None):
+    """
+    Waits for all the files to exist.
+    """
+    def done():
+        return all(os.path.exists(p) for p in paths)
+    return _wait(paths, done, timeout, progress)
+
+
+def wait_time(paths, at, timeout=None, progress=None):
+    """
+    Waits until all the variables have a value at time at (or later).
+    """
+    def done():
+        for p in paths:
+            s = _state(p)
+            if s is None or s[1] < at:
+                return False
+        return True
+    return _wait(paths, done, timeout, progress)
+
+
+def wait_stable(paths, quiet=.5, timeout=None, progress=None):
+    """
+    Waits until none of the variables has changed (size and last time)
+    for quiet seconds. Missing files are waited for.
+    """
+    last = {'states': None, 'since': None}
+
+    def done():
+        states = [_state(p) for p in paths]
+        now = time.time()
+        if None in states or states != last['states']:
+            last['states'], last['since'] = states, now
+            return quiet if None not in states else False
+        elapsed = now - last['since']
+        return True if elapsed >= quiet else quiet - elapsed
+    return _wait(paths, done, timeout, progress)
+
+
+def print_progress(paths):
+    """
+    Returns a progress callback printing the last times of the variables.
+    """
+    def progress(status):
+        times = [s[1] if s is not None else None for s in map(_state, paths)]
+        known = [t for t in times if t is not None]
+        low = min(known) if known else None
+        print(f'\r{len(known)}/{len(paths)} variables, last time >= {low}   ', end='', flush=True, file=sys.stderr)
+        if status is True:
+            print(file=sys.stderr)
+    return progress
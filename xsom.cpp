@@ -11,9 +11,11 @@
 
 #include <cxsom-builder.hpp>
 #include <fstream>
+#include <iostream>
 #include <iterator>
 #include <sstream>
 #include <tuple>
+#include <vector>
 
 #define CACHE 2
 #define SAVE_TRACE 1000
@@ -29,7 +31,16 @@
 using namespace cxsom::rules;
 context *cxsom::rules::ctx = nullptr;
 
-enum class Mode : char { Calibration, Input, Train, Check, Predict, Walltime };
+enum class Mode : char {
+  Calibration,
+  Input,
+  Train,
+  Check,
+  Predict,
+  Grid,
+  Resume,
+  Walltime
+};
 
 // ####################
 // #                  #
@@ -37,8 +48,92 @@ enum class Mode : char { Calibration, Input, Train, Check, Predict, Walltime };
 // #                  #
 // ####################
 
-#define Rext .05
-#define Rctx .003
+// Default values, they can be overridden from the command line by
+// name=value arguments following the mode arguments (see main).
+struct Hyperparams {
+  double sigma_ctx = .075;
+  double sigma_state = .075;
+  double sigma_thrust = .075;
+  double alpha = .1;
+  double Rext = .05;
+  double Rctx = .003;
+  double beta = .5;
+  double delta = .02;
+  unsigned int deadline = DEADLINE;
+
+  // Storage: cache size and number of timesteps kept on disk (trace)
+  // by the variables. trace is the one of the relaxation and output
+  // variables of the training (0 keeps the cxsom default).
+  unsigned int cache = CACHE;
+  unsigned int save_trace = SAVE_TRACE;
+  unsigned int train_trace = TRAIN_TRACE;
+  unsigned int trace = 0;
+
+  // Order of the rows evaluated by check and predict: random (drawn
+  // with replacement by the processor), or rows (the index variable is
+  // written by evaluation.py, each row of a shard exactly once).
+  bool random_order = true;
+
+  // Inputs of the training: random rows of the img data (drawn by the
+  // processor), or client (the train-in inputs have no rule, they are
+  // written by online.py from a dataset that may grow meanwhile).
+  bool random_feed = true;
+};
+
+Hyperparams hp;
+
+// Removes the name=value arguments from args, and sets hp
+// accordingly. sigma sets the three matching widths at once.
+bool parse_hyperparams(std::vector<std::string> &args) {
+  std::vector<std::string> remaining;
+  for (const auto &arg : args) {
+    auto eq = arg.find('=');
+    if (eq == std::string::npos) {
+      remaining.push_back(arg);
+      continue;
+    }
+    std::string name = arg.substr(0, eq);
+    std::string value = arg.substr(eq + 1);
+    if (name == "sigma")
+      hp.sigma_ctx = hp.sigma_state = hp.sigma_thrust = stod(value);
+    else if (name == "sigma-ctx")
+      hp.sigma_ctx = stod(value);
+    else if (name == "sigma-state")
+      hp.sigma_state = stod(value);
+    else if (name == "sigma-thrust")
+      hp.sigma_thrust = stod(value);
+    else if (name == "alpha")
+      hp.alpha = stod(value);
+    else if (name == "Rext")
+      hp.Rext = stod(value);
+    else if (name == "Rctx")
+      hp.Rctx = stod(value);
+    else if (name == "beta")
+      hp.beta = stod(value);
+    else if (name == "delta")
+      hp.delta = stod(value);
+    else if (name == "deadline")
+      hp.deadline = stoul(value);
+    else if (name == "cache")
+      hp.cache = stoul(value);
+    else if (name == "save-trace")
+      hp.save_trace = stoul(value);
+    else if (name == "train-trace")
+      hp.train_trace = stoul(value);
+    else if (name == "trace")
+      hp.trace = stoul(value);
+    else if (name == "order" && (value == "random" || value == "rows"))
+      hp.random_order = value == "random";
+    else if (name == "feed" && (value == "random" || value == "client"))
+      hp.random_feed = value == "random";
+    else {
+      std::cout << "Unknown parameter " << name << std::endl;
+      return false;
+    }
+  }
+  args = remaining;
+  return true;
+}
 
 struct Params {
   kwd::parameters main, match_ctx, match_state, match_thrust, learn,
@@ -48,30 +143,32 @@ struct Params {
   Params() {
     main | kwd::use("walltime", FOREVER), kwd::use("epsilon", 0);
 
-    match_ctx | main, kwd::use("sigma", .075);
+    match_ctx | main, kwd::use("sigma", hp.sigma_ctx);
 
-    match_state | main, kwd::use("sigma", .075);
-    match_thrust | main, kwd::use("sigma", .075);
+    match_state | main, kwd::use("sigma", hp.sigma_state);
+    match_thrust | main, kwd::use("sigma", hp.sigma_thrust);
 
-    learn | main, kwd::use("alpha", .1);
+    learn | main, kwd::use("alpha", hp.alpha);
 
-    learn_state_e | learn, kwd::use("r", Rext);
-    learn_state_c | learn, kwd::use("r", Rctx);
-    learn_thrust_e | learn, kwd::use("r", Rext);
-    learn_thrust_c | learn, kwd::use("r", Rctx);
+    learn_state_e | learn, kwd::use("r", hp.Rext);
+    learn_state_c | learn, kwd::use("r", hp.Rctx);
+    learn_thrust_e | learn, kwd::use("r", hp.Rext);
+    learn_thrust_c | learn, kwd::use("r", hp.Rctx);
 
     external | main;
     contextual | main;
-    global | main, kwd::use("random-bmu", 1), kwd::use("beta", .5),
-        kwd::use("delta", .02), kwd::use("deadline", DEADLINE);
+    global | main, kwd::use("random-bmu", 1), kwd::use("beta", hp.beta),
+        kwd::use("delta", hp.delta), kwd::use("deadline", hp.deadline);
   }
 };
 
 auto make_map_settings(const Params &p, unsigned int map_size) {
   auto map_settings = cxsom::builder::map::make_settings();
   map_settings.map_size = map_size;
-  map_settings.cache_size = CACHE;
-  map_settings.weights_file_size = TRAIN_TRACE;
+  map_settings.cache_size = hp.cache;
+  map_settings.weights_file_size = hp.train_trace;
+  if (hp.trace > 0)
+    map_settings.file_size = hp.trace;
   map_settings.kept_opened = OPENED;
   map_settings = {p.external, p.contextual, p.global};
   map_settings.argmax = fx::argmax;
@@ -84,12 +181,12 @@ auto make_map_settings(const Params &p, unsigned int map_size) {
 auto rocket_inputs(const std::string &timeline, unsigned int trace,
                    bool to_be_defined) {
   auto ERR = cxsom::builder::variable(timeline, cxsom::builder::name("error"),
-                                      "Scalar", CACHE, trace, OPENED);
+                                      "Scalar", hp.cache, trace, OPENED);
   auto VEL =
       cxsom::builder::variable(timeline, cxsom::builder::name("velocity"),
-                               "Scalar", CACHE, trace, OPENED);
+                               "Scalar", hp.cache, trace, OPENED);
   auto THR = cxsom::builder::variable(timeline, cxsom::builder::name("thrust"),
-                                      "Scalar", CACHE, trace, OPENED);
+                                      "Scalar", hp.cache, trace, OPENED);
   if (to_be_defined) {
     ERR->definition();
     VEL->definition();
@@ -182,8 +279,16 @@ void make_input_rules(unsigned int data_size) {
 // #             #
 // ###############
 
+// When resume_at >= 0, training restarts from the weights saved at
+// resume_at instead of random weights. The train-* timelines start again
+// at time 0 (they have to be cleared), train-wgt at 0 being the saved
+// weights, i.e. the weights at resume_at * save_period in the original
+// time. The snapshots keep on being written in the saved timeline, at
+// resume_at + 1, resume_at + 2, ... up to the last one of a walltime
+// long training.
 void make_train_rules(unsigned int save_period, unsigned int data_size,
-                      unsigned int map_size) {
+                      unsigned int map_size, int resume_at = -1,
+                      unsigned int walltime = 0) {
 
   Params p;
   auto map_settings = make_map_settings(p, map_size);
@@ -191,7 +296,7 @@ void make_train_rules(unsigned int save_period, unsigned int data_size,
   auto archi = cxsom::builder::architecture();
   archi->timelines = {"train-wgt", "train-rlx", "train-out"};
 
-  auto [ERR, VEL, THR] = rocket_inputs("train-in", TRAIN_TRACE, true);
+  auto [ERR, VEL, THR] = rocket_inputs("train-in", hp.train_trace, true);
 
   std::vector<cxsom::builder::Map::Layer *> layers;
   auto out_layer = std::back_inserter(layers);
@@ -224,8 +329,9 @@ void make_train_rules(unsigned int save_period, unsigned int data_size,
   archi << ERRmap << VELmap << THRmap;
   *archi = map_settings;
 
-  for (auto map : archi->maps)
-    map->internals_random_at(0);
+  if (resume_at < 0)
+    for (auto map : archi->maps)
+      map->internals_random_at(0);
 
   archi->realize();
   {
@@ -234,38 +340,56 @@ void make_train_rules(unsigned int save_period, unsigned int data_size,
   }
 
   // --- ALIMENTATION ---
-  std::string data_map_type =
-      std::string("Map1D<Scalar>=") + std::to_string(data_size);
-
-  auto FILE_ERR = cxsom::builder::variable(
-      "img", cxsom::builder::name("error_data"), data_map_type, 1, 1, OPENED);
-  auto FILE_VEL =
-      cxsom::builder::variable("img", cxsom::builder::name("velocity_data"),
-                               data_map_type, 1, 1, OPENED);
-  auto FILE_THR = cxsom::builder::variable(
-      "img", cxsom::builder::name("thrust_data"), data_map_type, 1, 1, OPENED);
-
-  auto INDEX =
-      cxsom::builder::variable("train-in", cxsom::builder::name("index"),
-                               "Pos1D", CACHE, TRAIN_TRACE, OPENED);
-  INDEX->definition();
-  INDEX->var() << fx::random() | kwd::use("walltime", 0);
-
-  ERR->var() << fx::value_at(kwd::at(FILE_ERR->var(), 0), INDEX->var()) |
-      kwd::use("walltime", FOREVER);
-  VEL->var() << fx::value_at(kwd::at(FILE_VEL->var(), 0), INDEX->var()) |
-      kwd::use("walltime", FOREVER);
-  THR->var() << fx::value_at(kwd::at(FILE_THR->var(), 0), INDEX->var()) |
-      kwd::use("walltime", FOREVER);
+  // With feed=client, ERR, VEL and THR are written by online.py.
+  if (hp.random_feed) {
+    std::string data_map_type =
+        std::string("Map1D<Scalar>=") + std::to_string(data_size);
+
+    auto FILE_ERR =
+        cxsom::builder::variable("img", cxsom::builder::name("error_data"),
+                                 data_map_type, 1, 1, OPENED);
+    auto FILE_VEL =
+        cxsom::builder::variable("img", cxsom::builder::name("velocity_data"),
+                                 data_map_type, 1, 1, OPENED);
+    auto FILE_THR =
+        cxsom::builder::variable("img", cxsom::builder::name("thrust_data"),
+                                 data_map_type, 1, 1, OPENED);
+
+    auto INDEX =
+        cxsom::builder::variable("train-in", cxsom::builder::name("index"),
+                                 "Pos1D", hp.cache, hp.train_trace, OPENED);
+    INDEX->definition();
+    INDEX->var() << fx::random() | kwd::use("walltime", 0);
+
+    ERR->var() << fx::value_at(kwd::at(FILE_ERR->var(), 0), INDEX->var()) |
+        kwd::use("walltime", FOREVER);
+    VEL->var() << fx::value_at(kwd::at(FILE_VEL->var(), 0), INDEX->var()) |
+        kwd::use("walltime", FOREVER);
+    THR->var() << fx::value_at(kwd::at(FILE_THR->var(), 0), INDEX->var()) |
+        kwd::use("walltime", FOREVER);
+  }
 
   // --- SAUVEGARDE ---
   for (auto layer_ptr : layers) {
     auto W = layer_ptr->_W();
-    auto Wsaved = cxsom::builder::variable("saved", W->varname, W->type, CACHE,
-                                           SAVE_TRACE, OPEN_AS_NEEDED);
+    auto Wsaved =
+        cxsom::builder::variable("saved", W->varname, W->type, hp.cache,
+                                 hp.save_trace, OPEN_AS_NEEDED);
     Wsaved->definition();
-    Wsaved->var() << fx::copy(kwd::times(W->var(), save_period)) |
-        kwd::use("walltime", FOREVER);
+    if (resume_at < 0) {
+      Wsaved->var() << fx::copy(kwd::times(W->var(), save_period)) |
+          kwd::use("walltime", FOREVER);
+      continue;
+    }
+
+    // Reprise : les poids initiaux sont ceux sauvegardés à resume_at.
+    kwd::at(W->var(), 0) << fx::copy(kwd::at(Wsaved->var(), resume_at)) |
+        p.main;
+    unsigned int start = resume_at * save_period;
+    for (unsigned int t = start + save_period; t < walltime; t += save_period)
+      kwd::at(Wsaved->var(), t / save_period)
+          << fx::copy(kwd::at(W->var(), t - start)) |
+          p.main;
   }
 }
 
@@ -299,22 +423,22 @@ void make_check_rules(unsigned int saved_weight_at, unsigned int data_size,
   // Poids Contextuels (Wc) = Type POS1D
   auto ERR_c0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Error") / cxsom::builder::name("Wc-0"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto ERR_c1 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Error") / cxsom::builder::name("Wc-1"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto VEL_c0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Velocity") / cxsom::builder::name("Wc-0"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto VEL_c1 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Velocity") / cxsom::builder::name("Wc-1"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto THR_c0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Thrust") / cxsom::builder::name("Wc-0"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto THR_c1 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Thrust") / cxsom::builder::name("Wc-1"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
 
   ERRmap->contextual(VELmap, fx::match_gaussian, p.match_ctx, ERR_c0,
                      saved_weight_at);
@@ -330,11 +454,11 @@ void make_check_rules(unsigned int saved_weight_at, unsigned int data_size,
                      saved_weight_at);
 
   auto ERR = cxsom::builder::variable("img", cxsom::builder::name("error"),
-                                      "Scalar", CACHE, trace, OPENED);
+                                      "Scalar", hp.cache, trace, OPENED);
   auto VEL = cxsom::builder::variable("img", cxsom::builder::name("velocity"),
-                                      "Scalar", CACHE, trace, OPENED);
+                                      "Scalar", hp.cache, trace, OPENED);
   auto THR = cxsom::builder::variable("img", cxsom::builder::name("thrust"),
-                                      "Scalar", CACHE, trace, OPENED);
+                                      "Scalar", hp.cache, trace, OPENED);
   ERR->definition();
   VEL->definition();
   THR->definition();
@@ -351,9 +475,10 @@ void make_check_rules(unsigned int saved_weight_at, unsigned int data_size,
 
   auto INDEX =
       cxsom::builder::variable("check-out", cxsom::builder::name("index"),
-                               "Pos1D", CACHE, trace, OPENED);
+                               "Pos1D", hp.cache, trace, OPENED);
   INDEX->definition();
-  INDEX->var() << fx::random() | kwd::use("walltime", data_size);
+  if (hp.random_order)
+    INDEX->var() << fx::random() | kwd::use("walltime", data_size);
 
   ERR->var() << fx::value_at(kwd::at(FILE_ERR->var(), 0), INDEX->var()) |
       kwd::use("walltime", FOREVER);
@@ -365,13 +490,13 @@ void make_check_rules(unsigned int saved_weight_at, unsigned int data_size,
   // Poids Externes (We) = Type SCALAR
   auto ERR_e0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Error") / cxsom::builder::name("We-0"),
-      scalar_map_type, CACHE, trace, OPENED);
+      scalar_map_type, hp.cache, trace, OPENED);
   auto VEL_e0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Velocity") / cxsom::builder::name("We-0"),
-      scalar_map_type, CACHE, trace, OPENED);
+      scalar_map_type, hp.cache, trace, OPENED);
   auto THR_e0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Thrust") / cxsom::builder::name("We-0"),
-      scalar_map_type, CACHE, trace, OPENED);
+      scalar_map_type, hp.cache, trace, OPENED);
 
   ERRmap->external(ERR, fx::match_gaussian, p.match_state, ERR_e0,
                    saved_weight_at) |
@@ -431,44 +556,44 @@ void make_predict_rules(unsigned int saved_weight_at, unsigned int data_size,
   // Poids Contextuels (Wc) = Type POS1D
   auto ERR_c0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Error") / cxsom::builder::name("Wc-0"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto ERR_c1 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Error") / cxsom::builder::name("Wc-1"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto VEL_c0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Velocity") / cxsom::builder::name("Wc-0"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto VEL_c1 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Velocity") / cxsom::builder::name("Wc-1"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto THR_c0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Thrust") / cxsom::builder::name("Wc-0"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
   auto THR_c1 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Thrust") / cxsom::builder::name("Wc-1"),
-      pos_map_type, CACHE, trace, OPENED);
+      pos_map_type, hp.cache, trace, OPENED);
 
-  ERRmap->contextual(VELmap, fx::match_gaussian, p.match_state, ERR_c0,
+  ERRmap->contextual(VELmap, fx::match_gaussian, p.match_ctx, ERR_c0,
                      saved_weight_at);
-  ERRmap->contextual(THRmap, fx::match_gaussian, p.match_state, ERR_c1,
+  ERRmap->contextual(THRmap, fx::match_gaussian, p.match_ctx, ERR_c1,
                      saved_weight_at);
-  VELmap->contextual(ERRmap, fx::match_gaussian, p.match_state, VEL_c0,
+  VELmap->contextual(ERRmap, fx::match_gaussian, p.match_ctx, VEL_c0,
                      saved_weight_at);
-  VELmap->contextual(THRmap, fx::match_gaussian, p.match_state, VEL_c1,
+  VELmap->contextual(THRmap, fx::match_gaussian, p.match_ctx, VEL_c1,
                      saved_weight_at);
-  THRmap->contextual(ERRmap, fx::match_gaussian, p.match_state, THR_c0,
+  THRmap->contextual(ERRmap, fx::match_gaussian, p.match_ctx, THR_c0,
                      saved_weight_at);
-  THRmap->contextual(VELmap, fx::match_gaussian, p.match_state, THR_c1,
+  THRmap->contextual(VELmap, fx::match_gaussian, p.match_ctx, THR_c1,
                      saved_weight_at);
 
   auto ERR = cxsom::builder::variable("img", cxsom::builder::name("error"),
-                                      "Scalar", CACHE, trace, OPENED);
+                                      "Scalar", hp.cache, trace, OPENED);
   auto VEL = cxsom::builder::variable("img", cxsom::builder::name("velocity"),
-                                      "Scalar", CACHE, trace, OPENED);
+                                      "Scalar", hp.cache, trace, OPENED);
   // On renomme "rgb" en "predicted-thrust"
   auto THR_OUT = cxsom::builder::variable(
-      "predict-out", cxsom::builder::name("predicted-thrust"), "Scalar", CACHE,
-      trace, OPENED);
+      "predict-out", cxsom::builder::name("predicted-thrust"), "Scalar",
+      hp.cache, trace, OPENED);
 
   ERR->definition();
   VEL->definition();
@@ -484,9 +609,10 @@ void make_predict_rules(unsigned int saved_weight_at, unsigned int data_size,
 
   auto INDEX =
       cxsom::builder::variable("predict-out", cxsom::builder::name("index"),
-                               "Pos1D", CACHE, trace, OPENED);
+                               "Pos1D", hp.cache, trace, OPENED);
   INDEX->definition();
-  INDEX->var() << fx::random() | kwd::use("walltime", data_size);
+  if (hp.random_order)
+    INDEX->var() << fx::random() | kwd::use("walltime", data_size);
 
   ERR->var() << fx::value_at(kwd::at(FILE_ERR->var(), 0), INDEX->var()) |
       kwd::use("walltime", FOREVER);
@@ -496,17 +622,17 @@ void make_predict_rules(unsigned int saved_weight_at, unsigned int data_size,
   // Poids Externes (We) = Type SCALAR
   auto ERR_e0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Error") / cxsom::builder::name("We-0"),
-      scalar_map_type, CACHE, trace, OPENED);
+      scalar_map_type, hp.cache, trace, OPENED);
   auto VEL_e0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Velocity") / cxsom::builder::name("We-0"),
-      scalar_map_type, CACHE, trace, OPENED);
+      scalar_map_type, hp.cache, trace, OPENED);
   auto THR_e0 = cxsom::builder::variable(
       "saved", cxsom::builder::name("Thrust") / cxsom::builder::name("We-0"),
-      scalar_map_type, CACHE, trace, OPENED);
+      scalar_map_type, hp.cache, trace, OPENED);
 
-  ERRmap->external(ERR, fx::match_gaussian, p.match_ctx, ERR_e0,
+  ERRmap->external(ERR, fx::match_gaussian, p.match_state, ERR_e0,
                    saved_weight_at);
-  VELmap->external(VEL, fx::match_gaussian, p.match_ctx, VEL_e0,
+  VELmap->external(VEL, fx::match_gaussian, p.match_state, VEL_e0,
                    saved_weight_at);
 
   ERR_e0->definition();
@@ -533,6 +659,105 @@ void make_predict_rules(unsigned int saved_weight_at, unsigned int data_size,
       kwd::use("walltime", FOREVER);
 }
 
+// ######################
+// #                    #
+// # Grid predict stage #
+// #                    #
+// ######################
+
+// The inputs are a regular Error x Velocity grid, written by
+// make-thrust-table.py in the grid-in timeline (one grid point per
+// timestep), so that each timestep predicts one entry of the thrust
+// lookup table.
+void make_grid_rules(unsigned int saved_weight_at, unsigned int grid_side,
+                     unsigned int map_size) {
+
+  Params p;
+  auto map_settings = make_map_settings(p, map_size);
+  auto archi = cxsom::builder::architecture();
+  archi->timelines = {"grid-wgt", "grid-rlx", "grid-out"};
+
+  std::string scalar_map_type =
+      std::string("Map1D<Scalar>=") + std::to_string(map_size);
+  std::string pos_map_type =
+      std::string("Map1D<Pos1D>=") + std::to_string(map_size);
+  unsigned int trace = grid_side * grid_side;
+
+  auto saved = [trace](const std::string &map_name,
+                       const std::string &weight_name,
+                       const std::string &type) {
+    return cxsom::builder::variable("saved",
+                                    cxsom::builder::name(map_name) /
+                                        cxsom::builder::name(weight_name),
+                                    type, hp.cache, trace, OPENED);
+  };
+
+  auto ERRmap = cxsom::builder::map::make_1D("Error");
+  auto VELmap = cxsom::builder::map::make_1D("Velocity");
+  auto THRmap = cxsom::builder::map::make_1D("Thrust");
+
+  auto ERR_c0 = saved("Error", "Wc-0", pos_map_type);
+  auto ERR_c1 = saved("Error", "Wc-1", pos_map_type);
+  auto VEL_c0 = saved("Velocity", "Wc-0", pos_map_type);
+  auto VEL_c1 = saved("Velocity", "Wc-1", pos_map_type);
+  auto THR_c0 = saved("Thrust", "Wc-0", pos_map_type);
+  auto THR_c1 = saved("Thrust", "Wc-1", pos_map_type);
+  auto ERR_e0 = saved("Error", "We-0", scalar_map_type);
+  auto VEL_e0 = saved("Velocity", "We-0", scalar_map_type);
+  auto THR_e0 = saved("Thrust", "We-0", scalar_map_type);
+
+  ERRmap->contextual(VELmap, fx::match_gaussian, p.match_ctx, ERR_c0,
+                     saved_weight_at);
+  ERRmap->contextual(THRmap, fx::match_gaussian, p.match_ctx, ERR_c1,
+                     saved_weight_at);
+  VELmap->contextual(ERRmap, fx::match_gaussian, p.match_ctx, VEL_c0,
+                     saved_weight_at);
+  VELmap->contextual(THRmap, fx::match_gaussian, p.match_ctx, VEL_c1,
+                     saved_weight_at);
+  THRmap->contextual(ERRmap, fx::match_gaussian, p.match_ctx, THR_c0,
+                     saved_weight_at);
+  THRmap->contextual(VELmap, fx::match_gaussian, p.match_ctx, THR_c1,
+                     saved_weight_at);
+
+  // Filled from python, no rule for them.
+  auto ERR = cxsom::builder::variable("grid-in", cxsom::builder::name("error"),
+                                      "Scalar", hp.cache, trace, OPENED);
+  auto VEL =
+      cxsom::builder::variable("grid-in", cxsom::builder::name("velocity"),
+                               "Scalar", hp.cache, trace, OPENED);
+  auto THR_OUT = cxsom::builder::variable(
+      "grid-out", cxsom::builder::name("predicted-thrust"), "Scalar",
+      hp.cache, trace, OPENED);
+
+  ERR->definition();
+  VEL->definition();
+  THR_OUT->definition();
+
+  ERRmap->external(ERR, fx::match_gaussian, p.match_state, ERR_e0,
+                   saved_weight_at);
+  VELmap->external(VEL, fx::match_gaussian, p.match_state, VEL_e0,
+                   saved_weight_at);
+
+  ERR_e0->definition();
+  VEL_e0->definition();
+  THR_e0->definition();
+  ERR_c0->definition();
+  ERR_c1->definition();
+  VEL_c0->definition();
+  VEL_c1->definition();
+  THR_c0->definition();
+  THR_c1->definition();
+
+  archi << ERRmap << VELmap << THRmap;
+  *archi = map_settings;
+
+  archi->realize();
+
+  THR_OUT->var() << fx::value_at(kwd::at(THR_e0->var(), saved_weight_at),
+                                 THRmap->output_BMU()->var()) |
+      kwd::use("walltime", FOREVER);
+}
+
 // ########
 // #      #
 // # Main #
@@ -554,7 +779,13 @@ int main(int argc, char *argv[]) {
     prefix << arg << ' ';
   prefix << "-- ";
 
-  if (c.user_argv.size() == 0) {
+  std::vector<std::string> args(c.user_argv.begin(), c.user_argv.end());
+  if (!parse_hyperparams(args)) {
+    c.notify_user_argv_error();
+    return 0;
+  }
+
+  if (args.size() == 0) {
     std::cout << "Usage:" << std::endl
               << "  " << prefix.str() << "calibration <grid-side>" << std::endl
               << "  " << prefix.str() << "walltime <max-time>" << std::endl
@@ -565,56 +796,109 @@ int main(int argc, char *argv[]) {
               << "check <saved-weight-at> <data-size> <map-size>" << std::endl
               << "  " << prefix.str()
               << "predict <saved-weight-at> <data-size> <map-size>"
-              << std::endl;
+              << std::endl
+              << "  " << prefix.str()
+              << "grid <saved-weight-at> <grid-side> <map-size>" << std::endl
+              << "  " << prefix.str()
+              << "resume <saved-at> <save-period> <data-size> <map-size> "
+                 "<walltime>"
+              << std::endl
+              << "Each mode accepts optional name=value arguments, with name in"
+              << std::endl
+              << "  sigma, sigma-ctx, sigma-state, sigma-thrust, alpha, Rext, "
+                 "Rctx, beta, delta, deadline"
+              << std::endl
+              << "and for the storage of the variables in"
+              << std::endl
+              << "  cache, trace, train-trace, save-trace" << std::endl
+              << "and order=random|rows for check and predict, "
+                 "feed=random|client for"
+              << std::endl
+              << "train." << std::endl;
     c.notify_user_argv_error();
     return 0;
   }
 
-  if (c.user_argv[0] == "calibration") {
-    if (c.user_argv.size() != 2) {
+  if (args[0] == "calibration") {
+    if (args.size() != 2) {
       c.notify_user_argv_error();
       return 0;
     }
-    grid_side = stoul(c.user_argv[1]);
+    grid_side = stoul(args[1]);
     mode = Mode::Calibration;
-  } else if (c.user_argv[0] == "walltime") {
-    if (c.user_argv.size() != 2) {
+  } else if (args[0] == "walltime") {
+    if (args.size() != 2) {
       c.notify_user_argv_error();
       return 0;
     }
-    walltime = stoul(c.user_argv[1]);
+    walltime = stoul(args[1]);
     mode = Mode::Walltime;
-  } else if (c.user_argv[0] == "input") {
-    if (c.user_argv.size() >= 2)
-      data_size = stoul(c.user_argv[1]);
+  } else if (args[0] == "input") {
+    if (args.size() >= 2)
+      data_size = stoul(args[1]);
     mode = Mode::Input;
-  } else if (c.user_argv[0] == "train") {
-    if (c.user_argv.size() != 4) {
+  } else if (args[0] == "train") {
+    if (args.size() != 4) {
       c.notify_user_argv_error();
       return 0;
     }
-    save_period = stoul(c.user_argv[1]);
-    data_size = stoul(c.user_argv[2]);
-    map_size = stoul(c.user_argv[3]);
+    save_period = stoul(args[1]);
+    data_size = stoul(args[2]);
+    map_size = stoul(args[3]);
     mode = Mode::Train;
-  } else if (c.user_argv[0] == "check") {
-    if (c.user_argv.size() != 4) {
+  } else if (args[0] == "check") {
+    if (args.size() != 4) {
       c.notify_user_argv_error();
       return 0;
     }
-    saved_weight_at = stoul(c.user_argv[1]);
-    data_size = stoul(c.user_argv[2]);
-    map_size = stoul(c.user_argv[3]);
+    saved_weight_at = stoul(args[1]);
+    data_size = stoul(args[2]);
+    map_size = stoul(args[3]);
     mode = Mode::Check;
-  } else if (c.user_argv[0] == "predict") {
-    if (c.user_argv.size() != 4) {
+  } else if (args[0] == "predict") {
+    if (args.size() != 4) {
       c.notify_user_argv_error();
       return 0;
     }
-    saved_weight_at = stoul(c.user_argv[1]);
-    data_size = stoul(c.user_argv[2]);
-    map_size = stoul(c.user_argv[3]);
+    saved_weight_at = stoul(args[1]);
+    data_size = stoul(args[2]);
+    map_size = stoul(args[3]);
     mode = Mode::Predict;
+  } else if (args[0] == "grid") {
+    if (args.size() != 4) {
+      c.notify_user_argv_error();
+      return 0;
+    }
+    saved_weight_at = stoul(args[1]);
+    grid_side = stoul(args[2]);
+    map_size = stoul(args[3]);
+    mode = Mode::Grid;
+  } else if (args[0] == "resume") {
+    if (args.size() != 6) {
+      c.notify_user_argv_error();
+      return 0;
+    }
+    saved_weight_at = stoul(args[1]);
+    save_period = stoul(args[2]);
+    data_size = stoul(args[3]);
+    map_size = stoul(args[4]);
+    walltime = stoul(args[5]);
+    if (saved_weight_at * save_period >= walltime) {
+      std::cout << "Nothing to resume, the walltime is already reached at "
+                << saved_weight_at << '.' << std::endl;
+      c.notify_user_argv_error();
+      return 0;
+    }
+    if (!hp.random_feed) {
+      // The walltime rules would define train-in/index, and the saved
+      // copies would stop at walltime, which does not suit online.py.
+      std::cout << "feed=client cannot be resumed, send the train rules "
+                   "again (the train-* timelines go on)."
+                << std::endl;
+      c.notify_user_argv_error();
+      return 0;
+    }
+    mode = Mode::Resume;
   } else {
     std::cout << "Bad user arguments." << std::endl;
     c.notify_user_argv_error();
@@ -640,6 +924,13 @@ int main(int argc, char *argv[]) {
   case Mode::Check:
     make_check_rules(saved_weight_at, data_size, map_size);
     break;
+  case Mode::Grid:
+    make_grid_rules(saved_weight_at, grid_side, map_size);
+    break;
+  case Mode::Resume:
+    make_train_rules(save_period, data_size, map_size, saved_weight_at,
+                     walltime);
+    break;
   default:
     break;
   }